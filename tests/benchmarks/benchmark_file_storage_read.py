@@ -0,0 +1,81 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Compares the drain throughput of the file storage with buffered and memory mapped segment readers.
+
+Usage: python tests/benchmarks/benchmark_file_storage_read.py [records count]
+"""
+
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import perf_counter
+
+from simplejson import dumps
+
+from thingsboard_gateway.storage.file.file_event_storage import FileEventStorage
+
+MAX_READ_RECORDS_COUNT = 1000
+MAX_RECORDS_PER_FILE = 50000
+
+
+def create_record(index):
+    return dumps({"deviceName": "Device %i" % (index % 20), "deviceType": "default", "attributes": [],
+                  "telemetry": [{"ts": 1680000000000 + index, "values": {"temperature": 21.5 + index % 10,
+                                                                          "humidity": 40 + index % 7}}]})
+
+
+def run(records, data_file_format, use_mmap):
+    data_folder_path = mkdtemp() + "/"
+    config = {"data_folder_path": data_folder_path,
+              "max_file_count": len(records) // MAX_RECORDS_PER_FILE + 2,
+              "max_records_per_file": MAX_RECORDS_PER_FILE,
+              "max_read_records_count": MAX_READ_RECORDS_COUNT,
+              "data_file_format": data_file_format,
+              "use_mmap": use_mmap}
+    try:
+        storage = FileEventStorage(config)
+        storage.put_batch(records)
+        storage.stop()
+
+        storage = FileEventStorage(config)
+        read_count = 0
+        started = perf_counter()
+        events = storage.get_event_pack()
+        while events:
+            read_count += len(events)
+            storage.event_pack_processing_done()
+            events = storage.get_event_pack()
+        elapsed = perf_counter() - started
+        storage.stop()
+        assert read_count == len(records), "Read %i records of %i" % (read_count, len(records))
+        return elapsed
+    finally:
+        rmtree(data_folder_path)
+
+
+def main():
+    records_count = int(argv[1]) if len(argv) > 1 else 200000
+    records = [create_record(index) for index in range(records_count)]
+    print("Records: %i" % records_count)
+    for data_file_format in ("binary", "text"):
+        for use_mmap in (False, True):
+            elapsed = run(records, data_file_format, use_mmap)
+            print("%-6s %-8s %10.0f records/s" % (data_file_format, "mmap" if use_mmap else "buffered",
+                                                  records_count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Compares the write throughput of the file storage with different fsync policies, with and without group commit.
+
+Usage: python tests/benchmarks/benchmark_file_storage_write.py [records count] [writer threads count]
+"""
+
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from threading import Thread
+from time import perf_counter
+
+from simplejson import dumps
+
+from thingsboard_gateway.storage.file.file_event_storage import FileEventStorage
+
+BATCH_SIZE = 10
+MODES = [
+    ("none", {"fsync_policy": "none"}),
+    ("interval_ms 100", {"fsync_policy": "interval_ms", "fsync_interval_ms": 100}),
+    ("every_n_records 1000", {"fsync_policy": "every_n_records", "max_records_between_fsync": 1000}),
+    ("every_n_records 1", {"fsync_policy": "every_n_records", "max_records_between_fsync": 1}),
+]
+
+
+def create_record(index):
+    return dumps({"deviceName": "Device %i" % (index % 20), "deviceType": "default", "attributes": [],
+                  "telemetry": [{"ts": 1680000000000 + index, "values": {"temperature": 21.5 + index % 10}}]})
+
+
+def run(records_count, threads_count, config):
+    data_folder_path = mkdtemp() + '/'
+    storage = FileEventStorage({"data_folder_path": data_folder_path, "max_file_count": 100000,
+                                "max_records_per_file": 10000, **config})
+    records = [create_record(index) for index in range(records_count // threads_count)]
+
+    def write():
+        for position in range(0, len(records), BATCH_SIZE):
+            storage.put_batch(records[position:position + BATCH_SIZE])
+
+    threads = [Thread(target=write) for _ in range(threads_count)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    storage.stop()
+    elapsed = perf_counter() - started
+    rmtree(data_folder_path)
+    return len(records) * threads_count / elapsed
+
+
+def main():
+    records_count = int(argv[1]) if len(argv) > 1 else 100000
+    threads_count = int(argv[2]) if len(argv) > 2 else 4
+    print("Records: %i, writer threads: %i, records per put: %i" % (records_count, threads_count, BATCH_SIZE))
+    for (name, config) in MODES:
+        for group_commit in (False, True):
+            records_per_second = run(records_count, threads_count, {**config, "group_commit": group_commit})
+            print("%-22s group commit %-5s %10.0f records/s" % (name, group_commit, records_per_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Compares how many packs the quiet devices wait during the catch-up after a chatty device filled the memory storage,
+with the "fifo" and the "fair" drain policies, and the CPU time of the draining.
+
+Usage: python tests/benchmarks/benchmark_memory_storage_fair_drain.py [chatty device events count] [quiet devices count]
+"""
+
+from sys import argv
+from time import process_time
+
+from simplejson import dumps
+
+from thingsboard_gateway.storage.memory.memory_event_storage import MemoryEventStorage
+
+READ_RECORDS_COUNT = 100
+
+
+def run(chatty_events_count, quiet_devices_count, drain_policy):
+    storage = MemoryEventStorage({"max_records_count": 0, "read_records_count": READ_RECORDS_COUNT,
+                                  "drain_policy": drain_policy})
+    storage.put_batch([dumps({"deviceName": "Chatty", "telemetry": [{"value": x}]})
+                       for x in range(chatty_events_count)])
+    storage.put_batch([dumps({"deviceName": "Quiet %i" % x, "telemetry": [{"value": x}]})
+                       for x in range(quiet_devices_count)])
+
+    started = process_time()
+    packs_count = 0
+    last_quiet_pack = 0
+    events = storage.get_event_pack()
+    while events:
+        packs_count += 1
+        if any('"Quiet ' in event for event in events):
+            last_quiet_pack = packs_count
+        storage.event_pack_processing_done()
+        events = storage.get_event_pack()
+    return process_time() - started, packs_count, last_quiet_pack
+
+
+def main():
+    chatty_events_count = int(argv[1]) if len(argv) > 1 else 200000
+    quiet_devices_count = int(argv[2]) if len(argv) > 2 else 1000
+    print("Chatty device events: %i, quiet devices: %i" % (chatty_events_count, quiet_devices_count))
+    for drain_policy in ("fifo", "fair"):
+        cpu_time, packs_count, last_quiet_pack = run(chatty_events_count, quiet_devices_count, drain_policy)
+        print("%-5s %8.2f ms CPU, %i packs, all quiet devices sent with pack %i" % (drain_policy, cpu_time * 1000,
+                                                                                 packs_count, last_quiet_pack))
+
+
+if __name__ == '__main__':
+    main()
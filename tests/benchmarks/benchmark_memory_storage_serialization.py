@@ -0,0 +1,105 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Compares CPU time spent on the way from converted data to the published payload for the memory storage
+with and without the "store_objects" option.
+
+Usage: python tests/benchmarks/benchmark_memory_storage_serialization.py [events count]
+"""
+
+from sys import argv
+from time import process_time
+
+from simplejson import dumps, loads
+
+from thingsboard_gateway.gateway.payload_packer import DeviceDataRecord, EventPackBuilder
+from thingsboard_gateway.storage.memory.memory_event_storage import MemoryEventStorage
+
+EVENTS_PER_REPORT = 10000
+MAX_PAYLOAD_SIZE = 8196
+READ_RECORDS_COUNT = 100
+
+
+def create_data(index):
+    return {
+        "deviceName": "Device %i" % (index % 20),
+        "deviceType": "default",
+        "attributes": [{"firmwareVersion": "1.0.%i" % index}, {"serialNumber": "SN-%08i" % index}],
+        "telemetry": [{"ts": 1680000000000 + index,
+                       "values": {"temperature": 21.5 + index % 10, "humidity": 40 + index % 7,
+                                  "pressure": 1013.25, "status": "OK", "active": True}}]
+    }
+
+
+def publish(devices_data):
+    # The client serializes every payload once at publish time
+    for (device, data) in devices_data.items():
+        if data["telemetry"]:
+            dumps({device: data["telemetry"]})
+        if data["attributes"]:
+            dumps({device: data["attributes"]})
+
+
+def add_json_event(builder, event):
+    current_event = loads(event)
+    device_name = current_event["deviceName"]
+    for item in current_event["telemetry"]:
+        builder.add_telemetry(device_name, item)
+    for item in current_event["attributes"]:
+        builder.add_attributes(device_name, item)
+
+
+def run(events_count, store_objects):
+    data_array = [create_data(index) for index in range(events_count)]
+    storage = MemoryEventStorage({"max_records_count": events_count,
+                                  "read_records_count": READ_RECORDS_COUNT,
+                                  "store_objects": store_objects})
+    builder = EventPackBuilder(MAX_PAYLOAD_SIZE, publish)
+
+    started = process_time()
+    if store_objects:
+        storage.put_batch([DeviceDataRecord(data) for data in data_array])
+    else:
+        storage.put_batch([dumps(data) for data in data_array])
+
+    events = storage.get_event_pack()
+    while events:
+        builder.clear()
+        for event in events:
+            if store_objects:
+                builder.add_record(event)
+            else:
+                add_json_event(builder, event)
+        builder.flush()
+        storage.event_pack_processing_done()
+        events = storage.get_event_pack()
+    return process_time() - started
+
+
+def main():
+    events_count = int(argv[1]) if len(argv) > 1 else 100000
+    json_time = run(events_count, False)
+    objects_time = run(events_count, True)
+    scale = 1000 * EVENTS_PER_REPORT / events_count
+    print("Events: %i" % events_count)
+    print("JSON events:   %8.2f ms CPU per %i events" % (json_time * scale, EVENTS_PER_REPORT))
+    print("Object events: %8.2f ms CPU per %i events" % (objects_time * scale, EVENTS_PER_REPORT))
+    print("Saved:         %8.2f ms CPU per %i events (%.1f%%)" % ((json_time - objects_time) * scale,
+                                                                  EVENTS_PER_REPORT,
+                                                                  100 * (json_time - objects_time) / json_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Measures the insert rate and the drain rate of the SQLite storage with the given number of queued rows.
+
+Usage: python tests/benchmarks/benchmark_sqlite_storage.py [rows count] [put batch size] [read records count]
+"""
+
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import perf_counter
+
+from simplejson import dumps
+
+from thingsboard_gateway.storage.sqlite.sqlite_event_storage import SQLiteEventStorage
+
+
+def create_record(index):
+    return dumps({"deviceName": "Device %i" % (index % 20), "deviceType": "default", "attributes": [],
+                  "telemetry": [{"ts": 1680000000000 + index, "values": {"temperature": 21.5 + index % 10,
+                                                                          "humidity": 40 + index % 7}}]})
+
+
+def main():
+    rows_count = int(argv[1]) if len(argv) > 1 else 1000000
+    put_batch_size = int(argv[2]) if len(argv) > 2 else 100
+    read_records_count = int(argv[3]) if len(argv) > 3 else 1000
+    records = [create_record(index) for index in range(rows_count)]
+    data_folder_path = mkdtemp() + "/"
+    config = {"data_file_path": data_folder_path + "data.db", "read_records_count": read_records_count}
+    try:
+        storage = SQLiteEventStorage(config)
+        started = perf_counter()
+        for index in range(0, rows_count, put_batch_size):
+            storage.put_batch(records[index:index + put_batch_size])
+        # Stop waits until the queued writes are committed
+        storage.stop()
+        insert_time = perf_counter() - started
+
+        storage = SQLiteEventStorage(config)
+        read_count = 0
+        started = perf_counter()
+        events = storage.get_event_pack()
+        while events:
+            read_count += len(events)
+            storage.event_pack_processing_done()
+            events = storage.get_event_pack()
+        storage.stop()
+        drain_time = perf_counter() - started
+        assert read_count == rows_count, "Read %i rows of %i" % (read_count, rows_count)
+    finally:
+        rmtree(data_folder_path)
+
+    print("Rows: %i, put batch size: %i, read records count: %i" % (rows_count, put_batch_size, read_records_count))
+    print("Insert: %10.0f rows/s" % (rows_count / insert_time))
+    print("Drain:  %10.0f rows/s" % (rows_count / drain_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+"""
+Compares CPU time spent on the bytes statistics of the converters: the former accounting with the string
+representation of the input and the output on every call against the metrics registry with the given size
+sampling period.
+
+Usage: python tests/benchmarks/benchmark_statistics_collection.py [calls count] [sampling period]
+"""
+
+from sys import argv
+from time import process_time
+
+from simplejson import dumps
+
+from thingsboard_gateway.gateway.statistics_service import StatisticsService
+
+CALLS_PER_REPORT = 10000
+DATA_STREAMS_STATISTICS = {'receivedBytesFromDevices': 0, 'convertedBytesFromDevice': 0}
+
+
+def create_payload(index):
+    return dumps({"serialNumber": "SN-%08i" % index, "model": "T1000", "temperature": 21.5 + index % 10,
+                  "humidity": 40 + index % 7, "pressure": 1013.25, "status": "OK"}).encode()
+
+
+def convert(data):
+    return {"deviceName": "Device", "deviceType": "default", "attributes": [{"model": "T1000"}],
+            "telemetry": [{"temperature": 21.5}, {"humidity": 40}, {"pressure": 1013.25}]}
+
+
+def collect_string_sizes(data):
+    DATA_STREAMS_STATISTICS['receivedBytesFromDevices'] += str(data).__sizeof__()
+    result = convert(data)
+    DATA_STREAMS_STATISTICS['convertedBytesFromDevice'] += str(result).__sizeof__()
+    return result
+
+
+@StatisticsService.CollectStatistics(start_stat_type='receivedBytesFromDevices',
+                                     end_stat_type='convertedBytesFromDevice')
+def collect_metrics(_, __, data):
+    return convert(data)
+
+
+def run(payloads, function):
+    started = process_time()
+    for payload in payloads:
+        function(payload)
+    return process_time() - started
+
+
+def main():
+    calls_count = int(argv[1]) if len(argv) > 1 else 200000
+    StatisticsService.METRICS.sampling_period = int(argv[2]) if len(argv) > 2 else 10
+    payloads = [create_payload(index) for index in range(calls_count)]
+    plain_time = run(payloads, convert)
+    string_time = run(payloads, collect_string_sizes) - plain_time
+    metrics_time = run(payloads, lambda payload: collect_metrics(None, None, payload)) - plain_time
+    scale = 1000 * CALLS_PER_REPORT / calls_count
+    print("Calls: %i, sampling period: %i" % (calls_count, StatisticsService.METRICS.sampling_period))
+    print("String sizes:     %8.2f ms CPU per %i calls" % (string_time * scale, CALLS_PER_REPORT))
+    print("Metrics registry: %8.2f ms CPU per %i calls" % (metrics_time * scale, CALLS_PER_REPORT))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Compares the data size, the write throughput and the drain throughput of the file and SQLite storages
+with and without block compression.
+
+Usage: python tests/benchmarks/benchmark_storage_compression.py [records count] [block size]
+"""
+
+from os import listdir
+from os.path import getsize
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import perf_counter
+
+from simplejson import dumps
+
+from thingsboard_gateway.storage.file.file_event_storage import FileEventStorage
+from thingsboard_gateway.storage.sqlite.sqlite_event_storage import SQLiteEventStorage
+
+BATCH_SIZE = 100
+COMPRESSIONS = ["none", "zlib", "lzma"]
+
+
+def create_record(index):
+    return dumps({"deviceName": "Device %i" % (index % 20), "deviceType": "default", "attributes": [],
+                  "telemetry": [{"ts": 1680000000000 + index * 100,
+                                 "values": {"temperature": round(21.5 + index % 100 / 10, 1),
+                                            "humidity": 40 + index % 7, "status": "OK"}}]})
+
+
+def get_folder_size(folder):
+    return sum(getsize(folder + file) for file in listdir(folder))
+
+
+def run(storage_class, config, records):
+    started = perf_counter()
+    storage = storage_class(config)
+    for index in range(0, len(records), BATCH_SIZE):
+        storage.put_batch(records[index:index + BATCH_SIZE])
+    storage.stop()
+    write_time = perf_counter() - started
+    data_size = get_folder_size(config["data_folder_path"])
+
+    storage = storage_class(config)
+    read_count = 0
+    started = perf_counter()
+    events = storage.get_event_pack()
+    while events:
+        read_count += len(events)
+        storage.event_pack_processing_done()
+        events = storage.get_event_pack()
+    drain_time = perf_counter() - started
+    storage.stop()
+    assert read_count == len(records), "Read %i records of %i" % (read_count, len(records))
+    return data_size, write_time, drain_time
+
+
+def main():
+    records_count = int(argv[1]) if len(argv) > 1 else 200000
+    block_size = int(argv[2]) if len(argv) > 2 else 65536
+    records = [create_record(index) for index in range(records_count)]
+    raw_size = sum(len(record) for record in records)
+    print("Records: %i, raw size: %i bytes, block size: %i" % (records_count, raw_size, block_size))
+    print("%-7s %-5s %12s %7s %14s %14s" % ("storage", "codec", "size", "ratio", "write rec/s", "drain rec/s"))
+    for (name, storage_class) in (("file", FileEventStorage), ("sqlite", SQLiteEventStorage)):
+        for compression in COMPRESSIONS:
+            data_folder_path = mkdtemp() + "/"
+            config = {"data_folder_path": data_folder_path,
+                      "data_file_path": data_folder_path + "data.db",
+                      "max_file_count": records_count // 10000 + 2,
+                      "max_records_per_file": 10000,
+                      "max_read_records_count": 1000,
+                      "read_records_count": 1000,
+                      "compression": compression,
+                      "compression_block_size": block_size,
+                      "compression_block_max_delay_ms": 0}
+            try:
+                data_size, write_time, drain_time = run(storage_class, config, records)
+            finally:
+                rmtree(data_folder_path)
+            print("%-7s %-5s %12i %7.2f %14.0f %14.0f" % (name, compression, data_size, raw_size / data_size,
+                                                          records_count / write_time, records_count / drain_time))
+
+
+if __name__ == '__main__':
+    main()
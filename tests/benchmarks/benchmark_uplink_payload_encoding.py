@@ -0,0 +1,102 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Compares bytes on the wire and CPU time of the JSON and protobuf uplink payloads for the gateway API.
+JSON mode publishes a message per device, protobuf mode publishes one message for the whole pack.
+Bytes on the wire include the QoS 1 PUBLISH packet headers and PUBACK packets.
+
+Usage: python tests/benchmarks/benchmark_uplink_payload_encoding.py [packs count]
+"""
+
+from sys import argv
+from time import process_time
+
+from simplejson import dumps
+
+from thingsboard_gateway.gateway.protobuf_payload import GATEWAY_ATTRIBUTES_TOPIC, GATEWAY_TELEMETRY_TOPIC, \
+    encode_gateway_attributes, encode_gateway_telemetry
+
+DEVICES_IN_PACK = 10
+TELEMETRY_ITEMS_PER_DEVICE = 5
+
+
+def wire_size(topic, payload):
+    # Variable header (topic and packet identifier) and payload
+    remaining_length = 2 + len(topic) + 2 + len(payload)
+    remaining_length_size = 1
+    while remaining_length >= 128 ** remaining_length_size:
+        remaining_length_size += 1
+    puback_size = 4
+    return 1 + remaining_length_size + remaining_length + puback_size
+
+
+def create_pack(index):
+    devices_data = {}
+    for device_index in range(DEVICES_IN_PACK):
+        devices_data["Device %i" % device_index] = {
+            "telemetry": [{"ts": 1680000000000 + index * 1000 + item,
+                           "values": {"temperature": 21.5 + item, "humidity": 40 + item, "pressure": 1013.25,
+                                      "status": "OK", "active": True}}
+                          for item in range(TELEMETRY_ITEMS_PER_DEVICE)],
+            "attributes": {"firmwareVersion": "1.0.%i" % index, "serialNumber": "SN-%08i" % device_index}
+        }
+    return devices_data
+
+
+def encode_json(devices_data):
+    payloads = []
+    for (device, data) in devices_data.items():
+        payloads.append((GATEWAY_TELEMETRY_TOPIC, dumps({device: data["telemetry"]})))
+        payloads.append((GATEWAY_ATTRIBUTES_TOPIC, dumps({device: data["attributes"]})))
+    return payloads
+
+
+def encode_protobuf(devices_data):
+    telemetry_payload = encode_gateway_telemetry({device: data["telemetry"] for (device, data) in devices_data.items()})
+    attributes_payload = encode_gateway_attributes({device: data["attributes"]
+                                                    for (device, data) in devices_data.items()})
+    return [(GATEWAY_TELEMETRY_TOPIC, telemetry_payload), (GATEWAY_ATTRIBUTES_TOPIC, attributes_payload)]
+
+
+def run(packs, encode):
+    started = process_time()
+    encoded_packs = [encode(pack) for pack in packs]
+    cpu_time = process_time() - started
+    payload_size = 0
+    total_wire_size = 0
+    for payloads in encoded_packs:
+        for (topic, payload) in payloads:
+            payload_size += len(payload)
+            total_wire_size += wire_size(topic, payload)
+    return payload_size, total_wire_size, cpu_time
+
+
+def main():
+    packs_count = int(argv[1]) if len(argv) > 1 else 2000
+    packs = [create_pack(index) for index in range(packs_count)]
+    json_size, json_wire_size, json_time = run(packs, encode_json)
+    protobuf_size, protobuf_wire_size, protobuf_time = run(packs, encode_protobuf)
+    print("Packs: %i, devices per pack: %i, telemetry items per device: %i" % (packs_count, DEVICES_IN_PACK,
+                                                                             TELEMETRY_ITEMS_PER_DEVICE))
+    print("JSON:     %10i payload bytes, %10i bytes on the wire, %8.2f ms CPU" % (json_size, json_wire_size,
+                                                                                  json_time * 1000))
+    print("Protobuf: %10i payload bytes, %10i bytes on the wire, %8.2f ms CPU" % (protobuf_size, protobuf_wire_size,
+                                                                                  protobuf_time * 1000))
+    print("Protobuf: %.1f%% of JSON payload bytes, %.1f%% of JSON bytes on the wire, %.1f%% of JSON CPU time" % (
+        100 * protobuf_size / json_size, 100 * protobuf_wire_size / json_wire_size, 100 * protobuf_time / json_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from threading import Thread
+from time import sleep, time
+from unittest.mock import Mock
+
+from thingsboard_gateway.gateway.backpressure import BackpressureController, PollSlowDown
+from thingsboard_gateway.gateway.constant_enums import Status
+
+
+class TestBackpressureController(unittest.TestCase):
+    def setUp(self):
+        self.queue_depth = 0
+        self.storage_full = False
+
+    def _create_controller(self, **config):
+        return BackpressureController({"enable": True, "highWatermark": 10, "lowWatermark": 5, **config},
+                                      lambda: self.queue_depth, lambda: self.storage_full)
+
+    def test_throttled_between_watermarks(self):
+        controller = self._create_controller()
+        self.queue_depth = 9
+        self.assertEqual(controller.acquire(), Status.SUCCESS)
+
+        self.queue_depth = 10
+        self.assertEqual(controller.acquire(), Status.BACKPRESSURE)
+        self.queue_depth = 6
+        self.assertEqual(controller.acquire(), Status.BACKPRESSURE)
+        self.assertTrue(controller.is_throttled())
+
+        self.queue_depth = 5
+        self.assertEqual(controller.acquire(), Status.SUCCESS)
+        self.assertFalse(controller.is_throttled())
+        self.assertEqual(controller.rejected_count, 2)
+        self.assertEqual(controller.throttle_count, 1)
+
+    def test_throttled_while_storage_is_full(self):
+        controller = self._create_controller()
+        self.storage_full = True
+        self.assertEqual(controller.acquire(), Status.BACKPRESSURE)
+
+        self.storage_full = False
+        self.assertEqual(controller.acquire(), Status.SUCCESS)
+
+    def test_disabled(self):
+        controller = self._create_controller(enable=False)
+        self.queue_depth = 100
+        self.storage_full = True
+        self.assertEqual(controller.acquire(), Status.SUCCESS)
+
+    def test_blocked_put_is_released(self):
+        controller = self._create_controller(blockTimeoutMs=5000)
+        self.queue_depth = 10
+        controller.update()
+
+        def drain():
+            sleep(.1)
+            self.queue_depth = 0
+            controller.update()
+
+        Thread(target=drain, daemon=True).start()
+        started = time()
+        self.assertEqual(controller.acquire(), Status.SUCCESS)
+        self.assertLess(time() - started, 5)
+
+    def test_blocked_put_is_rejected_after_timeout(self):
+        controller = self._create_controller(blockTimeoutMs=50)
+        self.queue_depth = 10
+        self.assertEqual(controller.acquire(), Status.BACKPRESSURE)
+
+
+class TestPollSlowDown(unittest.TestCase):
+    def test_poll_period_is_stretched_while_throttled(self):
+        gateway = Mock()
+        gateway.get_poll_period_multiplier.return_value = 4
+        poll_slow_down = PollSlowDown(gateway)
+
+        poll_slow_down.on_send_status(Status.BACKPRESSURE)
+        self.assertEqual(poll_slow_down.scale(1000), 4000)
+
+        poll_slow_down.on_send_status(Status.SUCCESS)
+        self.assertEqual(poll_slow_down.scale(1000), 1000)
+
+    def test_rejected_data_is_sent_later(self):
+        gateway = Mock()
+        gateway.get_poll_period_multiplier.return_value = 2
+        poll_slow_down = PollSlowDown(gateway, retry_period=.05)
+        statuses = [Status.BACKPRESSURE, Status.BACKPRESSURE, Status.SUCCESS, Status.SUCCESS, Status.SUCCESS]
+        sent = []
+
+        def send(data):
+            status = statuses.pop(0)
+            if status == Status.SUCCESS:
+                sent.append(data)
+            return status
+
+        self.assertEqual(poll_slow_down.send(send, "first"), Status.BACKPRESSURE)
+        # Newer data waits for the rejected one
+        self.assertEqual(poll_slow_down.send(send, "second"), Status.BACKPRESSURE)
+        self.assertFalse(poll_slow_down.retry_held_data(send))
+        sleep(.11)
+        self.assertFalse(poll_slow_down.retry_held_data(send))
+        self.assertListEqual(sent, [])
+        sleep(.11)
+        self.assertTrue(poll_slow_down.retry_held_data(send))
+        self.assertListEqual(sent, ["first", "second"])
+        self.assertEqual(poll_slow_down.send(send, "third"), Status.SUCCESS)
+
+
+if __name__ == '__main__':
+    unittest.main()
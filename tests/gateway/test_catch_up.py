@@ -0,0 +1,125 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from time import sleep
+
+from thingsboard_gateway.gateway.catch_up import CatchUpController, LastValueCache
+
+
+class TestLastValueCache(unittest.TestCase):
+    def test_latest_values_of_changed_devices(self):
+        cache = LastValueCache()
+        cache.update({"deviceName": "Device 1", "attributes": [{"firmware": "1.0"}],
+                      "telemetry": [{"ts": 1000, "values": {"temperature": 20, "humidity": 40}}]})
+        cache.track_changes = True
+        cache.update({"deviceName": "Device 1", "attributes": [{"firmware": "1.1"}],
+                      "telemetry": [{"ts": 2000, "values": {"temperature": 21}},
+                                    {"ts": 1500, "values": {"temperature": 19}}]})
+        cache.update({"deviceName": "Device 2", "attributes": [], "telemetry": {"ts": 3000, "values": {"power": 5}}})
+
+        self.assertDictEqual(cache.pop_changed(), {
+            "Device 1": {"attributes": {"firmware": "1.1"},
+                         "telemetry": [{"ts": 2000, "values": {"temperature": 21}},
+                                       {"ts": 1000, "values": {"humidity": 40}}]},
+            "Device 2": {"attributes": {}, "telemetry": [{"ts": 3000, "values": {"power": 5}}]}
+        })
+        self.assertDictEqual(cache.pop_changed(), {})
+
+    def test_least_recently_updated_devices_are_forgotten(self):
+        cache = LastValueCache(max_devices=2)
+        cache.track_changes = True
+        for device_name in ("Device 1", "Device 2", "Device 1", "Device 3"):
+            cache.update({"deviceName": device_name, "attributes": [{"active": True}], "telemetry": []})
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(set(cache.pop_changed()), {"Device 1", "Device 3"})
+
+
+class TestCatchUpController(unittest.TestCase):
+    def setUp(self):
+        self.backlog = 0
+
+    def _create_controller(self, **config):
+        return CatchUpController({"enable": True, "liveUpdatePeriodMs": 50, **config}, lambda: self.backlog)
+
+    def test_latest_values_are_sent_first_after_reconnect(self):
+        controller = self._create_controller()
+        controller.update({"deviceName": "Device", "attributes": [], "telemetry": [{"ts": 1, "values": {"a": 1}}]})
+        controller.set_connected(False)
+        controller.update({"deviceName": "Device", "attributes": [], "telemetry": [{"ts": 2, "values": {"a": 2}}]})
+        self.backlog = 100
+        controller.set_connected(True)
+
+        self.assertTrue(controller.is_active())
+        self.assertDictEqual(controller.get_live_values(),
+                             {"Device": {"attributes": {}, "telemetry": [{"ts": 2, "values": {"a": 2}}]}})
+        # Next live update is sent after the period
+        controller.update({"deviceName": "Device", "attributes": [], "telemetry": [{"ts": 3, "values": {"a": 3}}]})
+        self.assertIsNone(controller.get_live_values())
+        sleep(.06)
+        self.assertDictEqual(controller.get_live_values(),
+                             {"Device": {"attributes": {}, "telemetry": [{"ts": 3, "values": {"a": 3}}]}})
+
+        self.backlog = 0
+        sleep(.06)
+        controller.get_live_values()
+        self.assertFalse(controller.is_active())
+        self.assertEqual(controller.catch_up_count, 1)
+
+    def test_attributes_are_refreshed_after_backfill(self):
+        controller = self._create_controller()
+        controller.set_connected(False)
+        controller.update({"deviceName": "Device", "attributes": [{"firmware": "1.1"}], "telemetry": []})
+        self.backlog = 100
+        controller.set_connected(True)
+        self.assertDictEqual(controller.get_live_values(), {"Device": {"attributes": {"firmware": "1.1"},
+                                                                       "telemetry": []}})
+
+        # The attributes are sent again by the next live update after the catch-up ends
+        self.backlog = 0
+        sleep(.06)
+        self.assertDictEqual(controller.get_live_values(), {})
+        self.assertFalse(controller.is_active())
+        sleep(.06)
+        self.assertDictEqual(controller.get_live_values(), {"Device": {"attributes": {"firmware": "1.1"},
+                                                                       "telemetry": []}})
+        sleep(.06)
+        self.assertIsNone(controller.get_live_values())
+
+    def test_no_catch_up_without_backlog(self):
+        controller = self._create_controller()
+        controller.set_connected(False)
+        controller.update({"deviceName": "Device", "attributes": [{"a": 1}], "telemetry": []})
+        controller.set_connected(True)
+
+        self.assertFalse(controller.is_active())
+        self.assertIsNone(controller.get_live_values())
+
+    def test_backfill_is_paced(self):
+        controller = self._create_controller(backfillEventsPerSecond=100)
+        self.backlog = 100
+        controller.set_connected(False)
+        controller.set_connected(True)
+
+        self.assertTrue(controller.is_backfill_allowed())
+        controller.on_backfill(5)
+        self.assertFalse(controller.is_backfill_allowed())
+        sleep(.06)
+        self.assertTrue(controller.is_backfill_allowed())
+        self.assertEqual(controller.backfilled_count, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
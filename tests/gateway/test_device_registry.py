@@ -0,0 +1,129 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from simplejson import dump
+
+from thingsboard_gateway.gateway import device_registry
+from thingsboard_gateway.gateway.device_registry import DeviceRegistry
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.journal_file_path = path.join(self.directory.name, 'connected_devices.journal')
+        self.legacy_file_path = path.join(self.directory.name, 'connected_devices.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _create_registry(self):
+        registry = DeviceRegistry(self.journal_file_path, self.legacy_file_path)
+        registry.load()
+        return registry
+
+    def _journal_lines_count(self):
+        with open(self.journal_file_path) as journal_file:
+            return len(journal_file.readlines())
+
+    def test_changes_are_restored(self):
+        registry = self._create_registry()
+        registry.put('Device 1', 'MQTT', 'default')
+        registry.put('Device 2', 'MQTT', 'thermometer')
+        registry.put('Device 3', 'Modbus', 'default')
+        registry.rename('Device 2', 'Kitchen thermometer')
+        registry.delete('Device 3')
+        registry.close()
+
+        restored_registry = self._create_registry()
+        self.assertEqual(restored_registry.get('Device 1'), ['MQTT', 'default'])
+        self.assertEqual(restored_registry.get('Device 2'), ['MQTT', 'thermometer', 'Kitchen thermometer'])
+        self.assertNotIn('Device 3', restored_registry)
+        restored_registry.close()
+
+    def test_devices_are_indexed_by_connector(self):
+        registry = self._create_registry()
+        registry.put('Device 1', 'MQTT', 'default')
+        registry.put('Device 2', 'Modbus', 'meter')
+        registry.put('Device 1', 'Modbus', 'default')
+
+        self.assertEqual(registry.get_devices('MQTT'), {})
+        self.assertEqual(registry.get_devices('Modbus'), {'Device 1': 'default', 'Device 2': 'meter'})
+        registry.close()
+
+    def test_devices_of_removed_connectors_are_deleted(self):
+        registry = self._create_registry()
+        registry.put('Device 1', 'MQTT', 'default')
+        registry.put('Device 2', 'Modbus', 'meter')
+        registry.put('Device 3', 'OPC-UA', 'default')
+
+        self.assertEqual(registry.retain_connectors({'MQTT': None}), 2)
+        registry.close()
+        restored_registry = self._create_registry()
+        self.assertEqual(len(restored_registry), 1)
+        self.assertEqual(restored_registry.get_devices('Modbus'), {})
+        restored_registry.close()
+
+    def test_unchanged_device_is_not_appended(self):
+        registry = self._create_registry()
+        self.assertTrue(registry.put('Device', 'MQTT', 'default'))
+        self.assertFalse(registry.put('Device', 'MQTT', 'default'))
+        registry.close()
+
+        self.assertEqual(self._journal_lines_count(), 1)
+
+    def test_only_changed_devices_of_batch_are_appended(self):
+        registry = self._create_registry()
+        registry.put('Device 1', 'MQTT', 'default')
+
+        self.assertEqual(registry.put_batch([('Device 1', 'MQTT', 'default', None),
+                                             ('Device 2', 'MQTT', 'default', None)]), 1)
+        registry.close()
+        self.assertEqual(self._journal_lines_count(), 2)
+
+    def test_journal_is_compacted(self):
+        registry = self._create_registry()
+        records_count = device_registry.MIN_RECORDS_COUNT_TO_COMPACT + 10
+        for i in range(records_count):
+            registry.put('Device', 'MQTT', 'type %i' % i)
+        registry.close()
+
+        self.assertLess(self._journal_lines_count(), records_count)
+        self.assertEqual(self._create_registry().get('Device'), ['MQTT', 'type %i' % (records_count - 1)])
+
+    def test_incomplete_record_is_skipped(self):
+        registry = self._create_registry()
+        registry.put('Device', 'MQTT', 'default')
+        registry.close()
+        with open(self.journal_file_path, 'a') as journal_file:
+            journal_file.write('{"device": "Broken dev')
+
+        self.assertEqual(len(self._create_registry()), 1)
+
+    def test_legacy_file_is_migrated(self):
+        with open(self.legacy_file_path, 'w') as legacy_file:
+            dump({'Device 1': ['MQTT', 'default'], 'Device 2': ['Modbus', 'meter', 'Renamed meter']}, legacy_file)
+
+        registry = self._create_registry()
+        self.assertEqual(registry.get_devices('Modbus'), {'Device 2': 'meter'})
+        self.assertEqual(registry.get('Device 2'), ['Modbus', 'meter', 'Renamed meter'])
+        self.assertFalse(path.exists(self.legacy_file_path))
+        self.assertEqual(self._journal_lines_count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
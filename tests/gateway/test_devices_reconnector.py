@@ -0,0 +1,87 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from threading import Event
+from time import monotonic, sleep
+
+from thingsboard_gateway.gateway.devices_reconnector import DevicesReconnector
+from thingsboard_gateway.gateway.token_bucket import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_is_limited_by_capacity(self):
+        bucket = TokenBucket(10, 5)
+        self.assertTrue(all(bucket.consume() for _ in range(5)))
+        self.assertFalse(bucket.consume())
+        self.assertGreater(bucket.get_wait_time(), 0)
+
+    def test_tokens_are_refilled(self):
+        bucket = TokenBucket(100, 1)
+        self.assertTrue(bucket.consume())
+        sleep(.02)
+        self.assertTrue(bucket.consume())
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        self.assertTrue(all(bucket.consume() for _ in range(1000)))
+        self.assertEqual(bucket.get_wait_time(), 0)
+
+
+class TestDevicesReconnector(unittest.TestCase):
+    def setUp(self):
+        self.connected = []
+        self.batches = []
+        self.finished = Event()
+
+    def _connect(self, device_name, connector, device_type):
+        self.connected.append(device_name)
+        return True
+
+    def _batch_done(self, devices):
+        self.batches.append([device[0] for device in devices])
+        if len(self.connected) == self.devices_count:
+            self.finished.set()
+
+    def _reconnect(self, config, devices_count, is_telemetry_pending=None):
+        self.devices_count = devices_count
+        reconnector = DevicesReconnector(config, self._connect, self._batch_done, is_telemetry_pending)
+        started = monotonic()
+        reconnector.reconnect([("Device %i" % i, None, "default") for i in range(devices_count)])
+        self.assertTrue(self.finished.wait(5))
+        reconnector.stop()
+        return monotonic() - started
+
+    def test_devices_are_connected_by_batches(self):
+        self._reconnect({"connectsPerSecond": 0, "batchSize": 4}, 10)
+
+        self.assertEqual(self.connected, ["Device %i" % i for i in range(10)])
+        self.assertEqual([len(batch) for batch in self.batches], [4, 4, 2])
+
+    def test_connects_are_paced(self):
+        elapsed = self._reconnect({"connectsPerSecond": 100, "burst": 10, "batchSize": 100}, 30)
+
+        # 10 devices are connected at once, others wait for the tokens
+        self.assertGreaterEqual(elapsed, .15)
+
+    def test_batches_wait_for_telemetry(self):
+        telemetry_pending_until = monotonic() + .2
+        elapsed = self._reconnect({"connectsPerSecond": 0, "maxTelemetryWaitMs": 5000}, 5,
+                                  lambda: monotonic() < telemetry_pending_until)
+
+        self.assertGreaterEqual(elapsed, .15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import unittest
+
+from thingsboard_gateway.gateway.latency_tracer import LatencyTracer, TRACE_CONVERTED, TRACE_PUBLISHED, \
+    TRACE_RECEIVED, TRACE_SENT_TO_STORAGE, TRACE_STORAGE_PUT, TRACE_STORAGE_READ, stamp
+from thingsboard_gateway.gateway.metrics import MetricsRegistry
+from thingsboard_gateway.gateway.statistics_service import StatisticsService
+
+
+class TestLatencyTracer(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def tearDown(self):
+        LatencyTracer.trace_conversions = False
+
+    def test_disabled_tracer_does_not_trace(self):
+        tracer = LatencyTracer({}, self.registry)
+
+        self.assertIsNone(tracer.start("MQTT"))
+        self.assertFalse(LatencyTracer.trace_conversions)
+
+    def test_every_nth_message_is_traced(self):
+        tracer = LatencyTracer({"enable": True, "samplingPeriod": 3}, self.registry)
+
+        traces = [tracer.start("MQTT") for _ in range(7)]
+        self.assertEqual([trace is not None for trace in traces], [True, False, False, True, False, False, True])
+
+    def test_conversion_is_stamped_by_converter(self):
+        class Converter:
+            @StatisticsService.CollectStatistics(start_stat_type='receivedBytesFromDevices',
+                                                 end_stat_type='convertedBytesFromDevice')
+            def convert(self, config, data):
+                return {"deviceName": "Device", "telemetry": [{"value": data}]}
+
+        tracer = LatencyTracer({"enable": True, "samplingPeriod": 1}, self.registry)
+        Converter().convert({}, "1")
+        trace = tracer.start("MQTT")
+
+        self.assertLessEqual(trace[TRACE_RECEIVED], trace[TRACE_CONVERTED])
+        self.assertLessEqual(trace[TRACE_CONVERTED], trace[TRACE_SENT_TO_STORAGE])
+        # The stamps are used only once
+        next_trace = tracer.start("MQTT")
+        self.assertEqual(next_trace[TRACE_RECEIVED], next_trace[TRACE_SENT_TO_STORAGE])
+
+    def test_stage_histograms(self):
+        tracer = LatencyTracer({"enable": True, "samplingPeriod": 1, "maxTraces": 2}, self.registry)
+        for _ in range(3):
+            trace = tracer.start("MQTT Broker")
+            received_at = trace[TRACE_RECEIVED]
+            stamp(trace, TRACE_CONVERTED, received_at)
+            stamp(trace, TRACE_SENT_TO_STORAGE, received_at)
+            stamp(trace, TRACE_STORAGE_PUT, received_at + .01)
+            stamp(trace, TRACE_STORAGE_READ, received_at + .5)
+            stamp(trace, TRACE_PUBLISHED, received_at + .5)
+            tracer.complete(trace, received_at + .6)
+
+        state = tracer.get_state()
+        stages = state["connectors"]["MQTT Broker"]
+        self.assertEqual(stages["storage"]["count"], 3)
+        self.assertTrue(200 < stages["storage"]["p50"] <= 500)
+        self.assertTrue(50 < stages["ack"]["p99"] <= 100)
+        self.assertTrue(500 < stages["total"]["p95"] <= 1000)
+        self.assertEqual(len(state["lastTraces"]), 2)
+        self.assertEqual(state["lastTraces"][-1]["stagesMs"]["storage"], 490)
+
+        statistics = self.registry.collect()
+        self.assertEqual(statistics["latencyMQTTBrokerStorageCount"], 3)
+        self.assertIn("latencyMQTTBrokerTotalP99", statistics)
+
+
+if __name__ == '__main__':
+    unittest.main()
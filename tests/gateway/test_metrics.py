@@ -0,0 +1,114 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import unittest
+from threading import Thread
+
+from thingsboard_gateway.gateway.metrics import DEFAULT_SIZE_SAMPLING_PERIOD, Counter, Histogram, MetricsRegistry
+from thingsboard_gateway.gateway.statistics_service import StatisticsService
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter_sums_threads(self):
+        counter = Counter('events')
+
+        def increment():
+            for _ in range(10000):
+                counter.inc()
+
+        threads = [Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(counter.get_value(), 80000)
+        counter.reset()
+        self.assertEqual(counter.get_value(), 0)
+        counter.inc(5)
+        self.assertEqual(counter.get_value(), 5)
+
+    def test_histogram_buckets_and_quantiles(self):
+        histogram = Histogram('latency', buckets=(10, 20, 50))
+        for value in (5, 10, 15, 40, 100):
+            histogram.observe(value)
+
+        (counts, count, values_sum) = histogram.get_snapshot()
+        self.assertEqual(counts, [2, 1, 1, 1])
+        self.assertEqual(count, 5)
+        self.assertEqual(values_sum, 170)
+        self.assertEqual(histogram.get_quantile(.2), 5)
+        self.assertEqual(histogram.get_quantile(.5), 15)
+        self.assertEqual(histogram.get_quantile(.99), 50)
+
+        statistics = histogram.collect()
+        self.assertEqual(statistics['latencyCount'], 5)
+        self.assertEqual(statistics['latencyAvg'], 34)
+        self.assertEqual(statistics['latencyP50'], 15)
+        histogram.reset()
+        self.assertEqual(histogram.collect()['latencyCount'], 0)
+
+    def test_registry_collect(self):
+        registry = MetricsRegistry()
+        registry.counter('sent').inc(3)
+        registry.gauge('queueDepth').set(7)
+        registry.gauge('connected', lambda: True)
+        registry.histogram('packSize', buckets=(1, 10)).observe(4)
+
+        self.assertIs(registry.counter('sent'), registry.get('sent'))
+        statistics = registry.collect()
+        self.assertEqual(statistics['sent'], 3)
+        self.assertEqual(statistics['queueDepth'], 7)
+        self.assertTrue(statistics['connected'])
+        self.assertEqual(statistics['packSizeCount'], 1)
+
+        registry.reset(['sent'])
+        self.assertEqual(registry.collect()['sent'], 0)
+        self.assertEqual(registry.collect()['packSizeCount'], 1)
+
+    def test_sampled_size_estimation(self):
+        registry = MetricsRegistry(sampling_period=4)
+        data = {"temperature": 22.5}
+
+        self.assertEqual(registry.estimate_size(b'\x00' * 12), 12)
+        self.assertEqual(registry.estimate_size('payload'), 7)
+        self.assertEqual(registry.estimate_size(None), 0)
+        sizes = [registry.estimate_size(data) for _ in range(8)]
+        self.assertEqual(sum(sizes), 2 * len(str(data)) * 4)
+        self.assertEqual(len([size for size in sizes if size]), 2)
+
+    def test_objects_sizes_are_sampled_by_default(self):
+        registry = MetricsRegistry()
+        sizes = [registry.estimate_size({"value": 1}) for _ in range(2 * DEFAULT_SIZE_SAMPLING_PERIOD)]
+        self.assertEqual(len([size for size in sizes if size]), 2)
+
+    def test_statistics_decorator_counts_lengths(self):
+        class Converter:
+            @StatisticsService.CollectStatistics(start_stat_type='receivedBytesFromDevices',
+                                                 end_stat_type='convertedBytesFromDevice')
+            def convert(self, config, data):
+                return {"deviceName": "Device", "telemetry": [{"value": data.decode()}]}
+
+        StatisticsService.METRICS.sampling_period = 1
+        StatisticsService.clear_streams_statistics()
+        result = Converter().convert({}, b'12345')
+
+        statistics = StatisticsService.get_streams_statistics()
+        self.assertEqual(statistics['receivedBytesFromDevices'], 5)
+        self.assertEqual(statistics['convertedBytesFromDevice'], len(str(result)))
+        StatisticsService.clear_streams_statistics()
+        self.assertEqual(StatisticsService.get_streams_statistics()['receivedBytesFromDevices'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+
+from simplejson import dumps
+
+from thingsboard_gateway.gateway.metrics import Counter
+from thingsboard_gateway.gateway.payload_packer import DeviceDataRecord, DeviceDataSplitter, EventPackBuilder, \
+    json_size
+
+
+class TestDeviceDataSplitter(unittest.TestCase):
+    MAX_PAYLOAD_SIZE = 300
+
+    @staticmethod
+    def _create_data(attributes_count, telemetry_count, ts_count=2):
+        return {
+            "deviceName": "Test device",
+            "deviceType": "default",
+            "attributes": [{"attribute%d" % i: "value%d" % i} for i in range(attributes_count)],
+            "telemetry": [{"ts": 1000 + ts, "values": {"key%d" % i: i * 1.5 for i in range(telemetry_count)}}
+                          for ts in range(ts_count)]
+        }
+
+    def test_chunks_fit_max_payload_size(self):
+        data = self._create_data(20, 30)
+        chunks = DeviceDataSplitter(self.MAX_PAYLOAD_SIZE).split(data)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(dumps(chunk)), self.MAX_PAYLOAD_SIZE)
+
+    def test_no_data_lost(self):
+        data = self._create_data(20, 30, ts_count=3)
+        chunks = DeviceDataSplitter(self.MAX_PAYLOAD_SIZE).split(data)
+
+        attributes = {}
+        telemetry = {}
+        for chunk in chunks:
+            self.assertEqual(chunk["deviceName"], data["deviceName"])
+            self.assertEqual(chunk["deviceType"], data["deviceType"])
+            attributes.update(chunk["attributes"])
+            for ts_kv_list in chunk["telemetry"]:
+                telemetry.setdefault(ts_kv_list["ts"], {}).update(ts_kv_list["values"])
+
+        expected_attributes = {}
+        for attribute in data["attributes"]:
+            expected_attributes.update(attribute)
+        self.assertEqual(attributes, expected_attributes)
+        self.assertEqual(telemetry, {ts_kv_list["ts"]: ts_kv_list["values"] for ts_kv_list in data["telemetry"]})
+
+    def test_chunks_are_filled(self):
+        data = self._create_data(0, 40, ts_count=1)
+        chunks = DeviceDataSplitter(self.MAX_PAYLOAD_SIZE).split(data)
+
+        # Every chunk except the last one can't take one more key-value
+        for chunk in chunks[:-1]:
+            self.assertGreater(len(dumps(chunk)) + len(', "key00": 00.0'), self.MAX_PAYLOAD_SIZE)
+
+
+class TestEventPackBuilder(unittest.TestCase):
+    MAX_PAYLOAD_SIZE = 200
+
+    def setUp(self):
+        self.sent_packs = []
+        self.builder = EventPackBuilder(self.MAX_PAYLOAD_SIZE, self._send)
+
+    def _send(self, devices_data):
+        self.sent_packs.append({device: {"telemetry": list(data["telemetry"]), "attributes": dict(data["attributes"])}
+                                for (device, data) in devices_data.items()})
+
+    @staticmethod
+    def _payloads_size(devices_data):
+        size = 0
+        for (device, data) in devices_data.items():
+            if data["telemetry"]:
+                size += json_size({device: data["telemetry"]})
+            if data["attributes"]:
+                size += json_size({device: data["attributes"]})
+        return size
+
+    def test_tracked_size_is_exact(self):
+        for i in range(3):
+            self.builder.add_telemetry("Device %d" % i, {"ts": 1000 + i, "values": {"temperature": i}})
+            self.builder.add_attribute("Device %d" % i, "firmware", "1.%d" % i)
+        self.builder.add_attribute("Device 0", "firmware", "2.0.0")
+
+        self.assertEqual(self.builder.size, self._payloads_size(self.builder.devices_data))
+
+    def test_pack_is_flushed_before_overflow(self):
+        for i in range(50):
+            self.builder.add_telemetry("Device %d" % (i % 4), {"ts": 1000 + i, "values": {"temperature": i}})
+        self.builder.flush()
+
+        self.assertGreater(len(self.sent_packs), 1)
+        sent_items = 0
+        for pack in self.sent_packs:
+            self.assertLessEqual(self._payloads_size(pack), self.MAX_PAYLOAD_SIZE)
+            sent_items += sum(len(data["telemetry"]) for data in pack.values())
+        self.assertEqual(sent_items, 50)
+        self.assertTrue(self.builder.is_empty())
+
+    def test_published_bytes_are_counted(self):
+        bytes_counter = Counter('allBytesSentToTB')
+        builder = EventPackBuilder(self.MAX_PAYLOAD_SIZE, self._send, bytes_counter=bytes_counter)
+        for i in range(20):
+            builder.add_telemetry("Device %d" % (i % 3), {"ts": 1000 + i, "values": {"temperature": i}})
+        builder.flush()
+
+        self.assertEqual(bytes_counter.get_value(), builder.published_bytes)
+        self.assertEqual(bytes_counter.get_value(), sum(self._payloads_size(pack) for pack in self.sent_packs))
+
+    def test_messages_are_counted_as_published(self):
+        # The payload size limit is not reached, so every builder sends one pack
+        device_messages_builder = EventPackBuilder(1000, self._send)
+        one_message_builder = EventPackBuilder(1000, self._send, pack_in_one_message=True)
+        for builder in (device_messages_builder, one_message_builder):
+            for i in range(3):
+                builder.add_telemetry("Device %d" % i, {"ts": 1000 + i, "values": {"temperature": i}})
+            builder.add_attribute("Device 0", "firmware", "1.0")
+            builder.flush()
+
+        self.assertEqual(len(self.sent_packs), 2)
+        self.assertEqual(device_messages_builder.telemetry_messages_count, 3)
+        self.assertEqual(device_messages_builder.attributes_messages_count, 1)
+        self.assertEqual(one_message_builder.telemetry_messages_count, 1)
+        self.assertEqual(one_message_builder.attributes_messages_count, 1)
+        self.assertEqual(one_message_builder.get_fill_ratio(),
+                         one_message_builder.published_bytes / 2000)
+
+    def test_record_is_packed_as_json_data(self):
+        data = {"deviceName": "Device", "deviceType": "default",
+                "attributes": [{"firmware": "1.0"}, {"serial": "A-1"}],
+                "telemetry": [{"ts": 1000, "values": {"temperature": 22.5}}, {"ts": 1001, "values": {"humidity": 40}}]}
+        json_builder = EventPackBuilder(self.MAX_PAYLOAD_SIZE, self._send)
+        for item in data["telemetry"]:
+            json_builder.add_telemetry(data["deviceName"], item)
+        for item in data["attributes"]:
+            json_builder.add_attributes(data["deviceName"], item)
+
+        self.builder.add_record(DeviceDataRecord(data))
+
+        self.assertEqual(self.builder.devices_data, json_builder.devices_data)
+        self.assertEqual(self.builder.size, json_builder.size)
+
+
+class TestCoalescingEventPackBuilder(unittest.TestCase):
+    MAX_PAYLOAD_SIZE = 300
+
+    def setUp(self):
+        self.sent_packs = []
+        self.builder = EventPackBuilder(self.MAX_PAYLOAD_SIZE, self._send, coalesce=True)
+
+    def _send(self, devices_data):
+        self.sent_packs.append({device: {"telemetry": list(data["telemetry"]), "attributes": dict(data["attributes"])}
+                                for (device, data) in devices_data.items()})
+
+    def test_messages_are_filled_and_fit(self):
+        for i in range(100):
+            self.builder.add_telemetry("Device %d" % (i % 10), {"ts": 1000 + i, "values": {"temperature": i}})
+            self.builder.add_attribute("Device %d" % (i % 10), "counter", i)
+        self.builder.flush()
+
+        telemetry_messages = []
+        attributes_messages = []
+        for pack in self.sent_packs:
+            telemetry = {device: data["telemetry"] for (device, data) in pack.items() if data["telemetry"]}
+            attributes = {device: data["attributes"] for (device, data) in pack.items() if data["attributes"]}
+            if telemetry:
+                telemetry_messages.append(telemetry)
+            if attributes:
+                attributes_messages.append(attributes)
+
+        self.assertEqual(sum(len(items) for message in telemetry_messages for items in message.values()), 100)
+        for message in telemetry_messages + attributes_messages:
+            self.assertLessEqual(len(dumps(message)), self.MAX_PAYLOAD_SIZE)
+        for message in telemetry_messages[:-1]:
+            self.assertGreater(len(dumps(message)) + len(', {"ts": 1000, "values": {"temperature": 0}}'),
+                               self.MAX_PAYLOAD_SIZE)
+        self.assertEqual(self.builder.telemetry_messages_count, len(telemetry_messages))
+        self.assertEqual(self.builder.attributes_messages_count, len(attributes_messages))
+        self.assertEqual(self.builder.published_bytes,
+                         sum(len(dumps(message)) for message in telemetry_messages + attributes_messages))
+        self.assertGreater(self.builder.get_fill_ratio(), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from thingsboard_gateway.gateway.persistent_session import PersistentSession, get_events_fingerprint
+
+
+class TestPersistentSession(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.config_folder_path = self.directory.name + '/'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_client_id_is_stable(self):
+        session = PersistentSession({"enable": True}, self.config_folder_path)
+        self.assertTrue(session.client_id.startswith("tb_gw_"))
+        self.assertEqual(PersistentSession({"enable": True}, self.config_folder_path).client_id, session.client_id)
+        self.assertEqual(PersistentSession({"enable": True, "clientId": "gateway"}, self.config_folder_path).client_id,
+                         "gateway")
+
+    def test_packs_state_is_used_once(self):
+        session = PersistentSession({"enable": True}, self.config_folder_path)
+        packs_state = [{"fingerprint": 1, "acknowledged": [0, 2]}]
+        session.save_packs_state(packs_state)
+
+        restarted_session = PersistentSession({"enable": True}, self.config_folder_path)
+        self.assertListEqual(restarted_session.pop_packs_state(), packs_state)
+        self.assertListEqual(PersistentSession({"enable": True}, self.config_folder_path).pop_packs_state(), [])
+
+    def test_disabled_session_is_not_saved(self):
+        session = PersistentSession({}, self.config_folder_path)
+        session.save_packs_state([{"fingerprint": 1, "acknowledged": [0]}])
+        self.assertFalse(session.is_enabled())
+        self.assertFalse(path.exists(self.config_folder_path + "persistent_session.json"))
+
+    def test_events_fingerprint(self):
+        events = ['{"deviceName": "Device 1"}', '{"deviceName": "Device 2"}']
+        self.assertEqual(get_events_fingerprint(events), get_events_fingerprint(list(events)))
+        self.assertNotEqual(get_events_fingerprint(events), get_events_fingerprint(events[:1]))
+        self.assertNotEqual(get_events_fingerprint(events), get_events_fingerprint(events[::-1]))
+        self.assertIsNone(get_events_fingerprint([object()]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+
+from thingsboard_gateway.gateway.proto.messages_pb2 import GatewayAttributesMsg, GatewayTelemetryMsg, KeyValueType
+from thingsboard_gateway.gateway.protobuf_payload import encode_gateway_attributes, encode_gateway_telemetry
+
+
+class TestProtobufPayload(unittest.TestCase):
+    def test_gateway_telemetry(self):
+        devices_telemetry = {
+            "Device 1": [{"ts": 1000, "values": {"active": True, "count": 5, "temperature": 22.5}},
+                         {"ts": 2000, "values": {"status": "OK"}}],
+            "Device 2": {"ts": 3000, "values": {"config": {"mode": 1}}}
+        }
+
+        message = GatewayTelemetryMsg()
+        message.ParseFromString(encode_gateway_telemetry(devices_telemetry))
+
+        self.assertEqual([msg.deviceName for msg in message.msg], ["Device 1", "Device 2"])
+        first_ts_kv_list = message.msg[0].msg.tsKvList[0]
+        self.assertEqual(first_ts_kv_list.ts, 1000)
+        self.assertEqual([(kv.key, kv.type) for kv in first_ts_kv_list.kv],
+                         [("active", KeyValueType.BOOLEAN_V), ("count", KeyValueType.LONG_V),
+                          ("temperature", KeyValueType.DOUBLE_V)])
+        self.assertEqual(message.msg[0].msg.tsKvList[1].kv[0].string_v, "OK")
+        self.assertEqual(message.msg[1].msg.tsKvList[0].ts, 3000)
+        self.assertEqual(message.msg[1].msg.tsKvList[0].kv[0].type, KeyValueType.JSON_V)
+        self.assertEqual(message.msg[1].msg.tsKvList[0].kv[0].json_v, '{"mode": 1}')
+
+    def test_output_is_equal_to_protobuf_runtime_output(self):
+        devices_telemetry = {"Device": [{"ts": 1000, "values": {"zero": 0, "negative": -5, "empty": "", "off": False,
+                                                                 "float": -0.25, "list": [1, 2]}}]}
+        message = GatewayTelemetryMsg()
+        telemetry_msg = message.msg.add()
+        telemetry_msg.deviceName = "Device"
+        ts_kv_list = telemetry_msg.msg.tsKvList.add()
+        ts_kv_list.ts = 1000
+        for (key, kv_type, field, value) in (("zero", KeyValueType.LONG_V, "long_v", 0),
+                                             ("negative", KeyValueType.LONG_V, "long_v", -5),
+                                             ("empty", KeyValueType.STRING_V, "string_v", ""),
+                                             ("off", KeyValueType.BOOLEAN_V, "bool_v", False),
+                                             ("float", KeyValueType.DOUBLE_V, "double_v", -0.25),
+                                             ("list", KeyValueType.JSON_V, "json_v", "[1, 2]")):
+            kv = ts_kv_list.kv.add()
+            kv.key = key
+            kv.type = kv_type
+            setattr(kv, field, value)
+
+        self.assertEqual(encode_gateway_telemetry(devices_telemetry), message.SerializeToString())
+
+    def test_gateway_attributes(self):
+        message = GatewayAttributesMsg()
+        message.ParseFromString(encode_gateway_attributes({"Device 1": {"firmware": "1.0", "big": 2 ** 64}}))
+
+        self.assertEqual(message.msg[0].deviceName, "Device 1")
+        self.assertEqual(message.msg[0].msg.kv[0].string_v, "1.0")
+        self.assertEqual(message.msg[0].msg.kv[1].type, KeyValueType.JSON_V)
+
+
+if __name__ == '__main__':
+    unittest.main()
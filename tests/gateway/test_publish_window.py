@@ -0,0 +1,111 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from time import sleep
+
+from tb_device_mqtt import TBPublishInfo
+
+from thingsboard_gateway.gateway.publish_window import PublishWindow
+
+
+class FakeMessageInfo:
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+        self.published = False
+
+    def is_published(self):
+        return self.published
+
+
+class TestPublishWindow(unittest.TestCase):
+    def setUp(self):
+        self.window = PublishWindow(max_packs_in_flight=2, ack_timeout_ms=50)
+        self.mid = 0
+
+    def _publish(self, count=2, rc=0):
+        infos = []
+        for _ in range(count):
+            self.mid += 1
+            infos.append(FakeMessageInfo(self.mid, rc))
+        return infos
+
+    def test_packs_are_acknowledged_in_order(self):
+        first_pack = self._publish()
+        second_pack = self._publish()
+        self.window.add_pack([TBPublishInfo(info) for info in first_pack])
+        self.window.add_pack([TBPublishInfo(info) for info in second_pack])
+        self.assertTrue(self.window.is_full())
+
+        for info in second_pack:
+            info.published = True
+        self.assertEqual(self.window.pop_acknowledged(), 0)
+
+        first_pack[0].published = True
+        self.assertEqual(self.window.pop_acknowledged(), 0)
+        first_pack[1].published = True
+        self.assertEqual(self.window.pop_acknowledged(), 2)
+        self.assertEqual(len(self.window), 0)
+
+    def test_pack_without_ack_waiting_is_acknowledged(self):
+        self.window.add_pack([TBPublishInfo(info) for info in self._publish()], wait_for_ack=False)
+        self.window.add_pack([])
+        self.assertEqual(self.window.pop_acknowledged(), 2)
+
+    def test_traces_of_acknowledged_packs(self):
+        first_pack = self._publish()
+        second_pack = self._publish()
+        self.window.add_pack([TBPublishInfo(info) for info in first_pack], traces=[["first"]])
+        self.window.add_pack([TBPublishInfo(info) for info in second_pack], traces=[["second"]])
+
+        for info in first_pack:
+            info.published = True
+        self.assertEqual(self.window.pop_acknowledged(), 1)
+        self.assertEqual(self.window.pop_acknowledged_traces(), [["first"]])
+        self.assertEqual(self.window.pop_acknowledged_traces(), [])
+
+    def test_failed_publish(self):
+        self.window.add_pack([TBPublishInfo(info) for info in self._publish(rc=4)])
+        self.assertTrue(self.window.is_failed())
+
+        self.window.clear()
+        self.assertFalse(self.window.is_failed())
+
+    def test_ack_timeout(self):
+        self.window.add_pack([TBPublishInfo(info) for info in self._publish()])
+        self.assertFalse(self.window.is_failed())
+        sleep(.1)
+        self.assertTrue(self.window.is_failed())
+
+    def test_persistent_session_state(self):
+        window = PublishWindow(max_packs_in_flight=2, ack_timeout_ms=50, persistent_session=True)
+        pack = self._publish(3)
+        window.add_pack([TBPublishInfo(info) for info in pack], fingerprint=1, message_indexes=[0, 2, 3],
+                        acknowledged_indexes=[1])
+        # Messages published without the connection are sent by the client after reconnect
+        window.add_pack([TBPublishInfo(info) for info in self._publish(1, rc=4)], fingerprint=2)
+        self.assertFalse(window.is_failed())
+
+        pack[2].published = True
+        self.assertListEqual(window.get_state(), [{"fingerprint": 1, "acknowledged": [1, 3]},
+                                                  {"fingerprint": 2, "acknowledged": []}])
+        sleep(.1)
+        self.assertTrue(window.is_failed())
+        window.restart_timeouts()
+        self.assertFalse(window.is_failed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from time import monotonic
+
+from thingsboard_gateway.gateway.protobuf_payload import GATEWAY_TELEMETRY_TOPIC
+from thingsboard_gateway.gateway.rate_limiter import RateLimitedClientMixin, RateLimiter, parse_rate_limit
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_thingsboard_limit_format(self):
+        buckets = parse_rate_limit("100:1, 3000:60")
+        self.assertListEqual([(bucket.rate, bucket.capacity) for bucket in buckets], [(100, 100), (50, 3000)])
+        self.assertListEqual(parse_rate_limit(0), [])
+
+    def test_disabled_limiter_is_not_limited(self):
+        limiter = RateLimiter({"enable": False, "messagesPerSecond": 1})
+        self.assertFalse(limiter.is_enabled())
+        self.assertTrue(limiter.has_budget())
+
+    def test_gateway_messages_are_shaped(self):
+        limiter = RateLimiter({"enable": True, "messagesPerSecond": "5:1"})
+        started = monotonic()
+        for _ in range(8):
+            limiter.acquire({"Device": (1, 0)})
+        self.assertGreaterEqual(monotonic() - started, .5)
+        self.assertEqual(limiter.throttled_messages_count, 3)
+        statistics = limiter.get_statistics()
+        self.assertEqual(statistics["rateLimitGatewayMessagesThrottled"], 3)
+        self.assertGreater(statistics["rateLimitThrottleTimeMs"], 0)
+        self.assertFalse(limiter.has_budget())
+
+    def test_device_datapoints_are_shaped(self):
+        limiter = RateLimiter({"enable": True, "device": {"datapointsPerSecond": "10:1"}})
+        data = {"Device 1": [{"ts": 1, "values": {"a": 1, "b": 2}}, {"ts": 2, "values": {"a": 3, "b": 4}}],
+                "Device 2": [{"ts": 1, "values": {"a": 1}}]}
+        for _ in range(2):
+            limiter.acquire_for_publish(data, GATEWAY_TELEMETRY_TOPIC)
+        self.assertEqual(limiter.throttled_messages_count, 0)
+
+        started = monotonic()
+        limiter.acquire_for_publish(data, GATEWAY_TELEMETRY_TOPIC)
+        # Only "Device 1" is out of its datapoints budget, the gateway wide limits are not set
+        self.assertGreaterEqual(monotonic() - started, .1)
+        self.assertEqual(limiter.get_statistics()["rateLimitDeviceDatapointsThrottled"], 1)
+        self.assertTrue(limiter.has_budget())
+
+    def test_client_publishes_are_shaped(self):
+        class Client:
+            def __init__(self):
+                self.published = []
+
+            def publish_data(self, data, topic, qos):
+                self.published.append((data, topic))
+
+            def gw_send_rpc_reply(self, device, req_id, resp, quality_of_service=None):
+                self.published.append((device, req_id))
+
+        class LimitedClient(RateLimitedClientMixin, Client):
+            pass
+
+        client = LimitedClient()
+        client.rate_limiter = RateLimiter({"enable": True, "messagesPerSecond": "1:1"})
+        started = monotonic()
+        client.publish_data({"Device": {"a": 1}}, "v1/gateway/attributes", 1)
+        client.gw_send_rpc_reply("Device", 1, '{"success": true}')
+        self.assertGreaterEqual(monotonic() - started, .9)
+        self.assertEqual(len(client.published), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import unittest
+from time import monotonic, sleep
+
+from thingsboard_gateway.gateway.publish_window import PublishWindow
+from thingsboard_gateway.gateway.uplink_tuner import PublishLatencyMonitor, UplinkAutoTuner
+from thingsboard_gateway.storage.memory.memory_event_storage import MemoryEventStorage
+
+
+class TestPublishLatencyMonitor(unittest.TestCase):
+    def test_latency_is_collected_once(self):
+        monitor = PublishLatencyMonitor()
+        now = monotonic()
+        monitor.on_acknowledged(now - .1)
+        monitor.on_acknowledged(now - .3)
+
+        (acks_count, ack_rate, average_latency, max_latency) = monitor.collect()
+        self.assertEqual(acks_count, 2)
+        self.assertGreater(ack_rate, 0)
+        self.assertAlmostEqual(average_latency, .2, delta=.05)
+        self.assertAlmostEqual(max_latency, .3, delta=.05)
+        self.assertEqual(monitor.collect()[0], 0)
+
+
+class TestUplinkAutoTuner(unittest.TestCase):
+    def setUp(self):
+        self.monitor = PublishLatencyMonitor()
+        self.publish_window = PublishWindow(4)
+        self.storage = MemoryEventStorage({"read_records_count": 100})
+
+    def _create_tuner(self, **config):
+        return UplinkAutoTuner({"enable": True, "periodMs": 10, "targetLatencyMs": 100, "maxPacksInFlight": 8,
+                                "minPackSize": 10, "maxPackSize": 200, "packSizeStep": 50, "maxSendDelayMs": 400,
+                                **config}, self.publish_window, self.storage, 200)
+
+    def _update(self, tuner, latency):
+        self.monitor.on_acknowledged(monotonic() - latency)
+        sleep(.015)
+        tuner.update(self.monitor)
+
+    def test_values_grow_additively_while_latency_is_low(self):
+        tuner = self._create_tuner()
+        self._update(tuner, .01)
+        self.assertEqual(self.publish_window.max_packs_in_flight, 5)
+        self.assertEqual(self.storage.get_pack_size(), 150)
+        self.assertEqual(tuner.send_delay_ms, 190)
+
+        for _ in range(10):
+            self._update(tuner, .01)
+        self.assertEqual(self.publish_window.max_packs_in_flight, 8)
+        self.assertEqual(self.storage.get_pack_size(), 200)
+
+    def test_values_decrease_multiplicatively_on_congestion(self):
+        tuner = self._create_tuner()
+        self._update(tuner, .5)
+        self.assertEqual(self.publish_window.max_packs_in_flight, 2)
+        self.assertEqual(self.storage.get_pack_size(), 50)
+        self.assertEqual(tuner.send_delay_ms, 400)
+
+        tuner.on_failure()
+        self._update(tuner, .01)
+        self.assertEqual(self.publish_window.max_packs_in_flight, 1)
+        self.assertEqual(self.storage.get_pack_size(), 25)
+        statistics = tuner.get_statistics()
+        self.assertEqual(statistics["uplinkCongestionCount"], 2)
+        self.assertEqual(statistics["uplinkPackSize"], 25)
+
+    def test_disabled_tuner_only_reports_latency(self):
+        tuner = self._create_tuner(enable=False)
+        self._update(tuner, .5)
+        self.assertEqual(self.publish_window.max_packs_in_flight, 4)
+        self.assertEqual(self.storage.get_pack_size(), 100)
+        self.assertGreaterEqual(tuner.get_statistics()["uplinkAckLatencyMs"], 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,17 +13,30 @@
 #     limitations under the License.
 
 import logging
+import os
+import sqlite3
 import unittest
-from os import remove, listdir, removedirs
-from time import sleep
+from os import remove, listdir, makedirs, removedirs
+from threading import Thread
+from time import sleep, time
 from random import randint
 
+from simplejson import dumps, loads
+
+from thingsboard_gateway.gateway.catch_up import CatchUpController
 from thingsboard_gateway.connectors.mqtt.json_mqtt_uplink_converter import JsonMqttUplinkConverter
 from thingsboard_gateway.connectors.opcua.opcua_uplink_converter import OpcUaUplinkConverter
 from thingsboard_gateway.connectors.ble.bytes_ble_uplink_converter import BytesBLEUplinkConverter
 from thingsboard_gateway.connectors.request.json_request_uplink_converter import JsonRequestUplinkConverter
+from thingsboard_gateway.storage.memory.event_ring_buffer import EventRingBuffer
 from thingsboard_gateway.storage.memory.memory_event_storage import MemoryEventStorage
 from thingsboard_gateway.storage.file.file_event_storage import FileEventStorage
+from thingsboard_gateway.storage.file.event_storage_group_commit import EventStorageGroupCommit
+from thingsboard_gateway.storage.sqlite.sqlite_event_storage import SQLiteEventStorage
+from thingsboard_gateway.storage.tiered.tiered_event_storage import TieredEventStorage
+from thingsboard_gateway.storage.lanes.lanes_event_storage import LanesEventStorage
+from thingsboard_gateway.storage.file.event_storage_segment import encode_binary_records, encode_text_records, \
+    get_index_file_name, open_segment_reader
 
 logging.basicConfig(level=logging.ERROR,
                     format='%(asctime)s - %(levelname)s - %(module)s - %(lineno)d - %(message)s',
@@ -269,6 +282,722 @@ class TestStorage(unittest.TestCase):
         removedirs(storage_test_config["data_folder_path"])
         self.assertListEqual(result, correct_result)
 
+    def test_memory_storage_put_batch(self):
+        storage = MemoryEventStorage({"type": "memory", "read_records_count": 10, "max_records_count": 25})
+
+        self.assertTrue(storage.put_batch([str(x) for x in range(20)]))
+        self.assertFalse(storage.put_batch([str(x) for x in range(20, 30)]))
+        self.assertEqual(storage.len(), 25)
+
+        result = []
+        for _ in range(3):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        self.assertListEqual(result, [str(x) for x in range(25)])
+
+    def test_memory_storage_rewind(self):
+        storage = MemoryEventStorage({"type": "memory", "read_records_count": 10, "max_records_count": 100})
+        storage.put_batch([str(x) for x in range(30)])
+
+        first_pack = storage.get_event_pack()
+        second_pack = storage.get_event_pack()
+        self.assertListEqual(second_pack, [str(x) for x in range(10, 20)])
+
+        storage.event_pack_processing_done()
+        storage.rewind()
+        self.assertListEqual(storage.get_event_pack(), second_pack)
+        self.assertListEqual(storage.get_event_pack(), [str(x) for x in range(20, 30)])
+        self.assertNotEqual(first_pack, second_pack)
+
+    def test_file_storage_put_batch(self):
+        storage_test_config = {"data_folder_path": "storage/batch_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 10,
+                               "max_read_records_count": 10,
+                               "no_records_sleep_interval": 5000
+                               }
+        storage = FileEventStorage(storage_test_config)
+
+        self.assertTrue(storage.put_batch([str(x) for x in range(15)]))
+        self.assertTrue(storage.put_batch([str(x) for x in range(15, 45)]))
+
+        result = []
+        for _ in range(5):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertListEqual(result, [str(x) for x in range(45)])
+
+    def test_file_storage_pending_events_count(self):
+        storage_test_config = {"data_folder_path": "storage/pending_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 10,
+                               "max_read_records_count": 10,
+                               "no_records_sleep_interval": 5000
+                               }
+        storage = FileEventStorage(storage_test_config)
+        # The storage always has a data file, but it has no events
+        empty_count = storage.get_pending_events_count()
+
+        storage.put_batch([str(x) for x in range(25)])
+        stored_count = storage.get_pending_events_count()
+        storage.get_event_pack()
+        storage.event_pack_processing_done()
+        read_count = storage.get_pending_events_count()
+        for _ in range(2):
+            storage.get_event_pack()
+            storage.event_pack_processing_done()
+        drained_count = storage.get_pending_events_count()
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertEqual(empty_count, 0)
+        self.assertEqual(stored_count, 25)
+        self.assertEqual(read_count, 15)
+        self.assertEqual(drained_count, 0)
+
+    def test_catch_up_with_file_storage_backlog(self):
+        storage_test_config = {"data_folder_path": "storage/catch_up_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 10,
+                               "max_read_records_count": 10,
+                               "no_records_sleep_interval": 5000
+                               }
+        storage = FileEventStorage(storage_test_config)
+        controller = CatchUpController({"enable": True, "liveUpdatePeriodMs": 0, "minBacklogEvents": 5},
+                                       storage.get_pending_events_count)
+        controller.set_connected(False)
+        controller.set_connected(True)
+        active_without_backlog = controller.is_active()
+
+        storage.put_batch([str(x) for x in range(12)])
+        controller.set_connected(False)
+        controller.set_connected(True)
+        active_with_backlog = controller.is_active()
+        storage.get_event_pack()
+        storage.event_pack_processing_done()
+        controller.get_live_values()
+        active_after_backfill = controller.is_active()
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertFalse(active_without_backlog)
+        self.assertTrue(active_with_backlog)
+        self.assertFalse(active_after_backfill)
+
+    def test_file_storage_fsync_policy(self):
+        storage_test_config = {"data_folder_path": "storage/fsync_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 100,
+                               "max_read_records_count": 10,
+                               "fsync_policy": "every_n_records",
+                               "max_records_between_fsync": 5
+                               }
+        storage = FileEventStorage(storage_test_config)
+        for x in range(12):
+            storage.put(str(x))
+        fsync_count = storage._FileEventStorage__writer.fsync_count
+        storage.stop()
+        fsync_count_after_stop = storage._FileEventStorage__writer.fsync_count
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertEqual(fsync_count, 2)
+        self.assertEqual(fsync_count_after_stop, 3)
+
+    def test_compressed_file_storage_fsync_policy(self):
+        storage_test_config = {"data_folder_path": "storage/compressed_fsync_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 100,
+                               "max_read_records_count": 10,
+                               "fsync_policy": "every_n_records",
+                               "max_records_between_fsync": 1,
+                               "compression": "zlib",
+                               "compression_block_size": 65536,
+                               "compression_block_max_delay_ms": 60000
+                               }
+        storage = FileEventStorage(storage_test_config)
+        storage.put_batch([str(x) for x in range(5)])
+        # The not filled block is written, as the records must be synced to the disk
+        fsync_count = storage._FileEventStorage__writer.fsync_count
+        result = storage.get_event_pack()
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertEqual(fsync_count, 1)
+        self.assertListEqual(result, [str(x) for x in range(5)])
+
+    def test_index_file_name_of_segments(self):
+        self.assertEqual(get_index_file_name("data_1000.seg"), "index_1000.idx")
+        self.assertEqual(get_index_file_name("data_1000.zseg"), "index_1000.idx")
+
+    def test_group_commit(self):
+        written_batches = []
+
+        def write_batch(messages):
+            written_batches.append(messages)
+            sleep(.05)
+
+        group_commit = EventStorageGroupCommit(write_batch)
+        threads = [Thread(target=group_commit.write_batch, args=([str(x)],)) for x in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(written_batches), 10)
+        self.assertListEqual(sorted(message for batch in written_batches for message in batch),
+                             sorted(str(x) for x in range(10)))
+
+    def test_file_storage_drains_legacy_data_files(self):
+        storage_test_config = {"data_folder_path": "storage/legacy_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 10,
+                               "max_read_records_count": 10,
+                               "data_file_format": "text"
+                               }
+        storage = FileEventStorage(storage_test_config)
+        storage.put_batch([str(x) for x in range(15)])
+        self.assertEqual(len(storage.get_event_pack()), 10)
+        storage.event_pack_processing_done()
+        storage.stop()
+
+        # Restarted with the binary format, without the byte offset in the state file
+        with open(storage_test_config["data_folder_path"] + "state_file.txt", "r+") as state_file:
+            state = loads(state_file.read())
+            state.pop("offset")
+            state_file.seek(0)
+            state_file.truncate()
+            state_file.write(dumps(state))
+        storage = FileEventStorage({**storage_test_config, "data_file_format": "binary"})
+        storage.put_batch([str(x) for x in range(15, 30)])
+
+        result = []
+        for _ in range(3):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        data_files = sorted(listdir(storage_test_config["data_folder_path"]))
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertListEqual(result, [str(x) for x in range(10, 30)])
+        self.assertFalse([file for file in data_files if file.endswith(".txt") and file.startswith("data_")])
+
+    def test_file_storage_writer_counts_records_after_restart(self):
+        storage_test_config = {"data_folder_path": "storage/restart_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 1000,
+                               "max_read_records_count": 1000
+                               }
+        storage = FileEventStorage(storage_test_config)
+        storage.put_batch([str(x) for x in range(600)])
+        storage.stop()
+        data_file = [file for file in listdir(storage_test_config["data_folder_path"]) if file.startswith("data_")][0]
+        with open(storage_test_config["data_folder_path"] + data_file, "ab") as file:
+            # Incomplete record left by a crash
+            file.write(b"\x10\x00\x00\x00{}")
+
+        storage = FileEventStorage(storage_test_config)
+        records_count = storage._FileEventStorage__writer.current_file_records_count[0]
+        storage.put_batch([str(x) for x in range(600, 700)])
+        result = storage.get_event_pack()
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertEqual(records_count, 600)
+        self.assertListEqual(result, [str(x) for x in range(700)])
+
+    def test_memory_storage_is_full(self):
+        storage = MemoryEventStorage({"type": "memory", "read_records_count": 10, "max_records_count": 20})
+
+        storage.put_batch([str(x) for x in range(19)])
+        self.assertFalse(storage.is_full())
+        storage.put(str(19))
+        self.assertTrue(storage.is_full())
+
+        storage.get_event_pack()
+        self.assertFalse(storage.is_full())
+
+    def test_file_storage_is_full(self):
+        storage_test_config = {"data_folder_path": "storage/full_data/",
+                               "max_file_count": 2,
+                               "max_records_per_file": 10,
+                               "max_read_records_count": 10,
+                               "no_records_sleep_interval": 5000
+                               }
+        storage = FileEventStorage(storage_test_config)
+
+        while not storage.is_full():
+            self.assertTrue(storage.put_batch([str(x) for x in range(5)]))
+        self.assertFalse(storage.put_batch([str(x) for x in range(5)]))
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+
+    def test_mapped_segment_reader_reads_growing_file(self):
+        folder = "storage/mapped_data/"
+        for (file_name, encode) in (("data_1.seg", lambda messages: encode_binary_records(messages, 0, 0)[0]),
+                                    ("data_1.txt", encode_text_records)):
+            makedirs(folder, exist_ok=True)
+            file_path = folder + file_name
+            open(file_path, "wb").close()
+            mapped_reader = open_segment_reader(file_path, use_mmap=True)
+            self.assertIsNone(mapped_reader.read_record())
+
+            with open(file_path, "ab") as file:
+                file.write(encode([str(x) for x in range(10)]))
+                file.flush()
+                result = [mapped_reader.read_record() for _ in range(5)]
+                file.write(encode([str(x) for x in range(10, 20)]))
+                file.flush()
+                record = mapped_reader.read_record()
+                while record is not None:
+                    result.append(record)
+                    record = mapped_reader.read_record()
+            offset = mapped_reader.offset
+            mapped_reader.close()
+
+            buffered_reader = open_segment_reader(file_path, 0, 0)
+            expected = [buffered_reader.read_record() for _ in range(20)]
+            self.assertEqual(buffered_reader.offset, offset)
+            buffered_reader.close()
+            resumed_reader = open_segment_reader(file_path, 15, mapped_reader.offset - len(encode(["19"])) * 5,
+                                                 use_mmap=True)
+            resumed_record = resumed_reader.read_record()
+            resumed_reader.close()
+
+            for file in listdir(folder):
+                remove(folder + file)
+            removedirs(folder)
+            self.assertListEqual(result, [str(x) for x in range(20)])
+            self.assertListEqual(result, expected)
+            self.assertEqual(resumed_record, "15")
+
+    @staticmethod
+    def _read_sqlite_storage(storage, events_count, confirm=True, timeout=5):
+        # Writes are applied by the database thread, so the storage is polled until the events are read
+        result = []
+        started = time()
+        while len(result) < events_count and time() - started < timeout:
+            events = storage.get_event_pack()
+            if not events:
+                sleep(.05)
+                continue
+            result.extend(events)
+            if confirm:
+                storage.event_pack_processing_done()
+        return result
+
+    def test_sqlite_storage(self):
+        makedirs("storage", exist_ok=True)
+        storage_test_config = {"data_file_path": "storage/sqlite_data.db", "read_records_count": 10}
+        storage = SQLiteEventStorage(storage_test_config)
+        storage.put_batch([str(x) for x in range(25)])
+
+        confirmed = self._read_sqlite_storage(storage, 10)
+        not_confirmed = self._read_sqlite_storage(storage, 10, confirm=False)
+        storage.stop()
+
+        storage = SQLiteEventStorage(storage_test_config)
+        result = self._read_sqlite_storage(storage, 15)
+        storage.stop()
+
+        for file in listdir("storage"):
+            remove("storage/" + file)
+        removedirs("storage")
+        self.assertListEqual(confirmed, [str(x) for x in range(10)])
+        self.assertListEqual(not_confirmed, [str(x) for x in range(10, 20)])
+        self.assertListEqual(result, [str(x) for x in range(10, 25)])
+
+    def test_sqlite_storage_pending_events_count(self):
+        makedirs("storage", exist_ok=True)
+        storage = SQLiteEventStorage({"data_file_path": "storage/pending_data.db", "read_records_count": 10})
+        empty_count = storage.get_pending_events_count()
+        storage.put_batch([str(x) for x in range(25)])
+        # The database thread writes the events asynchronously
+        started = time()
+        while storage.get_pending_events_count() < 25 and time() - started < 5:
+            sleep(.05)
+        stored_count = storage.get_pending_events_count()
+
+        controller = CatchUpController({"enable": True, "minBacklogEvents": 20}, storage.get_pending_events_count)
+        controller.set_connected(False)
+        controller.set_connected(True)
+        active_with_backlog = controller.is_active()
+        self._read_sqlite_storage(storage, 10)
+        read_count = storage.get_pending_events_count()
+        controller.get_live_values()
+        active_after_backfill = controller.is_active()
+        storage.stop()
+
+        for file in listdir("storage"):
+            remove("storage/" + file)
+        removedirs("storage")
+        self.assertEqual(empty_count, 0)
+        self.assertEqual(stored_count, 25)
+        self.assertEqual(read_count, 15)
+        self.assertTrue(active_with_backlog)
+        self.assertFalse(active_after_backfill)
+
+    def test_sqlite_storage_retries_failed_write(self):
+        makedirs("storage", exist_ok=True)
+        storage = SQLiteEventStorage({"data_file_path": "storage/retry_data.db", "read_records_count": 10})
+        executemany = storage.db.db.executemany
+        failures = [sqlite3.OperationalError("database is locked")]
+
+        def failing_executemany(*args):
+            if failures:
+                raise failures.pop()
+            return executemany(*args)
+
+        storage.db.db.executemany = failing_executemany
+        storage.put_batch([str(x) for x in range(5)])
+        result = self._read_sqlite_storage(storage, 5)
+        written_count = storage.db.msg_counter
+        storage.stop()
+
+        for file in listdir("storage"):
+            remove("storage/" + file)
+        removedirs("storage")
+        self.assertListEqual(result, [str(x) for x in range(5)])
+        self.assertEqual(written_count, 5)
+
+    def test_sqlite_storage_migrates_legacy_table(self):
+        makedirs("storage", exist_ok=True)
+        connection = sqlite3.connect("storage/legacy_data.db")
+        connection.execute("CREATE TABLE messages (timestamp INTEGER, message TEXT);")
+        connection.executemany("INSERT INTO messages (timestamp, message) VALUES (?, ?);",
+                               [(1, str(x)) for x in range(5)])
+        connection.commit()
+        connection.close()
+
+        storage = SQLiteEventStorage({"data_file_path": "storage/legacy_data.db", "read_records_count": 10})
+        storage.put_batch([str(x) for x in range(5, 8)])
+        result = self._read_sqlite_storage(storage, 8)
+        storage.stop()
+
+        for file in listdir("storage"):
+            remove("storage/" + file)
+        removedirs("storage")
+        self.assertListEqual(result, [str(x) for x in range(8)])
+
+    def test_tiered_storage(self):
+        storage_test_config = {"data_folder_path": "storage/tiered_data/",
+                               "disk_type": "file",
+                               "max_records_count": 10,
+                               "read_records_count": 5,
+                               "max_file_count": 1000,
+                               "max_records_per_file": 100,
+                               "max_read_records_count": 5
+                               }
+        storage = TieredEventStorage(storage_test_config)
+        storage.set_connected(True)
+        # The disk tier is checked for the events of the previous run before the memory tier is used
+        self.assertListEqual(storage.get_event_pack(), [])
+        self.assertListEqual(storage.get_event_pack(), [])
+
+        storage.put_batch([str(x) for x in range(8)])
+        statistics = storage.get_statistics()
+        self.assertFalse(statistics["storageSpilling"])
+        self.assertEqual(statistics["storageMemoryTierEvents"], 8)
+
+        # The memory tier is full
+        storage.put_batch([str(x) for x in range(8, 12)])
+        storage.set_connected(False)
+        storage.put_batch([str(x) for x in range(12, 15)])
+        statistics = storage.get_statistics()
+        self.assertTrue(statistics["storageSpilling"])
+        self.assertEqual(statistics["storageDiskTierEvents"], 7)
+
+        storage.set_connected(True)
+        result = []
+        first_pack = storage.get_event_pack()
+        storage.rewind()
+        for _ in range(6):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        storage.put_batch([str(x) for x in range(15, 17)])
+        result.extend(storage.get_event_pack())
+        statistics = storage.get_statistics()
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertListEqual(first_pack, [str(x) for x in range(5)])
+        self.assertListEqual(result, [str(x) for x in range(17)])
+        self.assertFalse(statistics["storageSpilling"])
+        self.assertEqual(statistics["storageDiskTierEvents"], 0)
+
+    def test_tiered_storage_waits_for_pending_disk_events(self):
+        storage_test_config = {"data_folder_path": "storage/tiered_pending_data/",
+                               "disk_type": "file",
+                               "max_records_count": 10,
+                               "read_records_count": 10,
+                               "max_file_count": 1000,
+                               "max_records_per_file": 100,
+                               "max_read_records_count": 10,
+                               "compression": "zlib",
+                               "compression_block_size": 65536,
+                               "compression_block_max_delay_ms": 200
+                               }
+        storage = TieredEventStorage(storage_test_config)
+        storage.put_batch([str(x) for x in range(5)])
+        storage.set_connected(True)
+        # The events wait in the not filled compressed block, so they are not read yet
+        empty_packs = [storage.get_event_pack(), storage.get_event_pack()]
+        storage.put_batch([str(x) for x in range(5, 7)])
+        sleep(.25)
+        result = []
+        for _ in range(3):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertListEqual(empty_packs, [[], []])
+        self.assertListEqual(result, [str(x) for x in range(7)])
+
+    def test_event_ring_buffer(self):
+        ring = EventRingBuffer(track_sizes=True, track_devices=True)
+        expected = []
+        next_event = 0
+        for step in range(3000):
+            action = randint(0, 9)
+            if action < 5:
+                events = [(next_event + i, "Device %i" % ((next_event + i) % 7)) for i in range(randint(1, 700))]
+                next_event += len(events)
+                ring.extend([event for (event, _) in events], [event % 10 for (event, _) in events],
+                            [device for (_, device) in events])
+                expected.extend(events)
+            elif action < 7:
+                count = randint(1, 900)
+                self.assertListEqual(ring.drain(count), [event for (event, _) in expected[:count]])
+                del expected[:count]
+            elif action < 9:
+                device = "Device %i" % randint(0, 7)
+                device_events = [item for item in expected if item[1] == device]
+                self.assertEqual(ring.drop_oldest_of_device(device), bool(device_events))
+                if device_events:
+                    expected.remove(device_events[0])
+            else:
+                self.assertEqual(ring.drop_oldest(), bool(expected))
+                del expected[:1]
+            self.assertEqual(len(ring), len(expected))
+            self.assertEqual(ring.size_bytes, sum(event % 10 for (event, _) in expected))
+        self.assertListEqual(ring.drain(len(expected) + 1), [event for (event, _) in expected])
+
+    def test_memory_storage_drop_oldest(self):
+        storage = MemoryEventStorage({"read_records_count": 100, "max_records_count": 5,
+                                      "overflow_policy": "drop_oldest"})
+
+        self.assertTrue(storage.put_batch([str(x) for x in range(4)]))
+        self.assertTrue(storage.put_batch([str(x) for x in range(4, 8)]))
+        self.assertFalse(storage.is_full())
+
+        self.assertListEqual(storage.get_event_pack(), [str(x) for x in range(3, 8)])
+        self.assertEqual(storage.get_statistics()["storageDroppedEvents"], 3)
+
+    def test_memory_storage_drop_oldest_per_device(self):
+        storage = MemoryEventStorage({"read_records_count": 100, "max_records_count": 4,
+                                      "overflow_policy": "drop_oldest_per_device"})
+        events = [dumps({"deviceName": device, "telemetry": [{"value": value}]})
+                  for (device, value) in (("A", 1), ("B", 1), ("A", 2), ("B", 2), ("A", 3), ("C", 1))]
+
+        self.assertTrue(storage.put_batch(events))
+
+        # "A" keeps its latest values, "C" has no events yet, so the oldest event of all is dropped
+        self.assertListEqual(storage.get_event_pack(), [events[2], events[3], events[4], events[5]])
+
+    def test_memory_storage_max_size(self):
+        storage = MemoryEventStorage({"read_records_count": 100, "max_records_count": 1000,
+                                      "max_size_mb": 100 / 1024 / 1024})
+
+        self.assertTrue(storage.put_batch(["a" * 30, "b" * 30, "c" * 30]))
+        self.assertFalse(storage.put_batch(["d" * 10, "e"]))
+        self.assertTrue(storage.is_full())
+        self.assertEqual(storage.get_statistics()["storageRejectedEvents"], 1)
+
+        self.assertListEqual(storage.get_event_pack(), ["a" * 30, "b" * 30, "c" * 30, "d" * 10])
+        self.assertFalse(storage.is_full())
+
+    def test_file_storage_compression(self):
+        storage_test_config = {"data_folder_path": "storage/compressed_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 300,
+                               "max_read_records_count": 70,
+                               "compression": "zlib",
+                               "compression_block_size": 1000,
+                               "compression_block_max_delay_ms": 0
+                               }
+        messages = [dumps({"deviceName": "Device %i" % (x % 3), "telemetry": [{"value": x}]}) for x in range(500)]
+        storage = FileEventStorage(storage_test_config)
+        storage.put_batch(messages[:450])
+        result = storage.get_event_pack()
+        storage.event_pack_processing_done()
+        storage.stop()
+
+        # Reading is resumed from the middle of a block
+        storage = FileEventStorage(storage_test_config)
+        storage.put_batch(messages[450:])
+        for _ in range(10):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        data_files = [file for file in listdir(storage_test_config["data_folder_path"]) if file.startswith("data_")]
+        data_size = sum(os.path.getsize(storage_test_config["data_folder_path"] + file) for file in data_files)
+        storage.stop()
+
+        for file in listdir(storage_test_config["data_folder_path"]):
+            remove(storage_test_config["data_folder_path"] + "/" + file)
+        removedirs(storage_test_config["data_folder_path"])
+        self.assertListEqual(result, messages)
+        self.assertTrue(all(file.endswith(".zseg") for file in data_files))
+        self.assertLess(data_size, sum(len(message) for message in messages) / 2)
+
+    def test_sqlite_storage_compression(self):
+        makedirs("storage", exist_ok=True)
+        storage_test_config = {"data_file_path": "storage/compressed_data.db", "read_records_count": 10}
+        messages = [dumps({"deviceName": "Device %i" % (x % 3), "telemetry": [{"value": x}]}) for x in range(60)]
+        storage = SQLiteEventStorage(storage_test_config)
+        storage.put_batch(messages[:20])
+        storage.stop()
+
+        storage = SQLiteEventStorage({**storage_test_config, "compression": "lzma", "compression_block_size": 200})
+        storage.put_batch(messages[20:])
+        result = self._read_sqlite_storage(storage, 60)
+        storage.stop()
+
+        for file in listdir("storage"):
+            remove("storage/" + file)
+        removedirs("storage")
+        self.assertListEqual(result, messages)
+
+    def test_memory_storage_fair_drain(self):
+        storage = MemoryEventStorage({"max_records_count": 1000, "read_records_count": 10, "drain_policy": "fair"})
+        chatty_events = [dumps({"deviceName": "Chatty", "telemetry": [{"value": x}]}) for x in range(100)]
+        quiet_events = [dumps({"deviceName": "Quiet %i" % x, "telemetry": [{"value": x}]}) for x in range(5)]
+        storage.put_batch(chatty_events)
+        storage.put_batch(quiet_events)
+        self.assertEqual(set(storage.get_devices_oldest_pending_age()), {"Chatty"} | {"Quiet %i" % x for x in range(5)})
+
+        first_pack = storage.get_event_pack()
+        storage.event_pack_processing_done()
+        # Every device is served in the first pack, the chatty device gets the rest of the pack
+        self.assertEqual(sorted(first_pack), sorted(chatty_events[:5] + quiet_events))
+        result = []
+        events = storage.get_event_pack()
+        while events:
+            result.extend(events)
+            storage.event_pack_processing_done()
+            events = storage.get_event_pack()
+        self.assertListEqual(result, chatty_events[5:])
+        self.assertEqual(storage.get_statistics()["storageOldestPendingAgeMs"], 0)
+
+    def test_memory_storage_fair_drain_drop_oldest(self):
+        storage = MemoryEventStorage({"max_records_count": 4, "read_records_count": 10, "drain_policy": "fair",
+                                      "fair_quantum": 2, "overflow_policy": "drop_oldest"})
+        events = [dumps({"deviceName": "Device %i" % (x % 2), "telemetry": [{"value": x}]}) for x in range(6)]
+        storage.put_batch(events)
+        self.assertEqual(storage.dropped_count, 2)
+        self.assertListEqual(storage.get_event_pack(), [events[2], events[4], events[3], events[5]])
+
+    def test_lanes_storage_weighted_draining(self):
+        storage_test_config = {"max_records_count": 1000, "read_records_count": 5,
+                               "lanes": [{"name": "priority", "weight": 3, "kinds": ["attributes"]},
+                                         {"name": "bulk", "weight": 1, "default": True}]}
+        storage = LanesEventStorage(storage_test_config, MemoryEventStorage)
+        storage.put_batch(["bulk" + str(x) for x in range(100)])
+        storage.put_lane_batch(["priority" + str(x) for x in range(20)], "priority")
+        self.assertEqual(storage.len(), 120)
+
+        packs = []
+        for _ in range(8):
+            packs.append(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        priority_packs = [pack for pack in packs if pack[0].startswith("priority")]
+        self.assertEqual(len(priority_packs), 4)
+        self.assertListEqual([event for pack in priority_packs for event in pack],
+                             ["priority" + str(x) for x in range(20)])
+        # The bulk lane gets all reads when the priority lane is empty
+        self.assertTrue(all(pack[0].startswith("bulk") for pack in packs[6:]))
+
+        statistics = storage.get_statistics()
+        self.assertEqual(statistics["storagePriorityLaneBacklog"], 0)
+        self.assertEqual(statistics["storagePriorityLaneDrainedEvents"], 20)
+        self.assertEqual(statistics["storageBulkLaneBacklog"], 80)
+
+    def test_lanes_storage_routing(self):
+        storage_test_config = {"max_records_count": 1000, "read_records_count": 5,
+                               "lanes": [{"name": "attributes", "kinds": ["attributes", "gateway"]},
+                                         {"name": "can", "connectors": ["CAN"]},
+                                         {"name": "telemetry"}]}
+        storage = LanesEventStorage(storage_test_config, MemoryEventStorage)
+        data = {"deviceName": "Device", "attributes": [{"firmware": "1.0"}], "telemetry": [{"value": 1}]}
+
+        self.assertListEqual(storage.split_by_lanes("CAN", data), [("can", data)])
+        self.assertListEqual(storage.split_by_lanes("Gateway", data, True), [("attributes", data)])
+        self.assertListEqual(storage.split_by_lanes("MQTT", {**data, "telemetry": []}),
+                             [("attributes", {**data, "telemetry": []})])
+        self.assertListEqual(storage.split_by_lanes("MQTT", data),
+                             [("attributes", {**data, "telemetry": []}), ("telemetry", {**data, "attributes": []})])
+
+    def test_lanes_storage_rewind(self):
+        storage_test_config = {"max_records_count": 1000, "read_records_count": 2,
+                               "lanes": [{"name": "priority", "weight": 1}, {"name": "bulk", "weight": 1}]}
+        storage = LanesEventStorage(storage_test_config, MemoryEventStorage)
+        storage.put_lane_batch([str(x) for x in range(4)], "priority")
+        storage.put_lane_batch([str(x) for x in range(4, 8)], "bulk")
+
+        first_packs = [storage.get_event_pack(), storage.get_event_pack()]
+        storage.rewind()
+        self.assertListEqual([storage.get_event_pack(), storage.get_event_pack()], first_packs)
+        storage.event_pack_processing_done()
+        storage.event_pack_processing_done()
+        result = first_packs[0] + first_packs[1]
+        for _ in range(2):
+            result.extend(storage.get_event_pack())
+            storage.event_pack_processing_done()
+        self.assertListEqual(sorted(result), [str(x) for x in range(8)])
+        self.assertEqual(storage.len(), 0)
+
+    def test_lanes_storage_backlog_of_file_lanes(self):
+        storage_test_config = {"data_folder_path": "storage/lanes_data/",
+                               "max_file_count": 1000,
+                               "max_records_per_file": 10,
+                               "max_read_records_count": 10,
+                               "lanes": [{"name": "priority"}, {"name": "bulk", "default": True}]}
+        storage = LanesEventStorage(storage_test_config, FileEventStorage)
+        storage.put_lane_batch([str(x) for x in range(25)], "priority")
+        storage.put_batch([str(x) for x in range(3)])
+        lanes_state = storage.get_lanes_state()
+        statistics = storage.get_statistics()
+        storage.stop()
+
+        for folder in (storage_test_config["data_folder_path"] + "priority/", storage_test_config["data_folder_path"]):
+            for file in listdir(folder):
+                remove(folder + file)
+            removedirs(folder)
+        self.assertEqual(lanes_state["priority"]["backlog"], 25)
+        self.assertEqual(lanes_state["bulk"]["backlog"], 3)
+        self.assertEqual(statistics["storagePriorityLaneBacklog"], 25)
+
 
 if __name__ == '__main__':
     unittest.main()
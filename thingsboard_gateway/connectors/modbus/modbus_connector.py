@@ -75,6 +75,8 @@ from thingsboard_gateway.connectors.modbus.constants import *
 from thingsboard_gateway.connectors.modbus.slave import Slave
 from thingsboard_gateway.connectors.modbus.backward_compability_adapter import BackwardCompatibilityAdapter
 from thingsboard_gateway.connectors.modbus.bytes_modbus_downlink_converter import BytesModbusDownlinkConverter
+from thingsboard_gateway.gateway.backpressure import PollSlowDown
+from thingsboard_gateway.gateway.constant_enums import Status
 
 CONVERTED_DATA_SECTIONS = [ATTRIBUTES_PARAMETER, TELEMETRY_PARAMETER]
 FRAMER_TYPE = {
@@ -114,6 +116,7 @@ class ModbusConnector(Connector, Thread):
                            STATISTIC_MESSAGE_SENT_PARAMETER: 0}
         super().__init__()
         self.__gateway = gateway
+        self.__poll_slow_down = PollSlowDown(gateway)
         self._connector_type = connector_type
         self.__log = init_logger(self.__gateway, config.get('name', self.name),
                                  config.get('logLevel', 'INFO'))
@@ -225,7 +228,7 @@ class ModbusConnector(Connector, Thread):
     def __load_slaves(self):
         self.__slaves = [
             Slave(**{**device, 'connector': self, 'gateway': self.__gateway, 'logger': self.__log,
-                     'callback': ModbusConnector.callback}) for
+                     'callback': ModbusConnector.callback, 'poll_slow_down': self.__poll_slow_down}) for
             device in self.__config.get('master', {'slaves': []}).get('slaves', [])]
 
     @classmethod
@@ -296,8 +299,24 @@ class ModbusConnector(Connector, Thread):
             return to_send
 
     def _save_data(self, data):
-        self.__gateway.send_to_storage(self.get_name(), data)
-        self.statistics[STATISTIC_MESSAGE_SENT_PARAMETER] += 1
+        status = self.__poll_slow_down.on_send_status(self.__gateway.send_to_storage(self.get_name(), data))
+        if status == Status.SUCCESS:
+            self.statistics[STATISTIC_MESSAGE_SENT_PARAMETER] += 1
+        elif status == Status.BACKPRESSURE:
+            self.__forget_last_values(data)
+
+    def __forget_last_values(self, data):
+        # The rejected values are sent again by the next (stretched) polling, even if they don't change
+        for slave in self.__slaves:
+            if slave.name == data[DEVICE_NAME_PARAMETER]:
+                for converted_data_section in CONVERTED_DATA_SECTIONS:
+                    last_values = slave.config.get(LAST_PREFIX + converted_data_section)
+                    if not isinstance(last_values, dict):
+                        continue
+                    for item in data[converted_data_section]:
+                        for key in item:
+                            last_values.pop(key, None)
+                break
 
     def close(self):
         self.__stopped = True
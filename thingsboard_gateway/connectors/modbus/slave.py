@@ -30,6 +30,7 @@ class Slave(Thread):
         self.name = kwargs['deviceName']
         self._log = kwargs['logger']
         self.poll_period = kwargs['pollPeriod'] / 1000
+        self.poll_slow_down = kwargs.get('poll_slow_down')
 
         self.byte_order = kwargs.get('byteOrder', 'LITTLE')
         self.word_order = kwargs.get('wordOrder', 'LITTLE')
@@ -80,7 +81,10 @@ class Slave(Thread):
         self.last_polled_time = time()
 
         while not self.stop:
-            if time() - self.last_polled_time >= self.poll_period:
+            poll_period = self.poll_period
+            if self.poll_slow_down is not None:
+                poll_period = self.poll_slow_down.scale(poll_period)
+            if time() - self.last_polled_time >= poll_period:
                 self.callback(self)
                 self.last_polled_time = time()
 
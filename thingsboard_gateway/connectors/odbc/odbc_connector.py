@@ -37,6 +37,8 @@ except ImportError:
 from thingsboard_gateway.connectors.odbc.odbc_uplink_converter import OdbcUplinkConverter
 
 from thingsboard_gateway.connectors.connector import Connector
+from thingsboard_gateway.gateway.backpressure import PollSlowDown
+from thingsboard_gateway.gateway.constant_enums import Status
 from thingsboard_gateway.gateway.statistics_service import StatisticsService
 
 
@@ -58,6 +60,7 @@ class OdbcConnector(Connector, Thread):
         self.statistics = {'MessagesReceived': 0,
                            'MessagesSent': 0}
         self.__gateway = gateway
+        self.__poll_slow_down = PollSlowDown(gateway)
         self.__config = config
         self._log = init_logger(self.__gateway, self.name, self.__config.get('logLevel', 'INFO'))
         self._connector_type = connector_type
@@ -195,7 +198,8 @@ class OdbcConnector(Connector, Thread):
             try:
                 self.__poll()
                 if not self.__stopped:
-                    polling_period = self.__config["polling"].get("period", self.DEFAULT_POLL_PERIOD)
+                    polling_period = self.__poll_slow_down.scale(self.__config["polling"].get("period",
+                                                                                              self.DEFAULT_POLL_PERIOD))
                     self._log.debug("[%s] Next polling iteration will be in %d second(s)", self.get_name(), polling_period)
                     sleep(polling_period)
             except pyodbc.Warning as w:
@@ -233,7 +237,10 @@ class OdbcConnector(Connector, Thread):
         row_count = 0
         for row in rows:
             self._log.debug("[%s] Fetch row: %s", self.get_name(), row)
-            self.__process_row(row)
+            if not self.__process_row(row):
+                # The gateway is overloaded, the row is read again by the next (stretched) polling iteration
+                self._log.debug("[%s] Row is rejected by the backpressure, polling is paused", self.get_name())
+                break
             row_count += 1
 
         self.__iterator["total"] += row_count
@@ -244,6 +251,7 @@ class OdbcConnector(Connector, Thread):
             self.__save_iterator_config()
 
     def __process_row(self, row):
+        # Returns False if the data of the row was rejected by the backpressure, the iterator isn't advanced then
         try:
             data = self.row_to_dict(row)
 
@@ -268,10 +276,12 @@ class OdbcConnector(Connector, Thread):
                     self.__gateway.add_device(device_name, {"connector": self},
                                               device_type=device_type)
 
+                if self.__check_and_send(device_name, device_type, to_send) == Status.BACKPRESSURE:
+                    return False
                 self.__iterator["value"] = getattr(row, self.__iterator["name"])
-                self.__check_and_send(device_name, device_type, to_send)
         except Exception as e:
             self._log.warning("[%s] Failed to process database row: %s", self.get_name(), str(e))
+        return True
 
     @staticmethod
     def row_to_dict(row):
@@ -283,6 +293,8 @@ class OdbcConnector(Connector, Thread):
     def __check_and_send(self, device_name, device_type, new_data):
         self.statistics['MessagesReceived'] += 1
         to_send = {"attributes": [], "telemetry": []}
+        # The sent values are remembered only when the data is accepted by the gateway
+        changed_values = []
         send_on_change = self.__config["mapping"].get("sendDataOnlyOnChange", self.DEFAULT_SEND_IF_CHANGED)
         send_on_change_attributes = self.__config["mapping"].get("sendDataOnlyOnChangeAttributes")
         send_on_change_telemetry = self.__config["mapping"].get("sendDataOnlyOnChangeTelemetry")
@@ -291,17 +303,17 @@ class OdbcConnector(Connector, Thread):
             for tb_key in to_send.keys():
                 for key, new_value in new_data[tb_key].items():
                     if not send_on_change or self.__devices[device_name][tb_key].get(key, None) != new_value:
-                        self.__devices[device_name][tb_key][key] = new_value
+                        changed_values.append((tb_key, key, new_value))
                         to_send[tb_key].append({key: new_value})
         else:
             for key, new_value in new_data["attributes"].items():
                 if not send_on_change_attributes or self.__devices[device_name]["attributes"].get(key, None) != new_value:
-                    self.__devices[device_name]["attributes"][key] = new_value
+                    changed_values.append(("attributes", key, new_value))
                     to_send["attributes"].append({key: new_value})
 
             for key, new_value in new_data["telemetry"].items():
                 if not send_on_change_telemetry or self.__devices[device_name]["telemetry"].get(key, None) != new_value:
-                    self.__devices[device_name]["telemetry"][key] = new_value
+                    changed_values.append(("telemetry", key, new_value))
                     to_send["telemetry"].append({key: new_value})
 
         if to_send["attributes"] or to_send["telemetry"]:
@@ -313,8 +325,14 @@ class OdbcConnector(Connector, Thread):
             self._log.debug("[%s] Pushing to TB server '%s' device data: %s", self.get_name(), device_name, to_send)
 
             to_send['telemetry'] = [to_send['telemetry']]
-            self.__gateway.send_to_storage(self.get_name(), to_send)
-            self.statistics['MessagesSent'] += 1
+            status = self.__poll_slow_down.on_send_status(self.__gateway.send_to_storage(self.get_name(), to_send))
+            if status == Status.BACKPRESSURE:
+                return status
+            for (tb_key, key, new_value) in changed_values:
+                self.__devices[device_name][tb_key][key] = new_value
+            if status == Status.SUCCESS:
+                self.statistics['MessagesSent'] += 1
+            return status
         else:
             self._log.debug("[%s] '%s' device data has not been changed", self.get_name(), device_name)
 
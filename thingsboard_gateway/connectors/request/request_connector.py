@@ -35,6 +35,8 @@ from requests.auth import HTTPBasicAuth
 from requests.exceptions import RequestException
 
 from thingsboard_gateway.connectors.connector import Connector
+from thingsboard_gateway.gateway.backpressure import PollSlowDown
+from thingsboard_gateway.gateway.constant_enums import Status
 from thingsboard_gateway.connectors.request.json_request_uplink_converter import JsonRequestUplinkConverter
 from thingsboard_gateway.connectors.request.json_request_downlink_converter import JsonRequestDownlinkConverter
 
@@ -51,6 +53,7 @@ class RequestConnector(Connector, Thread):
         self.__config = config
         self._connector_type = connector_type
         self.__gateway = gateway
+        self.__poll_slow_down = PollSlowDown(gateway)
         self.setName(self.__config.get("name", "".join(choice(ascii_lowercase) for _ in range(5))))
         self._log = init_logger(self.__gateway, self.name, self.__config.get('logLevel', 'INFO'))
         self.__security = HTTPBasicAuth(self.__config["security"]["username"], self.__config["security"]["password"]) if \
@@ -205,7 +208,7 @@ class RequestConnector(Connector, Thread):
     def __send_request(self, request, converter_queue, logger):
         url = ""
         try:
-            request["next_time"] = time() + request["config"].get("scanPeriod", 10)
+            request["next_time"] = time() + self.__poll_slow_down.scale(request["config"].get("scanPeriod", 10))
             request_url_from_config = request["config"]["url"]
             request_url_from_config = str('/' + request_url_from_config) if request_url_from_config[
                                                                                 0] != '/' else request_url_from_config
@@ -291,14 +294,19 @@ class RequestConnector(Connector, Thread):
 
     def __process_data(self):
         try:
-            if not self.__convert_queue.empty():
-                data = self.__convert_queue.get()
-                self.__gateway.send_to_storage(self.get_name(), data)
-                self.statistics["MessagesSent"] = self.statistics["MessagesSent"] + 1
+            # The data rejected by the gateway is sent again before the newer data from the queue
+            if self.__poll_slow_down.retry_held_data(self.__send_to_storage) and not self.__convert_queue.empty():
+                self.__poll_slow_down.send(self.__send_to_storage, self.__convert_queue.get())
 
         except Exception as e:
             self._log.exception(e)
 
+    def __send_to_storage(self, data):
+        status = self.__gateway.send_to_storage(self.get_name(), data)
+        if status == Status.SUCCESS:
+            self.statistics["MessagesSent"] = self.statistics["MessagesSent"] + 1
+        return status
+
     def get_name(self):
         return self.name
 
@@ -21,6 +21,8 @@ from threading import Thread
 from time import sleep, time
 
 from thingsboard_gateway.connectors.connector import Connector
+from thingsboard_gateway.gateway.backpressure import PollSlowDown
+from thingsboard_gateway.gateway.constant_enums import Status
 from thingsboard_gateway.tb_utility.tb_loader import TBModuleLoader
 from thingsboard_gateway.tb_utility.tb_utility import TBUtility
 from thingsboard_gateway.tb_utility.tb_logger import init_logger
@@ -49,6 +51,7 @@ class SNMPConnector(Connector, Thread):
         super().__init__()
         self.daemon = True
         self.__gateway = gateway
+        self.__poll_slow_down = PollSlowDown(gateway)
         self._connected = False
         self.__stopped = False
         self._connector_type = connector_type
@@ -83,9 +86,12 @@ class SNMPConnector(Connector, Thread):
     async def _run(self):
         while not self.__stopped:
             current_time = time() * 1000
-            for device in self.__devices:
+            # Devices are not polled until the data rejected by the gateway is sent
+            devices = self.__devices if self.__poll_slow_down.retry_held_data(self.__send_to_storage) else ()
+            for device in devices:
                 try:
-                    if device.get("previous_poll_time", 0) + device.get("pollPeriod", 10000) < current_time:
+                    poll_period = self.__poll_slow_down.scale(device.get("pollPeriod", 10000))
+                    if device.get("previous_poll_time", 0) + poll_period < current_time:
                         await self.__process_data(device)
                         device["previous_poll_time"] = current_time
                 except Exception as e:
@@ -113,8 +119,13 @@ class SNMPConnector(Connector, Thread):
 
     def collect_statistic_and_send(self, connector_name, data):
         self.statistics["MessagesReceived"] = self.statistics["MessagesReceived"] + 1
-        self.__gateway.send_to_storage(connector_name, data)
-        self.statistics["MessagesSent"] = self.statistics["MessagesSent"] + 1
+        self.__poll_slow_down.send(self.__send_to_storage, data)
+
+    def __send_to_storage(self, data):
+        status = self.__gateway.send_to_storage(self.get_name(), data)
+        if status == Status.SUCCESS:
+            self.statistics["MessagesSent"] = self.statistics["MessagesSent"] + 1
+        return status
 
     async def __process_data(self, device):
         common_parameters = self.__get_common_parameters(device)
@@ -0,0 +1,131 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+from logging import getLogger
+from threading import Condition
+from time import monotonic
+
+from thingsboard_gateway.gateway.constant_enums import Status
+
+log = getLogger("service")
+
+
+class BackpressureController:
+    """
+    Flow control between connectors and the storage.
+    Data is rejected since the converted data queues depth reaches the high watermark or the storage is full,
+    and accepted again when the depth drops to the low watermark and the storage has free space.
+    It is disabled by default: most of the push connectors ignore the send status, so the rejected data is lost.
+    """
+
+    def __init__(self, config, get_queue_depth, is_storage_full):
+        self.__enabled = config.get('enable', False)
+        self.__high_watermark = max(int(config.get('highWatermark', 10000)), 1)
+        self.__low_watermark = min(max(int(config.get('lowWatermark', self.__high_watermark // 2)), 0),
+                                   self.__high_watermark)
+        self.__block_timeout = max(config.get('blockTimeoutMs', 0), 0) / 1000
+        self.__poll_period_multiplier = max(float(config.get('pollPeriodMultiplier', 4)), 1)
+        self.__get_queue_depth = get_queue_depth
+        self.__is_storage_full = is_storage_full
+        self.__condition = Condition()
+        self.__throttled = False
+        self.throttle_count = 0
+        self.rejected_count = 0
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def is_throttled(self):
+        return self.__throttled
+
+    def get_poll_period_multiplier(self):
+        return self.__poll_period_multiplier if self.__throttled else 1
+
+    def update(self):
+        # Called on every put and by the storage fill threads to release the connectors waiting for the capacity
+        if not self.__enabled:
+            return False
+        queue_depth = self.__get_queue_depth()
+        with self.__condition:
+            if not self.__throttled:
+                if queue_depth >= self.__high_watermark or self.__is_storage_full():
+                    self.__throttled = True
+                    self.throttle_count += 1
+                    log.warning("Backpressure is on: converted data queue depth is %i, storage is full: %r",
+                                queue_depth, self.__is_storage_full())
+            elif queue_depth <= self.__low_watermark and not self.__is_storage_full():
+                self.__throttled = False
+                self.__condition.notify_all()
+                log.info("Backpressure is off: converted data queue depth is %i", queue_depth)
+            return self.__throttled
+
+    def acquire(self):
+        # Returns SUCCESS when data may be put to the queue, waiting up to the block timeout for the capacity
+        if not self.update():
+            return Status.SUCCESS
+        if self.__block_timeout:
+            with self.__condition:
+                self.__condition.wait_for(lambda: not self.__throttled, self.__block_timeout)
+            if not self.update():
+                return Status.SUCCESS
+        with self.__condition:
+            self.rejected_count += 1
+        return Status.BACKPRESSURE
+
+
+class PollSlowDown:
+    """
+    Slow-down hook for polling connectors, the poll period is stretched while the gateway answers with BACKPRESSURE.
+    The data which can't be polled again is held when it is rejected and sent again after the retry period,
+    before any newer data of the connector.
+    """
+
+    def __init__(self, gateway, retry_period=.2):
+        self.__gateway = gateway
+        self.__retry_period = retry_period
+        self.__held_data = deque()
+        self.__next_retry = 0
+        self.multiplier = 1
+
+    def on_send_status(self, status):
+        if status == Status.BACKPRESSURE:
+            self.multiplier = self.__gateway.get_poll_period_multiplier()
+        elif status is not None:
+            self.multiplier = 1
+        return status
+
+    def scale(self, period):
+        return period * self.multiplier
+
+    def send(self, send_callback, data):
+        # Sends the data with the callback returning the send status, the rejected data is held
+        if self.__held_data:
+            status = Status.BACKPRESSURE
+        else:
+            status = self.on_send_status(send_callback(data))
+        if status == Status.BACKPRESSURE:
+            if not self.__held_data:
+                self.__next_retry = monotonic() + self.scale(self.__retry_period)
+            self.__held_data.append(data)
+        return status
+
+    def retry_held_data(self, send_callback):
+        # Sends the held data in the original order, returns True when nothing is held anymore
+        while self.__held_data and monotonic() >= self.__next_retry:
+            if self.on_send_status(send_callback(self.__held_data[0])) == Status.BACKPRESSURE:
+                self.__next_retry = monotonic() + self.scale(self.__retry_period)
+                break
+            self.__held_data.popleft()
+        return not self.__held_data
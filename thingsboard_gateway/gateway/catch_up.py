@@ -0,0 +1,186 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import OrderedDict
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+
+log = getLogger("service")
+
+
+class LastValueCache:
+    """
+    Latest attributes and the latest value of every telemetry key of the devices.
+    Devices changed since the previous "pop_changed" call are tracked while the tracking is on.
+    The least recently updated devices are forgotten when there are more than "max_devices" of them.
+    """
+
+    def __init__(self, max_devices=10000):
+        self.__max_devices = max(int(max_devices), 1)
+        # Device name -> (attributes, telemetry key -> (ts, value))
+        self.__devices = OrderedDict()
+        self.__changed_devices = set()
+        self.__lock = Lock()
+        self.track_changes = False
+
+    def __len__(self):
+        return len(self.__devices)
+
+    def update(self, data):
+        # Takes the converted data with the telemetry in the "ts" format
+        device_name = data["deviceName"]
+        telemetry = data.get("telemetry") or []
+        if isinstance(telemetry, dict):
+            telemetry = [telemetry]
+        with self.__lock:
+            device_values = self.__devices.get(device_name)
+            if device_values is None:
+                device_values = self.__devices[device_name] = ({}, {})
+                if len(self.__devices) > self.__max_devices:
+                    self.__changed_devices.discard(self.__devices.popitem(last=False)[0])
+            else:
+                self.__devices.move_to_end(device_name)
+            (attributes, latest_telemetry) = device_values
+            for item in data.get("attributes") or []:
+                attributes.update(item)
+            for item in telemetry:
+                ts = item["ts"]
+                for (key, value) in item["values"].items():
+                    latest = latest_telemetry.get(key)
+                    if latest is None or latest[0] <= ts:
+                        latest_telemetry[key] = (ts, value)
+            if self.track_changes:
+                self.__changed_devices.add(device_name)
+
+    def pop_changed(self):
+        # Returns the latest values of the changed devices in the converted data format and forgets the changes
+        with self.__lock:
+            changed_devices = self.__changed_devices
+            self.__changed_devices = set()
+            result = {}
+            for device_name in changed_devices:
+                (attributes, latest_telemetry) = self.__devices[device_name]
+                telemetry = {}
+                for (key, (ts, value)) in latest_telemetry.items():
+                    telemetry.setdefault(ts, {})[key] = value
+                result[device_name] = {"attributes": dict(attributes),
+                                       "telemetry": [{"ts": ts, "values": values} for (ts, values) in telemetry.items()]}
+            return result
+
+    def get_attributes(self, device_names):
+        # Returns the latest attributes of the devices in the converted data format
+        with self.__lock:
+            result = {}
+            for device_name in device_names:
+                device_values = self.__devices.get(device_name)
+                if device_values is not None and device_values[0]:
+                    result[device_name] = {"attributes": dict(device_values[0]), "telemetry": []}
+            return result
+
+
+class CatchUpController:
+    """
+    Latest-value-first catch-up after reconnect.
+    While ThingsBoard is disconnected the devices with new data are remembered. If the storage has a backlog after
+    reconnect, the latest values of these devices are published at once, the values of the devices updated later
+    are published every live update period and the backlog is backfilled at the paced rate in parallel.
+    The catch-up ends when the backlog drops below the threshold.
+    Attributes have no timestamps, so the backfilled ones overwrite the live ones on ThingsBoard. That's why the latest
+    attributes of the devices sent live are sent once again, when the backlog is drained after the catch-up.
+    """
+
+    def __init__(self, config, get_backlog):
+        self.__enabled = config.get('enable', False)
+        self.__backfill_rate = max(float(config.get('backfillEventsPerSecond', 0)), 0)
+        self.__live_update_period = max(config.get('liveUpdatePeriodMs', 1000), 0) / 1000
+        self.__min_backlog = max(int(config.get('minBacklogEvents', 1)), 1)
+        self.__get_backlog = get_backlog
+        self.cache = LastValueCache(config.get('maxDevices', 10000))
+        self.__active = False
+        self.__next_live_update = 0
+        self.__next_backfill = 0
+        self.__live_devices = set()
+        self.catch_up_count = 0
+        self.live_updates_count = 0
+        self.backfilled_count = 0
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def is_active(self):
+        return self.__active
+
+    def update(self, data):
+        if self.__enabled:
+            self.cache.update(data)
+
+    def set_connected(self, connected):
+        if not self.__enabled:
+            return
+        if not connected:
+            self.cache.track_changes = True
+            return
+        backlog = self.__get_backlog()
+        if backlog >= self.__min_backlog:
+            self.__active = True
+            self.__next_live_update = 0
+            self.__next_backfill = 0
+            self.catch_up_count += 1
+            self.backfilled_count = 0
+            log.info("Catching up: the latest values are sent first, %i stored event(s) will be backfilled.", backlog)
+        else:
+            self.cache.track_changes = False
+            self.cache.pop_changed()
+
+    def get_live_values(self):
+        # Returns the latest values to publish, if it is time for the live update
+        if not self.__active and not self.__live_devices:
+            return None
+        now = monotonic()
+        if now < self.__next_live_update:
+            return None
+        self.__next_live_update = now + self.__live_update_period
+        if not self.__active:
+            return self.__pop_attributes_refresh()
+        if self.__get_backlog() < self.__min_backlog:
+            self.__active = False
+            self.cache.track_changes = False
+            log.info("Caught up: %i stored event(s) were backfilled.", self.backfilled_count)
+        values = self.cache.pop_changed()
+        if values:
+            self.live_updates_count += 1
+            self.__live_devices.update(values)
+        return values
+
+    def __pop_attributes_refresh(self):
+        # The stale attributes of the backlog are overwritten once it is drained
+        if self.__get_backlog():
+            return None
+        values = self.cache.get_attributes(self.__live_devices)
+        self.__live_devices = set()
+        if values:
+            self.live_updates_count += 1
+            log.debug("Latest attributes of %i device(s) are sent again after the backfill.", len(values))
+        return values
+
+    def is_backfill_allowed(self):
+        return not self.__active or monotonic() >= self.__next_backfill
+
+    def on_backfill(self, events_count):
+        if not self.__active:
+            return
+        self.backfilled_count += events_count
+        if self.__backfill_rate:
+            self.__next_backfill = max(self.__next_backfill, monotonic()) + events_count / self.__backfill_rate
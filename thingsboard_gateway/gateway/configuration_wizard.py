@@ -185,14 +185,6 @@ def configure():
                 'validate': NumberValidator,
                 'filter': lambda val: int(val)
             },
-            {
-                'type': 'input',
-                'name': 'minPackSizeToSend',
-                'message': 'Minimal pack size for sending (bytes):',
-                'default': str(default_config['thingsboard']['minPackSizeToSend']),
-                'validate': NumberValidator,
-                'filter': lambda val: int(val)
-            },
             {
                 'type': 'confirm',
                 'name': 'handleDeviceRenaming',
@@ -28,6 +28,7 @@ CONFIG_SERVER_SECTION_PARAMETER = "server"
 CONFIG_DEVICES_SECTION_PARAMETER = "devices"
 
 CONNECTED_DEVICES_FILENAME = "connected_devices.json"
+CONNECTED_DEVICES_JOURNAL_FILENAME = "connected_devices.journal"
 PERSISTENT_GRPC_CONNECTORS_KEY_FILENAME = "persistent_keys.json"
 
 # Data parameter constants
@@ -0,0 +1,204 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from logging import getLogger
+from os import fsync, path, rename, replace
+from threading import RLock
+
+from simplejson import JSONDecodeError, dumps, load, loads
+
+log = getLogger("service")
+
+DEVICE_CONNECTOR_INDEX = 0
+DEVICE_TYPE_INDEX = 1
+DEVICE_RENAMED_NAME_INDEX = 2
+
+MIN_RECORDS_COUNT_TO_COMPACT = 10000
+
+
+class DeviceRegistry:
+    """
+    Persistent registry of the connected devices.
+    Every change is appended to a journal file as one line, the journal is compacted when it contains
+    twice more records than devices. Devices are also indexed by the connector name.
+    Every device is stored in the format of the connected devices file: [connector name, device type(, renamed name)].
+    """
+
+    def __init__(self, journal_file_path, legacy_file_path=None):
+        self.__journal_file_path = journal_file_path
+        self.__legacy_file_path = legacy_file_path
+        self.__lock = RLock()
+        self.__devices = {}
+        self.__devices_by_connector = {}
+        self.__journal_file = None
+        self.__journal_records_count = 0
+
+    def load(self):
+        with self.__lock:
+            self.__devices.clear()
+            self.__devices_by_connector.clear()
+            migrate = not path.exists(self.__journal_file_path) and self.__legacy_file_path is not None \
+                and path.exists(self.__legacy_file_path)
+            if migrate:
+                self.__read_legacy_file()
+            elif path.exists(self.__journal_file_path):
+                self.__read_journal()
+            self.compact()
+            if migrate:
+                # The legacy file is kept as a backup only after the journal is written
+                try:
+                    rename(self.__legacy_file_path, self.__legacy_file_path + '.bak')
+                except OSError as e:
+                    log.warning("Failed to rename migrated connected devices file: %s", e)
+                log.info("Migrated %i device(s) from %s.", len(self.__devices), self.__legacy_file_path)
+            return self.__devices
+
+    def put(self, device_name, connector_name, device_type, renamed_name=None):
+        device = [connector_name, device_type] if renamed_name is None else [connector_name, device_type, renamed_name]
+        with self.__lock:
+            if self.__devices.get(device_name) == device:
+                return False
+            self.__set_device(device_name, device)
+            self.__append({"device": device_name, "data": device})
+            return True
+
+    def put_batch(self, devices):
+        # Changed devices from the batch of (device name, connector name, device type, renamed name) are appended at once
+        records = []
+        with self.__lock:
+            for (device_name, connector_name, device_type, renamed_name) in devices:
+                device = [connector_name, device_type] if renamed_name is None \
+                    else [connector_name, device_type, renamed_name]
+                if self.__devices.get(device_name) != device:
+                    self.__set_device(device_name, device)
+                    records.append({"device": device_name, "data": device})
+            if records:
+                self.__append(*records)
+        return len(records)
+
+    def rename(self, device_name, renamed_name):
+        with self.__lock:
+            device = self.__devices.get(device_name)
+            if device is None:
+                return False
+            return self.put(device_name, device[DEVICE_CONNECTOR_INDEX], device[DEVICE_TYPE_INDEX], renamed_name)
+
+    def delete(self, device_name):
+        with self.__lock:
+            if device_name not in self.__devices:
+                return False
+            self.__remove_device(device_name)
+            self.__append({"device": device_name, "deleted": True})
+            return True
+
+    def retain_connectors(self, connector_names):
+        # Devices of the other connectors are deleted at once, returns the count of the deleted devices
+        with self.__lock:
+            deleted_devices = [device_name for (connector_name, devices) in self.__devices_by_connector.items()
+                               if connector_name not in connector_names for device_name in devices]
+            for device_name in deleted_devices:
+                self.__remove_device(device_name)
+            if deleted_devices:
+                self.__append(*({"device": device_name, "deleted": True} for device_name in deleted_devices))
+        return len(deleted_devices)
+
+    def get(self, device_name):
+        return self.__devices.get(device_name)
+
+    def get_devices(self, connector_name):
+        with self.__lock:
+            return dict(self.__devices_by_connector.get(connector_name, {}))
+
+    def compact(self):
+        # The journal is rewritten with the current state of the devices and atomically replaces the previous one
+        with self.__lock:
+            self.__close_journal()
+            temp_file_path = self.__journal_file_path + '.tmp'
+            with open(temp_file_path, 'w') as journal_file:
+                journal_file.writelines(dumps({"device": device_name, "data": device}) + '\n'
+                                        for (device_name, device) in self.__devices.items())
+                journal_file.flush()
+                fsync(journal_file.fileno())
+            replace(temp_file_path, self.__journal_file_path)
+            self.__journal_records_count = len(self.__devices)
+            log.debug("Devices journal compacted, %i device(s) saved.", self.__journal_records_count)
+
+    def close(self):
+        with self.__lock:
+            self.__close_journal()
+
+    def __len__(self):
+        return len(self.__devices)
+
+    def __contains__(self, device_name):
+        return device_name in self.__devices
+
+    def __set_device(self, device_name, device):
+        previous_device = self.__devices.get(device_name)
+        if previous_device is not None and previous_device[DEVICE_CONNECTOR_INDEX] != device[DEVICE_CONNECTOR_INDEX]:
+            self.__remove_device(device_name)
+        self.__devices[device_name] = device
+        self.__devices_by_connector.setdefault(device[DEVICE_CONNECTOR_INDEX], {})[device_name] = \
+            device[DEVICE_TYPE_INDEX]
+
+    def __remove_device(self, device_name):
+        device = self.__devices.pop(device_name)
+        connector_devices = self.__devices_by_connector.get(device[DEVICE_CONNECTOR_INDEX], {})
+        connector_devices.pop(device_name, None)
+        if not connector_devices:
+            self.__devices_by_connector.pop(device[DEVICE_CONNECTOR_INDEX], None)
+
+    def __append(self, *records):
+        if self.__journal_file is None:
+            self.__journal_file = open(self.__journal_file_path, 'a')
+        self.__journal_file.write(''.join(dumps(record) + '\n' for record in records))
+        self.__journal_file.flush()
+        self.__journal_records_count += len(records)
+        if self.__journal_records_count >= max(MIN_RECORDS_COUNT_TO_COMPACT, 2 * len(self.__devices)):
+            self.compact()
+
+    def __close_journal(self):
+        if self.__journal_file is not None:
+            self.__journal_file.close()
+            self.__journal_file = None
+
+    def __read_journal(self):
+        with open(self.__journal_file_path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    record = loads(line)
+                    if record.get("deleted"):
+                        if record["device"] in self.__devices:
+                            self.__remove_device(record["device"])
+                    else:
+                        self.__set_device(record["device"], record["data"])
+                except (JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+                    # The last record may be incomplete if the gateway was stopped while writing it
+                    log.warning("Skipped invalid record in the devices journal: %r", line)
+        log.debug("Loaded %i device(s) from the devices journal.", len(self.__devices))
+
+    def __read_legacy_file(self):
+        devices = None
+        if path.getsize(self.__legacy_file_path) > 0:
+            try:
+                with open(self.__legacy_file_path, 'r') as legacy_file:
+                    devices = load(legacy_file)
+            except Exception as e:
+                log.exception(e)
+        if isinstance(devices, dict):
+            for (device_name, device) in devices.items():
+                if isinstance(device, list) and len(device) > DEVICE_TYPE_INDEX:
+                    self.__set_device(device_name, device)
+                else:
+                    log.debug("Old connected devices format, device %s is skipped", device_name)
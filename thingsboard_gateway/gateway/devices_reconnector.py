@@ -0,0 +1,106 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from logging import getLogger
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+
+from thingsboard_gateway.gateway.token_bucket import TokenBucket
+
+log = getLogger("service")
+
+
+class DevicesReconnector:
+    """
+    Connects the saved devices again after the gateway reconnects to ThingsBoard.
+    Devices are processed by batches in a separate thread, connect messages are paced with a token bucket,
+    and every batch waits while telemetry packs are being published.
+    """
+
+    def __init__(self, config, connect_device, batch_done, is_telemetry_pending=None):
+        self.__bucket = TokenBucket(config.get('connectsPerSecond', 100), config.get('burst'))
+        self.__batch_size = max(int(config.get('batchSize', 100)), 1)
+        self.__max_telemetry_wait = max(config.get('maxTelemetryWaitMs', 1000), 0) / 1000
+        self.__connect_device = connect_device
+        self.__batch_done = batch_done
+        self.__is_telemetry_pending = is_telemetry_pending
+        self.__lock = Lock()
+        self.__pending_devices = []
+        self.__new_devices_event = Event()
+        self.__stopped = False
+        self.connected_devices_count = 0
+        self.__thread = Thread(target=self.__run, name="Devices reconnect thread", daemon=True)
+        self.__thread.start()
+
+    def reconnect(self, devices):
+        # Devices left from the previous reconnect are replaced, every device is connected once
+        with self.__lock:
+            self.__pending_devices = list(devices)
+        self.__new_devices_event.set()
+        log.info("%i device(s) will be reconnected.", len(devices))
+
+    def cancel(self):
+        with self.__lock:
+            self.__pending_devices = []
+
+    def is_in_progress(self):
+        return bool(self.__pending_devices)
+
+    def get_pending_devices_count(self):
+        return len(self.__pending_devices)
+
+    def stop(self):
+        self.__stopped = True
+        self.cancel()
+        self.__new_devices_event.set()
+
+    def __next_batch(self):
+        with self.__lock:
+            batch = self.__pending_devices[:self.__batch_size]
+            self.__pending_devices = self.__pending_devices[self.__batch_size:]
+            return batch
+
+    def __wait_for_telemetry(self):
+        if self.__is_telemetry_pending is None:
+            return
+        wait_until = monotonic() + self.__max_telemetry_wait
+        while not self.__stopped and self.__is_telemetry_pending() and monotonic() < wait_until:
+            sleep(.01)
+
+    def __run(self):
+        while not self.__stopped:
+            self.__new_devices_event.wait()
+            self.__new_devices_event.clear()
+            batch = self.__next_batch()
+            while batch and not self.__stopped:
+                self.__wait_for_telemetry()
+                connected_devices = []
+                for device in batch:
+                    wait_time = self.__bucket.get_wait_time()
+                    while wait_time > 0 or not self.__bucket.consume():
+                        sleep(wait_time or .001)
+                        wait_time = self.__bucket.get_wait_time()
+                    try:
+                        if self.__connect_device(*device):
+                            connected_devices.append(device)
+                    except Exception as e:
+                        log.exception(e)
+                try:
+                    self.__batch_done(connected_devices)
+                except Exception as e:
+                    log.exception(e)
+                self.connected_devices_count += len(connected_devices)
+                batch = self.__next_batch()
+            if not self.__pending_devices:
+                log.debug("Devices reconnect finished.")
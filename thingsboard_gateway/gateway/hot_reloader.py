@@ -12,7 +12,12 @@ class HotReloader:
         self._file_pattern = r'^(?!.*.(pyc|log|\d)$).*$'
         self._exclude_files = [
             'connected_devices.json',
-            'persistent_keys.json'
+            'connected_devices.json.bak',
+            'connected_devices.journal',
+            'connected_devices.journal.tmp',
+            'persistent_keys.json',
+            'persistent_session.json',
+            'persistent_session.json.tmp'
         ]
         self._runnable_function = function
         self._poll_interval = 1
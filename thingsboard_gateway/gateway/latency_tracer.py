@@ -0,0 +1,135 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from collections import deque
+from threading import local
+from time import time
+
+from thingsboard_gateway.gateway.metrics import MetricsRegistry, Sampler
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000, 300000)
+
+# A trace is a list of the connector name and the timestamps of the stages, so it is kept in the JSON events
+TRACE_CONNECTOR = 0
+TRACE_RECEIVED = 1
+TRACE_CONVERTED = 2
+TRACE_SENT_TO_STORAGE = 3
+TRACE_STORAGE_PUT = 4
+TRACE_STORAGE_READ = 5
+TRACE_PUBLISHED = 6
+TRACE_ACKNOWLEDGED = 7
+
+# Stage name, the stamp it starts with and the stamp it ends with
+TRACE_STAGES = (
+    ('convert', TRACE_RECEIVED, TRACE_CONVERTED),
+    ('handOff', TRACE_CONVERTED, TRACE_SENT_TO_STORAGE),
+    ('fillQueue', TRACE_SENT_TO_STORAGE, TRACE_STORAGE_PUT),
+    ('storage', TRACE_STORAGE_PUT, TRACE_STORAGE_READ),
+    ('publish', TRACE_STORAGE_READ, TRACE_PUBLISHED),
+    ('ack', TRACE_PUBLISHED, TRACE_ACKNOWLEDGED),
+    ('total', TRACE_RECEIVED, TRACE_ACKNOWLEDGED),
+)
+
+_conversion_stamps = local()
+
+
+def stamp_conversion(received_at, converted_at):
+    _conversion_stamps.value = (received_at, converted_at)
+
+
+def pop_conversion_stamps():
+    stamps = getattr(_conversion_stamps, 'value', None)
+    if stamps is not None:
+        _conversion_stamps.value = None
+    return stamps
+
+
+def stamp(trace, stage_index, timestamp=None):
+    trace[stage_index] = timestamp if timestamp is not None else time()
+
+
+class LatencyTracer:
+    """
+    Latency of the uplink messages on their way from the connector to ThingsBoard.
+    Every N-th message, where N is the sampling period, is traced: it is stamped when its conversion starts and ends
+    (the converters statistics decorator stamps them in the connector thread), when the connector sends it to
+    the storage, when it is put to the storage, read from it and published, and when its pack is acknowledged.
+    The durations of the stages of the acknowledged traces are added to the histograms of the connector,
+    the last full traces are kept for the shell. The histograms are registered in the passed metrics registry,
+    so they are sent with its periodic telemetry.
+    """
+
+    trace_conversions = False
+
+    def __init__(self, config, registry=None):
+        self.__enabled = config.get('enable', False)
+        self.__sampler = Sampler(config.get('samplingPeriod', 100))
+        self.__registry = registry if registry is not None else MetricsRegistry()
+        self.__histograms = {}
+        self.__last_traces = deque(maxlen=max(int(config.get('maxTraces', 20)), 0))
+        LatencyTracer.trace_conversions = self.__enabled
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def start(self, connector_name):
+        """Returns a new trace for every N-th message or None for the rest."""
+        # The stamps of the conversion are taken out even if the message is not traced, so they never get stale
+        conversion_stamps = pop_conversion_stamps()
+        if not self.__enabled or not self.__sampler.is_sampled():
+            return None
+        now = time()
+        (received_at, converted_at) = conversion_stamps if conversion_stamps is not None else (now, now)
+        return [connector_name, received_at, converted_at, now, None, None, None, None]
+
+    def complete(self, trace, acknowledged_at=None):
+        stamp(trace, TRACE_ACKNOWLEDGED, acknowledged_at)
+        histograms = self.__get_connector_histograms(trace[TRACE_CONNECTOR])
+        durations = {}
+        for (stage, start_index, end_index) in TRACE_STAGES:
+            if trace[start_index] is None or trace[end_index] is None:
+                continue
+            duration = max(trace[end_index] - trace[start_index], 0) * 1000
+            histograms[stage].observe(duration)
+            durations[stage] = round(duration, 3)
+        self.__last_traces.append({"connector": trace[TRACE_CONNECTOR],
+                                   "receivedAt": int(trace[TRACE_RECEIVED] * 1000),
+                                   "stagesMs": durations})
+
+    def __get_connector_histograms(self, connector_name):
+        histograms = self.__histograms.get(connector_name)
+        if histograms is None:
+            connector_camel_case = str(connector_name).replace(' ', '')
+            histograms = {stage: self.__registry.histogram('latency%s%s' % (connector_camel_case,
+                                                                            stage[0].upper() + stage[1:]),
+                                                           LATENCY_BUCKETS_MS)
+                          for (stage, _, _) in TRACE_STAGES}
+            self.__histograms[connector_name] = histograms
+        return histograms
+
+    def get_state(self):
+        connectors = {}
+        for (connector_name, histograms) in tuple(self.__histograms.items()):
+            connectors[connector_name] = {}
+            for (stage, histogram) in histograms.items():
+                snapshot = histogram.get_snapshot()
+                connectors[connector_name][stage] = {
+                    "count": snapshot[1],
+                    "p50": round(histogram.get_quantile(.5, snapshot), 3),
+                    "p95": round(histogram.get_quantile(.95, snapshot), 3),
+                    "p99": round(histogram.get_quantile(.99, snapshot), 3)
+                }
+        return {"enabled": self.__enabled,
+                "samplingPeriod": self.__sampler.period,
+                "connectors": connectors,
+                "lastTraces": list(self.__last_traces)}
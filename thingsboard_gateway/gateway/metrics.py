@@ -0,0 +1,233 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from bisect import bisect_left
+from threading import Lock, local
+
+DEFAULT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+HISTOGRAM_QUANTILES = ((.5, 'P50'), (.95, 'P95'), (.99, 'P99'))
+DEFAULT_SIZE_SAMPLING_PERIOD = 10
+
+
+class _ThreadCells:
+    """
+    Values written by every thread into its own cell, so the writers never contend and take no lock.
+    The lock is only taken once per thread to register its cell. Readers sum the cells, a reset stores the current
+    sums as the offset instead of touching the cells of the other threads.
+    """
+
+    def __init__(self, size):
+        self._local = local()
+        self.__size = size
+        self.__cells = []
+        self.__cells_lock = Lock()
+        self.__offset = [0] * size
+
+    def _add_cell(self):
+        cell = [0] * self.__size
+        with self.__cells_lock:
+            self.__cells.append(cell)
+        self._local.cell = cell
+        return cell
+
+    def __get_totals(self):
+        totals = [0] * self.__size
+        for cell in tuple(self.__cells):
+            for index in range(self.__size):
+                totals[index] += cell[index]
+        return totals
+
+    def _get_values(self):
+        return [total - offset for (total, offset) in zip(self.__get_totals(), self.__offset)]
+
+    def reset(self):
+        self.__offset = self.__get_totals()
+
+
+class Counter(_ThreadCells):
+    def __init__(self, name):
+        super().__init__(1)
+        self.name = name
+
+    def inc(self, value=1):
+        try:
+            self._local.cell[0] += value
+        except AttributeError:
+            self._add_cell()[0] += value
+
+    def get_value(self):
+        return self._get_values()[0]
+
+    def collect(self):
+        return {self.name: self.get_value()}
+
+
+class Gauge:
+    """
+    The last set value or, when the function is passed, its result at the moment of reading.
+    """
+
+    def __init__(self, name, function=None):
+        self.name = name
+        self.__function = function
+        self.__value = 0
+
+    def set(self, value):
+        self.__value = value
+
+    def get_value(self):
+        if self.__function is not None:
+            return self.__function()
+        return self.__value
+
+    def reset(self):
+        pass
+
+    def collect(self):
+        return {self.name: self.get_value()}
+
+
+class Histogram(_ThreadCells):
+    """
+    Counts of the observed values per fixed bucket plus their sum. A value goes to the first bucket whose upper bound
+    is not less than it, the values above the last bound go to the overflow bucket. The quantiles are estimated by
+    linear interpolation inside the bucket.
+    """
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        # Bucket counts, the overflow bucket count and the sum of the values
+        super().__init__(len(self.buckets) + 2)
+
+    def observe(self, value):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._add_cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def get_snapshot(self):
+        # Returns the per bucket counts, including the overflow one, the values count and their sum
+        values = self._get_values()
+        counts = values[:-1]
+        return counts, sum(counts), values[-1]
+
+    def get_quantile(self, quantile, snapshot=None):
+        (counts, count, _) = snapshot if snapshot is not None else self.get_snapshot()
+        if not count:
+            return 0
+        rank = quantile * count
+        seen = 0
+        for (index, bucket_count) in enumerate(counts):
+            if not bucket_count or seen + bucket_count < rank:
+                seen += bucket_count
+                continue
+            if index == len(self.buckets):
+                return self.buckets[-1]
+            lower_bound = self.buckets[index - 1] if index else 0
+            return lower_bound + (self.buckets[index] - lower_bound) * (rank - seen) / bucket_count
+        return self.buckets[-1]
+
+    def collect(self):
+        snapshot = self.get_snapshot()
+        (_, count, values_sum) = snapshot
+        result = {self.name + 'Count': count, self.name + 'Avg': round(values_sum / count, 3) if count else 0}
+        for (quantile, suffix) in HISTOGRAM_QUANTILES:
+            result[self.name + suffix] = round(self.get_quantile(quantile, snapshot), 3)
+        return result
+
+
+class Sampler:
+    """
+    Selects every N-th call of every thread, the first call of a thread is always selected.
+    """
+
+    def __init__(self, period=1):
+        self.period = max(int(period), 1)
+        self.__local = local()
+
+    def is_sampled(self):
+        countdown = getattr(self.__local, 'countdown', 1) - 1
+        if countdown > 0:
+            self.__local.countdown = countdown
+            return False
+        self.__local.countdown = self.period
+        return True
+
+
+class MetricsRegistry:
+    """
+    Named counters, gauges and histograms that are cheap enough to be updated on the data path.
+    The payloads sizes are taken from their lengths when they are strings or bytes. For the other objects only every
+    N-th one, where N is the sampling period, is converted to a string and its length is counted N times.
+    """
+
+    def __init__(self, sampling_period=DEFAULT_SIZE_SAMPLING_PERIOD):
+        self.__sampler = Sampler(sampling_period)
+        self.__metrics = {}
+        self.__lock = Lock()
+
+    @property
+    def sampling_period(self):
+        return self.__sampler.period
+
+    @sampling_period.setter
+    def sampling_period(self, sampling_period):
+        self.__sampler.period = max(int(sampling_period), 1)
+
+    def __get_or_create(self, name, metric_class, *args):
+        metric = self.__metrics.get(name)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.get(name)
+                if metric is None:
+                    metric = metric_class(name, *args)
+                    self.__metrics[name] = metric
+        return metric
+
+    def counter(self, name) -> Counter:
+        return self.__get_or_create(name, Counter)
+
+    def gauge(self, name, function=None) -> Gauge:
+        return self.__get_or_create(name, Gauge, function)
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.__get_or_create(name, Histogram, buckets)
+
+    def get(self, name):
+        return self.__metrics.get(name)
+
+    def estimate_size(self, data):
+        if data is None:
+            return 0
+        if isinstance(data, (str, bytes, bytearray)):
+            return len(data)
+        if self.__sampler.period == 1:
+            return len(str(data))
+        if self.__sampler.is_sampled():
+            return len(str(data)) * self.__sampler.period
+        return 0
+
+    def collect(self):
+        result = {}
+        for metric in tuple(self.__metrics.values()):
+            result.update(metric.collect())
+        return result
+
+    def reset(self, names=None):
+        for name in names if names is not None else tuple(self.__metrics):
+            metric = self.__metrics.get(name)
+            if metric is not None:
+                metric.reset()
@@ -0,0 +1,333 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from simplejson import dumps
+
+from thingsboard_gateway.gateway.constants import ATTRIBUTES_PARAMETER, DEVICE_NAME_PARAMETER, \
+    DEVICE_TYPE_PARAMETER, TELEMETRY_PARAMETER, TELEMETRY_TIMESTAMP_PARAMETER, TELEMETRY_VALUES_PARAMETER
+
+# simplejson.dumps uses ", " between items and ": " between key and value by default
+ITEM_SEPARATOR_SIZE = 2
+
+
+def json_size(data):
+    """Returns the exact length in bytes of the JSON representation of the data (dumps output is ASCII)."""
+    return len(dumps(data))
+
+
+def key_value_size(key, value):
+    """Returns the length of the '"key": value' part of a JSON object."""
+    return len(dumps({key: value})) - 2
+
+
+class DeviceDataSplitter:
+    """
+    Splits converted data of a single device into several messages, each of them fits maxPayloadSizeBytes.
+    The size of every key-value is calculated only once and the running size of the message is tracked,
+    so the size of the produced messages is equal to the length of their JSON representation.
+    """
+
+    def __init__(self, max_payload_size):
+        self.__max_payload_size = max_payload_size
+
+    def split(self, data):
+        chunks = []
+        chunk = _DeviceDataChunk(data[DEVICE_NAME_PARAMETER], data[DEVICE_TYPE_PARAMETER])
+
+        for attribute in data[ATTRIBUTES_PARAMETER]:
+            for (key, value) in attribute.items():
+                kv_size = key_value_size(key, value)
+                if chunk.size + chunk.attribute_size_delta(key, kv_size) > self.__max_payload_size \
+                        and not chunk.is_empty():
+                    chunks.append(chunk.data)
+                    chunk = chunk.new_empty()
+                chunk.add_attribute(key, value, kv_size)
+
+        telemetry = data[TELEMETRY_PARAMETER] if isinstance(data[TELEMETRY_PARAMETER], list) \
+            else [data[TELEMETRY_PARAMETER]]
+        for ts_kv_list in telemetry:
+            ts = ts_kv_list[TELEMETRY_TIMESTAMP_PARAMETER]
+            for (key, value) in ts_kv_list[TELEMETRY_VALUES_PARAMETER].items():
+                kv_size = key_value_size(key, value)
+                if chunk.size + chunk.telemetry_size_delta(ts, key, kv_size) > self.__max_payload_size \
+                        and not chunk.is_empty():
+                    chunks.append(chunk.data)
+                    chunk = chunk.new_empty()
+                chunk.add_telemetry(ts, key, value, kv_size)
+
+        if not chunk.is_empty():
+            chunks.append(chunk.data)
+        return chunks
+
+
+class _DeviceDataChunk:
+    def __init__(self, device_name, device_type, empty_size=None):
+        self.data = {DEVICE_NAME_PARAMETER: device_name,
+                     DEVICE_TYPE_PARAMETER: device_type,
+                     ATTRIBUTES_PARAMETER: {},
+                     TELEMETRY_PARAMETER: []}
+        self.size = empty_size if empty_size is not None else json_size(self.data)
+        self.__empty_size = self.size
+        self.__attributes_sizes = {}
+        self.__ts_to_values = {}
+        self.__ts_values_sizes = {}
+
+    def new_empty(self):
+        return _DeviceDataChunk(self.data[DEVICE_NAME_PARAMETER], self.data[DEVICE_TYPE_PARAMETER], self.__empty_size)
+
+    def is_empty(self):
+        return not self.__attributes_sizes and not self.__ts_to_values
+
+    def attribute_size_delta(self, key, kv_size):
+        if key in self.__attributes_sizes:
+            return kv_size - self.__attributes_sizes[key]
+        return kv_size + (ITEM_SEPARATOR_SIZE if self.__attributes_sizes else 0)
+
+    def add_attribute(self, key, value, kv_size):
+        self.size += self.attribute_size_delta(key, kv_size)
+        self.__attributes_sizes[key] = kv_size
+        self.data[ATTRIBUTES_PARAMETER][key] = value
+
+    def telemetry_size_delta(self, ts, key, kv_size):
+        values_sizes = self.__ts_values_sizes.get(ts)
+        if values_sizes is None:
+            return (json_size({TELEMETRY_TIMESTAMP_PARAMETER: ts, TELEMETRY_VALUES_PARAMETER: {}}) + kv_size
+                    + (ITEM_SEPARATOR_SIZE if self.__ts_to_values else 0))
+        if key in values_sizes:
+            return kv_size - values_sizes[key]
+        return kv_size + ITEM_SEPARATOR_SIZE
+
+    def add_telemetry(self, ts, key, value, kv_size):
+        self.size += self.telemetry_size_delta(ts, key, kv_size)
+        values = self.__ts_to_values.get(ts)
+        if values is None:
+            values = {}
+            self.__ts_to_values[ts] = values
+            self.__ts_values_sizes[ts] = {}
+            self.data[TELEMETRY_PARAMETER].append({TELEMETRY_TIMESTAMP_PARAMETER: ts,
+                                                   TELEMETRY_VALUES_PARAMETER: values})
+        values[key] = value
+        self.__ts_values_sizes[ts][key] = kv_size
+
+
+class DeviceDataRecord:
+    """
+    Converted data of a device kept by the storage as an object, without serialization.
+    JSON sizes of the telemetry items and attributes are measured once, when the record is created,
+    so the data is serialized only at publish time. The latency trace is set only for the sampled records.
+    """
+
+    __slots__ = ('device_name', 'device_type', 'telemetry', 'telemetry_sizes', 'attributes', 'attributes_sizes',
+                 'trace')
+
+    def __init__(self, data):
+        self.device_name = data[DEVICE_NAME_PARAMETER]
+        self.device_type = data.get(DEVICE_TYPE_PARAMETER)
+        telemetry = data.get(TELEMETRY_PARAMETER) or []
+        self.telemetry = telemetry if isinstance(telemetry, list) else [telemetry]
+        self.telemetry_sizes = [json_size(item) for item in self.telemetry]
+        attributes = data.get(ATTRIBUTES_PARAMETER) or {}
+        if isinstance(attributes, list):
+            self.attributes = {}
+            for item in attributes:
+                self.attributes.update(item)
+        else:
+            self.attributes = attributes
+        self.attributes_sizes = {key: key_value_size(key, value) for (key, value) in self.attributes.items()}
+        self.trace = None
+
+    def size(self):
+        """Returns the JSON size of the telemetry and attributes, used to limit the memory taken by the stored records."""
+        return len(self.device_name) + sum(self.telemetry_sizes) + sum(self.attributes_sizes.values())
+
+    def max_message_size(self):
+        """Returns the size of the biggest message that contains a single telemetry item or attribute."""
+        max_item_size = max(max(self.telemetry_sizes, default=0), max(self.attributes_sizes.values(), default=0))
+        return json_size({self.device_name: []}) + max_item_size
+
+
+class EventPackBuilder:
+    """
+    Collects telemetry and attributes of the devices read from the storage into a pack for sending.
+    Running sizes of the payloads (per device and for the whole pack) are tracked, so the pack is passed to
+    the send callback before an added item makes it bigger than maxPayloadSizeBytes.
+
+    In coalescing mode the data of all the devices is published in one telemetry and one attributes message,
+    so every message is filled up to maxPayloadSizeBytes and flushed separately. The size of a message with
+    several devices is equal to the sum of the sizes of single device messages, so the same size tracking is used.
+    Without coalescing the pack is published either in a message per device or in one gateway message
+    (the protobuf payload), the published messages are counted accordingly.
+    The tracked sizes of the flushed payloads are also added to the bytes counter, when it is passed.
+    """
+
+    def __init__(self, max_payload_size, send_callback, coalesce=False, bytes_counter=None,
+                 pack_in_one_message=False):
+        self.__max_payload_size = max_payload_size
+        self.__bytes_counter = bytes_counter
+        self.__send_callback = send_callback
+        self.__coalesce = coalesce
+        self.__pack_in_one_message = coalesce or pack_in_one_message
+        self.devices_data = {}
+        self.telemetry_size = 0
+        self.attributes_size = 0
+        self.__devices_sizes = {}
+        self.telemetry_messages_count = 0
+        self.attributes_messages_count = 0
+        self.published_bytes = 0
+
+    @property
+    def size(self):
+        return self.telemetry_size + self.attributes_size
+
+    def is_empty(self):
+        return self.size == 0
+
+    def get_fill_ratio(self):
+        """Returns the average ratio of the published messages size to maxPayloadSizeBytes."""
+        messages_count = self.telemetry_messages_count + self.attributes_messages_count
+        if not messages_count:
+            return 0.0
+        return self.published_bytes / (messages_count * self.__max_payload_size)
+
+    def add_record(self, record: DeviceDataRecord):
+        for (item, item_size) in zip(record.telemetry, record.telemetry_sizes):
+            self.add_telemetry(record.device_name, item, item_size)
+        for (key, value) in record.attributes.items():
+            self.add_attribute(record.device_name, key, value, record.attributes_sizes[key])
+
+    def add_telemetry(self, device_name, telemetry, item_size=None):
+        device_sizes = self.__get_device_sizes(device_name)
+        if item_size is None:
+            item_size = json_size(telemetry)
+        delta = self.__telemetry_size_delta(device_sizes, item_size)
+        if self.__coalesce:
+            if self.telemetry_size + delta > self.__max_payload_size and self.telemetry_size:
+                self.flush_telemetry()
+                delta = self.__telemetry_size_delta(device_sizes, item_size)
+        elif self.size + delta > self.__max_payload_size and not self.is_empty():
+            self.flush()
+            device_sizes = self.__get_device_sizes(device_name)
+            delta = self.__telemetry_size_delta(device_sizes, item_size)
+
+        self.devices_data[device_name][TELEMETRY_PARAMETER].append(telemetry)
+        device_sizes.telemetry_count += 1
+        self.telemetry_size += delta
+
+    def add_attributes(self, device_name, attributes):
+        for (key, value) in attributes.items():
+            self.add_attribute(device_name, key, value)
+
+    def add_attribute(self, device_name, key, value, kv_size=None):
+        device_sizes = self.__get_device_sizes(device_name)
+        if kv_size is None:
+            kv_size = key_value_size(key, value)
+        delta = self.__attribute_size_delta(device_sizes, key, kv_size)
+        if self.__coalesce:
+            if self.attributes_size + delta > self.__max_payload_size and self.attributes_size:
+                self.flush_attributes()
+                delta = self.__attribute_size_delta(device_sizes, key, kv_size)
+        elif self.size + delta > self.__max_payload_size and not self.is_empty():
+            self.flush()
+            device_sizes = self.__get_device_sizes(device_name)
+            delta = self.__attribute_size_delta(device_sizes, key, kv_size)
+
+        self.devices_data[device_name][ATTRIBUTES_PARAMETER][key] = value
+        device_sizes.attributes_sizes[key] = kv_size
+        self.attributes_size += delta
+
+    @staticmethod
+    def __telemetry_size_delta(device_sizes, item_size):
+        if device_sizes.telemetry_count:
+            return item_size + ITEM_SEPARATOR_SIZE
+        return device_sizes.telemetry_prefix_size + item_size
+
+    @staticmethod
+    def __attribute_size_delta(device_sizes, key, kv_size):
+        if key in device_sizes.attributes_sizes:
+            return kv_size - device_sizes.attributes_sizes[key]
+        if device_sizes.attributes_sizes:
+            return kv_size + ITEM_SEPARATOR_SIZE
+        return device_sizes.attributes_prefix_size + kv_size
+
+    def flush(self):
+        if not self.is_empty():
+            if self.__pack_in_one_message:
+                self.telemetry_messages_count += 1 if self.telemetry_size else 0
+                self.attributes_messages_count += 1 if self.attributes_size else 0
+            else:
+                for device_data in self.devices_data.values():
+                    self.telemetry_messages_count += 1 if device_data[TELEMETRY_PARAMETER] else 0
+                    self.attributes_messages_count += 1 if device_data[ATTRIBUTES_PARAMETER] else 0
+            self.__count_published_bytes(self.size)
+            self.__send_callback(self.devices_data)
+        self.clear()
+
+    def __count_published_bytes(self, bytes_count):
+        self.published_bytes += bytes_count
+        if self.__bytes_counter is not None:
+            self.__bytes_counter.inc(bytes_count)
+
+    def flush_telemetry(self):
+        devices_telemetry = {}
+        for (device_name, device_data) in self.devices_data.items():
+            if device_data[TELEMETRY_PARAMETER]:
+                devices_telemetry[device_name] = {TELEMETRY_PARAMETER: device_data[TELEMETRY_PARAMETER],
+                                                  ATTRIBUTES_PARAMETER: {}}
+                device_data[TELEMETRY_PARAMETER] = []
+                self.__devices_sizes[device_name].telemetry_count = 0
+        if devices_telemetry:
+            self.telemetry_messages_count += 1
+            self.__count_published_bytes(self.telemetry_size)
+            self.__send_callback(devices_telemetry)
+        self.telemetry_size = 0
+
+    def flush_attributes(self):
+        devices_attributes = {}
+        for (device_name, device_data) in self.devices_data.items():
+            if device_data[ATTRIBUTES_PARAMETER]:
+                devices_attributes[device_name] = {TELEMETRY_PARAMETER: [],
+                                                   ATTRIBUTES_PARAMETER: device_data[ATTRIBUTES_PARAMETER]}
+                device_data[ATTRIBUTES_PARAMETER] = {}
+                self.__devices_sizes[device_name].attributes_sizes = {}
+        if devices_attributes:
+            self.attributes_messages_count += 1
+            self.__count_published_bytes(self.attributes_size)
+            self.__send_callback(devices_attributes)
+        self.attributes_size = 0
+
+    def clear(self):
+        self.devices_data = {}
+        self.__devices_sizes = {}
+        self.telemetry_size = 0
+        self.attributes_size = 0
+
+    def __get_device_sizes(self, device_name):
+        device_sizes = self.__devices_sizes.get(device_name)
+        if device_sizes is None:
+            device_sizes = _DevicePayloadSizes(device_name)
+            self.__devices_sizes[device_name] = device_sizes
+        if device_name not in self.devices_data:
+            self.devices_data[device_name] = {TELEMETRY_PARAMETER: [], ATTRIBUTES_PARAMETER: {}}
+        return device_sizes
+
+
+class _DevicePayloadSizes:
+    __slots__ = ('telemetry_prefix_size', 'attributes_prefix_size', 'telemetry_count', 'attributes_sizes')
+
+    def __init__(self, device_name):
+        # Sizes of empty {"device": []} and {"device": {}} payloads, as they are published by the gateway client
+        self.telemetry_prefix_size = json_size({device_name: []})
+        self.attributes_prefix_size = json_size({device_name: {}})
+        self.telemetry_count = 0
+        self.attributes_sizes = {}
@@ -0,0 +1,90 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import random
+import string
+from logging import getLogger
+from os import path, replace
+from zlib import crc32
+
+from simplejson import JSONDecodeError, dump, load
+
+log = getLogger("tb_connection")
+
+PERSISTENT_SESSION_FILE_NAME = "persistent_session.json"
+
+
+def get_events_fingerprint(events):
+    # Identifies the pack of events read from the storage, packs of objects are not identified
+    fingerprint = len(events)
+    for event in events:
+        if not isinstance(event, str):
+            return None
+        fingerprint = crc32(event.encode('utf-8'), fingerprint)
+    return fingerprint
+
+
+class PersistentSession:
+    """
+    State of the persistent MQTT session kept in the config folder between the gateway restarts:
+    the stable client id and the acknowledged messages of the event packs which were in flight.
+    A pack read from the storage again after restart is identified by the fingerprint of its events,
+    and only its not acknowledged messages are published.
+    """
+
+    def __init__(self, config, config_folder_path):
+        self.__enabled = config.get('enable', False)
+        self.__file_path = config_folder_path + PERSISTENT_SESSION_FILE_NAME
+        self.__state = {}
+        self.client_id = config.get('clientId') or None
+        if not self.__enabled:
+            return
+        if path.exists(self.__file_path):
+            try:
+                with open(self.__file_path, 'r') as session_file:
+                    self.__state = load(session_file)
+            except (OSError, JSONDecodeError) as e:
+                log.warning("Failed to load the persistent session state: %s", e)
+        if self.client_id is None:
+            self.client_id = self.__state.get('clientId')
+        if self.client_id is None:
+            self.client_id = 'tb_gw_' + ''.join(random.choice(string.ascii_lowercase) for _ in range(16))
+            self.__save()
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def pop_packs_state(self):
+        # Packs state is used once, after the restart
+        packs_state = self.__state.pop('packs', [])
+        if packs_state:
+            self.__save()
+            log.info("%i event pack(s) were in flight before the restart.", len(packs_state))
+        return packs_state
+
+    def save_packs_state(self, packs_state):
+        if not self.__enabled or (not packs_state and not self.__state.get('packs')):
+            return
+        self.__state['packs'] = packs_state
+        self.__save()
+
+    def __save(self):
+        self.__state['clientId'] = self.client_id
+        temp_file_path = self.__file_path + '.tmp'
+        try:
+            with open(temp_file_path, 'w') as session_file:
+                dump(self.__state, session_file)
+            replace(temp_file_path, self.__file_path)
+        except OSError as e:
+            log.warning("Failed to save the persistent session state: %s", e)
@@ -0,0 +1,162 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from struct import Struct
+from time import time
+
+from simplejson import dumps
+from tb_device_mqtt import TBPublishInfo
+from tb_gateway_mqtt import GATEWAY_ATTRIBUTES_TOPIC, GATEWAY_MAIN_TOPIC, TBGatewayMqttClient
+
+from thingsboard_gateway.gateway.constants import TELEMETRY_TIMESTAMP_PARAMETER, TELEMETRY_VALUES_PARAMETER
+
+# Messages are encoded straight into the protobuf wire format of the messages from proto/messages.proto:
+# GatewayTelemetryMsg, GatewayAttributesMsg and the messages they contain. The output is the same as the
+# output of messages_pb2, but it doesn't build message objects, which is slow with the pure Python protobuf runtime.
+
+GATEWAY_TELEMETRY_TOPIC = GATEWAY_MAIN_TOPIC + "telemetry"
+
+MIN_LONG_VALUE = -2 ** 63
+MAX_LONG_VALUE = 2 ** 63 - 1
+
+# Field tags: (field number << 3) | wire type
+KEY_VALUE_KEY_TAG = b'\x0a'
+KEY_VALUE_TYPE_TAG = b'\x10'
+KEY_VALUE_BOOL_TAG = b'\x18'
+KEY_VALUE_LONG_TAG = b'\x20'
+KEY_VALUE_DOUBLE_TAG = b'\x29'
+KEY_VALUE_STRING_TAG = b'\x32'
+KEY_VALUE_JSON_TAG = b'\x3a'
+TS_KV_LIST_TS_TAG = b'\x08'
+TS_KV_LIST_KV_TAG = b'\x12'
+POST_TELEMETRY_TS_KV_LIST_TAG = b'\x0a'
+POST_ATTRIBUTE_KV_TAG = b'\x0a'
+DEVICE_MSG_DEVICE_NAME_TAG = b'\x0a'
+TELEMETRY_MSG_MSG_TAG = b'\x1a'
+ATTRIBUTES_MSG_MSG_TAG = b'\x12'
+GATEWAY_MSG_MSG_TAG = b'\x0a'
+
+# KeyValueType values, BOOLEAN_V is the default one and is not written
+LONG_V_TYPE = KEY_VALUE_TYPE_TAG + b'\x01'
+DOUBLE_V_TYPE = KEY_VALUE_TYPE_TAG + b'\x02'
+STRING_V_TYPE = KEY_VALUE_TYPE_TAG + b'\x03'
+JSON_V_TYPE = KEY_VALUE_TYPE_TAG + b'\x04'
+
+DOUBLE_STRUCT = Struct('<d')
+
+
+def encode_varint(value):
+    if value < 0:
+        value += 1 << 64
+    result = bytearray()
+    while value > 0x7f:
+        result.append(0x80 | (value & 0x7f))
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def encode_length_delimited(tag, payload):
+    return tag + encode_varint(len(payload)) + payload
+
+
+def encode_string(tag, value):
+    return encode_length_delimited(tag, value.encode('utf-8'))
+
+
+def encode_key_value(key, value, encoded_keys=None):
+    """Encodes KeyValueProto, encoded keys are taken from and saved to encoded_keys if it is passed."""
+    encoded_key = encoded_keys.get(key) if encoded_keys is not None else None
+    if encoded_key is None:
+        encoded_key = encode_string(KEY_VALUE_KEY_TAG, key)
+        if encoded_keys is not None:
+            encoded_keys[key] = encoded_key
+    # Default (zero) values are not written, as protobuf runtime does for proto3 messages
+    # bool is a subclass of int, so it has to be checked first
+    if isinstance(value, bool):
+        return encoded_key + KEY_VALUE_BOOL_TAG + b'\x01' if value else encoded_key
+    if isinstance(value, int) and MIN_LONG_VALUE <= value <= MAX_LONG_VALUE:
+        return encoded_key + LONG_V_TYPE + (KEY_VALUE_LONG_TAG + encode_varint(value) if value else b'')
+    if isinstance(value, float):
+        return encoded_key + DOUBLE_V_TYPE + (KEY_VALUE_DOUBLE_TAG + DOUBLE_STRUCT.pack(value) if value else b'')
+    if isinstance(value, str):
+        return encoded_key + STRING_V_TYPE + (encode_string(KEY_VALUE_STRING_TAG, value) if value else b'')
+    return encoded_key + JSON_V_TYPE + encode_string(KEY_VALUE_JSON_TAG, dumps(value))
+
+
+def encode_post_telemetry_msg(telemetry, encoded_keys=None):
+    if not isinstance(telemetry, list):
+        telemetry = [telemetry]
+    ts_kv_lists = []
+    for item in telemetry:
+        if TELEMETRY_VALUES_PARAMETER in item:
+            ts = item.get(TELEMETRY_TIMESTAMP_PARAMETER) or int(time() * 1000)
+            values = item[TELEMETRY_VALUES_PARAMETER]
+        else:
+            ts = int(time() * 1000)
+            values = item
+        ts_kv_list = [TS_KV_LIST_TS_TAG + encode_varint(ts)]
+        for (key, value) in values.items():
+            ts_kv_list.append(encode_length_delimited(TS_KV_LIST_KV_TAG, encode_key_value(key, value, encoded_keys)))
+        ts_kv_lists.append(encode_length_delimited(POST_TELEMETRY_TS_KV_LIST_TAG, b''.join(ts_kv_list)))
+    return b''.join(ts_kv_lists)
+
+
+def encode_post_attribute_msg(attributes, encoded_keys=None):
+    return b''.join(encode_length_delimited(POST_ATTRIBUTE_KV_TAG, encode_key_value(key, value, encoded_keys))
+                    for (key, value) in attributes.items())
+
+
+def encode_gateway_telemetry(devices_telemetry):
+    """Encodes {"device name": telemetry} into GatewayTelemetryMsg."""
+    encoded_keys = {}
+    messages = []
+    for (device_name, telemetry) in devices_telemetry.items():
+        telemetry_msg = (encode_string(DEVICE_MSG_DEVICE_NAME_TAG, device_name)
+                         + encode_length_delimited(TELEMETRY_MSG_MSG_TAG,
+                                                   encode_post_telemetry_msg(telemetry, encoded_keys)))
+        messages.append(encode_length_delimited(GATEWAY_MSG_MSG_TAG, telemetry_msg))
+    return b''.join(messages)
+
+
+def encode_gateway_attributes(devices_attributes):
+    """Encodes {"device name": attributes} into GatewayAttributesMsg."""
+    encoded_keys = {}
+    messages = []
+    for (device_name, attributes) in devices_attributes.items():
+        attributes_msg = (encode_string(DEVICE_MSG_DEVICE_NAME_TAG, device_name)
+                          + encode_length_delimited(ATTRIBUTES_MSG_MSG_TAG,
+                                                    encode_post_attribute_msg(attributes, encoded_keys)))
+        messages.append(encode_length_delimited(GATEWAY_MSG_MSG_TAG, attributes_msg))
+    return b''.join(messages)
+
+
+class ProtobufTBGatewayMqttClient(TBGatewayMqttClient):
+    """
+    Gateway MQTT client which publishes telemetry and attributes of the gateway devices with protobuf payloads.
+    Other messages are published as JSON.
+    """
+
+    ENCODERS = {
+        GATEWAY_TELEMETRY_TOPIC: encode_gateway_telemetry,
+        GATEWAY_ATTRIBUTES_TOPIC: encode_gateway_attributes,
+    }
+
+    def publish_data(self, data, topic, qos):
+        encoder = self.ENCODERS.get(topic)
+        if encoder is None:
+            return super().publish_data(data, topic, qos)
+        if qos is None:
+            qos = self.quality_of_service
+        return TBPublishInfo(self._client.publish(topic, encoder(data), qos))
@@ -0,0 +1,128 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+from time import monotonic
+
+from tb_device_mqtt import TBPublishInfo
+
+
+class PublishWindow:
+    """
+    Keeps track of the event packs published to ThingsBoard, which are not acknowledged yet.
+    Every pack waits for the PUBACKs of its messages by their mids. Packs are acknowledged strictly in
+    the order they were published, so the storage progress is confirmed only up to the oldest pack
+    that still waits for acks.
+    With the persistent session the messages published without the connection are awaited as well, the client
+    sends them after reconnect.
+    """
+
+    def __init__(self, max_packs_in_flight=1, ack_timeout_ms=10000, persistent_session=False):
+        self.max_packs_in_flight = max(int(max_packs_in_flight), 1)
+        self.__ack_timeout = ack_timeout_ms / 1000
+        self.__persistent_session = persistent_session
+        self.__packs = deque()
+        self.__acknowledged_traces = []
+        self.__failed = False
+
+    def __len__(self):
+        return len(self.__packs)
+
+    def is_full(self):
+        return len(self.__packs) >= self.max_packs_in_flight
+
+    def is_failed(self):
+        """Returns True if publishing of some pack failed or some pack was not acknowledged in time."""
+        if self.__failed:
+            return True
+        return bool(self.__packs) and monotonic() - self.__packs[0].published_at > self.__ack_timeout
+
+    def add_pack(self, published_messages, wait_for_ack=True, fingerprint=None, message_indexes=None,
+                 acknowledged_indexes=(), traces=None):
+        # Message indexes in the pack are kept for the persistent session, some messages may be acknowledged already
+        pack = _PublishedPack(monotonic(), fingerprint, acknowledged_indexes, traces)
+        for (position, message) in enumerate(published_messages):
+            rc = message.rc()
+            if rc != TBPublishInfo.TB_ERR_SUCCESS and not (self.__persistent_session
+                                                          and rc == TBPublishInfo.TB_ERR_NO_CONN):
+                self.__failed = True
+            elif wait_for_ack:
+                pack.pending_messages[message.mid()] = (
+                    message_indexes[position] if message_indexes is not None else position, message)
+        self.__packs.append(pack)
+
+    def pop_acknowledged(self):
+        """Removes acknowledged packs from the head of the window and returns their count."""
+        acknowledged_count = 0
+        while self.__packs:
+            pack = self.__packs[0]
+            for (mid, (index, message)) in list(pack.pending_messages.items()):
+                try:
+                    if not message.message_info.is_published():
+                        break
+                except (RuntimeError, ValueError):
+                    self.__failed = True
+                    break
+                del pack.pending_messages[mid]
+                pack.acknowledged_indexes.add(index)
+            if pack.pending_messages:
+                break
+            self.__packs.popleft()
+            if pack.traces:
+                self.__acknowledged_traces.extend(pack.traces)
+            acknowledged_count += 1
+        return acknowledged_count
+
+    def pop_acknowledged_traces(self):
+        """Returns the latency traces of the events of the packs acknowledged since the previous call."""
+        traces = self.__acknowledged_traces
+        self.__acknowledged_traces = []
+        return traces
+
+    def restart_timeouts(self):
+        # The client sends the not acknowledged messages again after reconnect, so they are waited for again
+        now = monotonic()
+        for pack in self.__packs:
+            pack.published_at = now
+
+    def get_state(self):
+        """Returns the fingerprints and acknowledged message indexes of the identified packs in flight."""
+        state = []
+        for pack in self.__packs:
+            if pack.fingerprint is None:
+                break
+            acknowledged_indexes = set(pack.acknowledged_indexes)
+            for (index, message) in pack.pending_messages.values():
+                try:
+                    if message.message_info.is_published():
+                        acknowledged_indexes.add(index)
+                except (RuntimeError, ValueError):
+                    pass
+            state.append({"fingerprint": pack.fingerprint, "acknowledged": sorted(acknowledged_indexes)})
+        return state
+
+    def clear(self):
+        self.__packs.clear()
+        self.__failed = False
+
+
+class _PublishedPack:
+    __slots__ = ('published_at', 'fingerprint', 'pending_messages', 'acknowledged_indexes', 'traces')
+
+    def __init__(self, published_at, fingerprint=None, acknowledged_indexes=(), traces=None):
+        self.published_at = published_at
+        self.fingerprint = fingerprint
+        self.pending_messages = {}
+        self.acknowledged_indexes = set(acknowledged_indexes)
+        self.traces = traces
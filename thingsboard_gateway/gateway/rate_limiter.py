@@ -0,0 +1,229 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from logging import getLogger
+from threading import Lock
+from time import monotonic, sleep
+
+from tb_device_mqtt import ATTRIBUTES_TOPIC, TELEMETRY_TOPIC
+from tb_gateway_mqtt import GATEWAY_ATTRIBUTES_TOPIC
+
+from thingsboard_gateway.gateway.payload_packer import json_size
+from thingsboard_gateway.gateway.protobuf_payload import GATEWAY_TELEMETRY_TOPIC
+from thingsboard_gateway.gateway.token_bucket import TokenBucket
+
+log = getLogger("tb_connection")
+
+LIMIT_MESSAGES = "messages"
+LIMIT_DATAPOINTS = "datapoints"
+LIMIT_BYTES = "bytes"
+LIMITS_CONFIG_KEYS = {
+    LIMIT_MESSAGES: "messagesPerSecond",
+    LIMIT_DATAPOINTS: "datapointsPerSecond",
+    LIMIT_BYTES: "bytesPerSecond",
+}
+
+SCOPE_GATEWAY = "gateway"
+SCOPE_DEVICE = "device"
+
+MAX_WAIT_STEP = .1
+
+
+def parse_rate_limit(value):
+    """
+    Returns the token buckets of the limit. The limit is a rate per second or a string in the ThingsBoard format,
+    "capacity:seconds" pairs separated by commas, e.g. "100:1,3000:60".
+    """
+    if isinstance(value, str):
+        buckets = []
+        for pair in value.replace(" ", "").split(","):
+            if pair:
+                (capacity, seconds) = pair.split(":")
+                buckets.append(TokenBucket(float(capacity) / float(seconds), float(capacity)))
+        return buckets
+    return [TokenBucket(float(value))] if value and value > 0 else []
+
+
+def count_telemetry_datapoints(telemetry):
+    items = telemetry if isinstance(telemetry, list) else [telemetry]
+    return sum(len(item["values"]) if "values" in item else len(item) for item in items)
+
+
+class RateLimits:
+    """
+    Messages, datapoints and bytes limits of one scope (the gateway or a device).
+    """
+
+    def __init__(self, config):
+        self.buckets = {limit: parse_rate_limit(config.get(config_key, 0))
+                        for (limit, config_key) in LIMITS_CONFIG_KEYS.items()}
+
+    def is_limited(self, limit=None):
+        if limit is None:
+            return any(self.buckets.values())
+        return bool(self.buckets[limit])
+
+    def get_wait_time(self, costs):
+        # Returns the longest wait time with the limit which requires it
+        (max_wait_time, limiting) = (0, None)
+        for (limit, buckets) in self.buckets.items():
+            for bucket in buckets:
+                wait_time = bucket.get_wait_time(costs[limit])
+                if wait_time > max_wait_time:
+                    (max_wait_time, limiting) = (wait_time, limit)
+        return max_wait_time, limiting
+
+    def consume(self, costs):
+        for (limit, buckets) in self.buckets.items():
+            for bucket in buckets:
+                bucket.consume(costs[limit])
+
+    def get_budget(self):
+        # Tokens left in the most exhausted bucket of every limit, None for the not limited ones
+        return {limit: min(bucket.get_tokens() for bucket in buckets) if buckets else None
+                for (limit, buckets) in self.buckets.items()}
+
+
+class RateLimiter:
+    """
+    Hierarchical token buckets which shape the messages published to ThingsBoard.
+    Every message takes the tokens from the gateway wide limits and from the limits of every device in it,
+    the publishing thread waits until all of them have the tokens.
+    """
+
+    def __init__(self, config):
+        self.__enabled = config.get('enable', False)
+        self.__gateway_limits = RateLimits(config)
+        self.__device_config = config.get('device', {})
+        self.__device_limits_enabled = RateLimits(self.__device_config).is_limited()
+        self.__count_bytes = self.__gateway_limits.is_limited(LIMIT_BYTES)
+        self.__count_device_bytes = RateLimits(self.__device_config).is_limited(LIMIT_BYTES)
+        self.__devices_limits = {}
+        self.__lock = Lock()
+        self.throttle_counts = {(scope, limit): 0 for scope in (SCOPE_GATEWAY, SCOPE_DEVICE)
+                                for limit in LIMITS_CONFIG_KEYS}
+        self.throttled_messages_count = 0
+        self.throttle_time = 0
+        if self.is_enabled():
+            log.info("Rate limits are enabled, gateway limits: %s, device limits: %s",
+                     {limit: config.get(config_key) for (limit, config_key) in LIMITS_CONFIG_KEYS.items()},
+                     self.__device_config)
+
+    def is_enabled(self):
+        return self.__enabled and (self.__gateway_limits.is_limited() or self.__device_limits_enabled)
+
+    def acquire_for_publish(self, data, topic):
+        if not self.is_enabled():
+            return
+        devices_costs = {}
+        if topic == GATEWAY_TELEMETRY_TOPIC:
+            for (device, telemetry) in data.items():
+                devices_costs[device] = (count_telemetry_datapoints(telemetry),
+                                         json_size({device: telemetry}) if self.__count_device_bytes else 0)
+        elif topic == GATEWAY_ATTRIBUTES_TOPIC:
+            for (device, attributes) in data.items():
+                devices_costs[device] = (len(attributes),
+                                         json_size({device: attributes}) if self.__count_device_bytes else 0)
+        elif topic == TELEMETRY_TOPIC:
+            devices_costs[None] = (count_telemetry_datapoints(data), 0)
+        elif topic == ATTRIBUTES_TOPIC:
+            devices_costs[None] = (len(data), 0)
+        size = json_size(data) if self.__count_bytes else 0
+        self.acquire(devices_costs, size)
+
+    def acquire_for_rpc_reply(self, device, response):
+        if not self.is_enabled():
+            return
+        size = len(response) if isinstance(response, (str, bytes)) else json_size(response)
+        self.acquire({device: (0, size)}, size)
+
+    def acquire(self, devices_costs, size=0):
+        # Waits until the message with the datapoints and size of every device (None is the gateway itself) can be sent
+        gateway_costs = {LIMIT_MESSAGES: 1,
+                         LIMIT_DATAPOINTS: sum(datapoints for (datapoints, _) in devices_costs.values()),
+                         LIMIT_BYTES: size}
+        limited_devices = []
+        if self.__device_limits_enabled:
+            for (device, (datapoints, device_size)) in devices_costs.items():
+                if device is not None:
+                    limited_devices.append((self.__get_device_limits(device),
+                                            {LIMIT_MESSAGES: 1, LIMIT_DATAPOINTS: datapoints,
+                                             LIMIT_BYTES: device_size}))
+        throttled_since = None
+        while True:
+            with self.__lock:
+                (wait_time, limiting) = self.__gateway_limits.get_wait_time(gateway_costs)
+                scope = SCOPE_GATEWAY
+                for (device_limits, costs) in limited_devices:
+                    (device_wait_time, device_limiting) = device_limits.get_wait_time(costs)
+                    if device_wait_time > wait_time:
+                        (wait_time, limiting, scope) = (device_wait_time, device_limiting, SCOPE_DEVICE)
+                if wait_time <= 0:
+                    self.__gateway_limits.consume(gateway_costs)
+                    for (device_limits, costs) in limited_devices:
+                        device_limits.consume(costs)
+                    if throttled_since is not None:
+                        self.throttle_time += monotonic() - throttled_since
+                    return
+                if throttled_since is None:
+                    throttled_since = monotonic()
+                    self.throttled_messages_count += 1
+                    self.throttle_counts[(scope, limiting)] += 1
+            sleep(min(wait_time, MAX_WAIT_STEP))
+
+    def __get_device_limits(self, device):
+        device_limits = self.__devices_limits.get(device)
+        if device_limits is None:
+            device_limits = self.__devices_limits[device] = RateLimits(self.__device_config)
+        return device_limits
+
+    def get_budget(self):
+        return self.__gateway_limits.get_budget()
+
+    def has_budget(self):
+        # Indicates that the gateway wide limits have tokens for one more message
+        if not self.is_enabled():
+            return True
+        return all(tokens is None or tokens >= 1 for tokens in self.get_budget().values())
+
+    def get_statistics(self):
+        statistics = {("rateLimit" + scope.title() + limit.title() + "Throttled"): count
+                      for ((scope, limit), count) in self.throttle_counts.items()}
+        statistics["rateLimitThrottledMessages"] = self.throttled_messages_count
+        statistics["rateLimitThrottleTimeMs"] = int(self.throttle_time * 1000)
+        return statistics
+
+
+class RateLimitedClientMixin:
+    """
+    Shapes the data and the RPC replies published by the ThingsBoard MQTT client with the rate limiter.
+    """
+
+    rate_limiter = None
+
+    def publish_data(self, data, topic, qos):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire_for_publish(data, topic)
+        return super().publish_data(data, topic, qos)
+
+    def gw_send_rpc_reply(self, device, req_id, resp, quality_of_service=None):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire_for_rpc_reply(device, resp)
+        return super().gw_send_rpc_reply(device, req_id, resp, quality_of_service=quality_of_service)
+
+    def send_rpc_reply(self, req_id, resp, quality_of_service=None, wait_for_publish=False):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire_for_rpc_reply(None, resp)
+        return super().send_rpc_reply(req_id, resp, quality_of_service=quality_of_service,
+                                      wait_for_publish=wait_for_publish)
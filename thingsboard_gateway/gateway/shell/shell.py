@@ -40,6 +40,26 @@ class Shell(cmd.Cmd, Thread):
                 {
                     'arg': ('-c', '--count'),
                     'func': self.gateway.get_storage_events_count
+                },
+                {
+                    'arg': ('-q', '--queues'),
+                    'func': self.gateway.get_storage_fill_queues_depth
+                },
+                {
+                    'arg': ('-b', '--backpressure'),
+                    'func': self.gateway.get_backpressure_state
+                },
+                {
+                    'arg': ('-s', '--statistics'),
+                    'func': self.gateway.get_storage_statistics
+                },
+                {
+                    'arg': ('-l', '--lanes'),
+                    'func': self.gateway.get_storage_lanes
+                },
+                {
+                    'arg': ('-a', '--ages'),
+                    'func': self.gateway.get_storage_devices_pending_age
                 }
             ],
             'connector': [
@@ -62,6 +82,14 @@ class Shell(cmd.Cmd, Thread):
                 {
                     'arg': ('-s', '--status'),
                     'func': self.gateway.get_status
+                },
+                {
+                    'arg': ('-r', '--rates'),
+                    'func': self.gateway.get_rate_limits_state
+                },
+                {
+                    'arg': ('-l', '--latency'),
+                    'func': self.gateway.get_latency_state
                 }
             ]
         }
@@ -173,6 +201,8 @@ class Shell(cmd.Cmd, Thread):
     def do_gateway(self, arg):
         """Gateway
         -s/--status: get gateway status
+        -r/--rates: rate limits budget and throttle counters
+        -l/--latency: p50/p95/p99 of the uplink stages latency per connector and the last traces, in milliseconds
         """
         self.wrapper(arg, 'gateway', self.command_config['gateway'])
 
@@ -180,6 +210,11 @@ class Shell(cmd.Cmd, Thread):
         """Storage
         -n/--name:   name of storage
         -c/--count:  events in storage
+        -q/--queues: storage fill queues depth
+        -b/--backpressure: backpressure state
+        -s/--statistics: storage statistics (tiers of the tiered storage, backlog of the lanes)
+        -l/--lanes: storage lanes with their weights and backlog
+        -a/--ages: age of the oldest pending event of every device, in milliseconds (fair drain policy)
         """
         self.wrapper(arg, 'storage', self.command_config['storage'])
 
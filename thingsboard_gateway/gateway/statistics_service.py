@@ -6,17 +6,22 @@ from platform import system as platform_system
 
 import simplejson
 
+from thingsboard_gateway.gateway.latency_tracer import LatencyTracer, stamp_conversion
+from thingsboard_gateway.gateway.metrics import DEFAULT_SIZE_SAMPLING_PERIOD, MetricsRegistry
+
 
 class StatisticsService(Thread):
-    DATA_STREAMS_STATISTICS = {
-        'receivedBytesFromDevices': 0,
-        'convertedBytesFromDevice': 0,
-        'allReceivedBytesFromTB': 0,
-        'allBytesSentToTB': 0,
-        'allBytesSentToDevices': 0,
-    }
-
-    def __init__(self, stats_send_period_in_seconds, gateway, log, config_path=None):
+    DATA_STREAMS = (
+        'receivedBytesFromDevices',
+        'convertedBytesFromDevice',
+        'allReceivedBytesFromTB',
+        'allBytesSentToTB',
+        'allBytesSentToDevices',
+    )
+    METRICS = MetricsRegistry()
+
+    def __init__(self, stats_send_period_in_seconds, gateway, log, config_path=None,
+                 size_sampling_period=DEFAULT_SIZE_SAMPLING_PERIOD):
         super().__init__()
         self.name = 'Statistics Thread'
         self.daemon = True
@@ -29,6 +34,9 @@ class StatisticsService(Thread):
         self._config = self._load_config()
         self._last_poll = 0
         self._last_streams_statistics_clear_time = datetime.datetime.now()
+        self.METRICS.sampling_period = size_sampling_period
+        for stat_type in self.DATA_STREAMS:
+            self.METRICS.counter(stat_type)
 
         self.start()
 
@@ -44,17 +52,15 @@ class StatisticsService(Thread):
 
     @classmethod
     def add_bytes(cls, stat_type, bytes_count):
-        cls.DATA_STREAMS_STATISTICS[stat_type] += bytes_count
+        cls.METRICS.counter(stat_type).inc(bytes_count)
+
+    @classmethod
+    def get_streams_statistics(cls):
+        return {stat_type: cls.METRICS.counter(stat_type).get_value() for stat_type in cls.DATA_STREAMS}
 
     @classmethod
     def clear_streams_statistics(cls):
-        cls.DATA_STREAMS_STATISTICS = {
-            'receivedBytesFromDevices': 0,
-            'convertedBytesFromDevice': 0,
-            'allReceivedBytesFromTB': 0,
-            'allBytesSentToTB': 0,
-            'allBytesSentToDevices': 0,
-        }
+        cls.METRICS.reset(cls.DATA_STREAMS)
 
     def run(self) -> None:
         while not self._stopped:
@@ -84,7 +90,7 @@ class StatisticsService(Thread):
                 if datetime.datetime.now() - self._last_streams_statistics_clear_time >= datetime.timedelta(days=1):
                     self.clear_streams_statistics()
 
-                self._gateway.tb_client.client.send_telemetry(StatisticsService.DATA_STREAMS_STATISTICS)
+                self._gateway.tb_client.client.send_telemetry(self.METRICS.collect())
 
                 self._last_poll = time()
 
@@ -94,6 +100,7 @@ class StatisticsService(Thread):
         def __init__(self, start_stat_type, end_stat_type=None):
             self.start_stat_type = start_stat_type
             self.end_stat_type = end_stat_type
+            self.is_uplink = start_stat_type == 'receivedBytesFromDevices'
 
         def __call__(self, func):
             def inner(*args, **kwargs):
@@ -103,7 +110,12 @@ class StatisticsService(Thread):
                 except ValueError:
                     pass
 
-                result = func(*args, **kwargs)
+                if self.is_uplink and LatencyTracer.trace_conversions:
+                    received_at = time()
+                    result = func(*args, **kwargs)
+                    stamp_conversion(received_at, time())
+                else:
+                    result = func(*args, **kwargs)
                 if result and self.end_stat_type:
                     self.collect(self.end_stat_type, result)
 
@@ -113,8 +125,9 @@ class StatisticsService(Thread):
 
         @staticmethod
         def collect(stat_type, data):
-            bytes_count = str(data).__sizeof__()
-            StatisticsService.add_bytes(stat_type, bytes_count)
+            bytes_count = StatisticsService.METRICS.estimate_size(data)
+            if bytes_count:
+                StatisticsService.add_bytes(stat_type, bytes_count)
 
     class CollectAllReceivedBytesStatistics(CollectStatistics):
         def __call__(self, func):
@@ -31,9 +31,22 @@ except ImportError:
     TBUtility.install_package('tb-mqtt-client')
     from tb_gateway_mqtt import TBGatewayMqttClient, TBDeviceMqttClient
 
+from thingsboard_gateway.gateway.persistent_session import PersistentSession
+from thingsboard_gateway.gateway.protobuf_payload import ProtobufTBGatewayMqttClient
+from thingsboard_gateway.gateway.rate_limiter import RateLimitedClientMixin, RateLimiter
+from thingsboard_gateway.gateway.uplink_tuner import PublishLatencyMonitor
+
 log = logging.getLogger("tb_connection")
 
 
+class RateLimitedTBGatewayMqttClient(RateLimitedClientMixin, TBGatewayMqttClient):
+    pass
+
+
+class RateLimitedProtobufTBGatewayMqttClient(RateLimitedClientMixin, ProtobufTBGatewayMqttClient):
+    pass
+
+
 class TBClient(threading.Thread):
     def __init__(self, config, config_folder_path):
         super().__init__()
@@ -44,6 +57,7 @@ class TBClient(threading.Thread):
         self.__host = config["host"]
         self.__port = config.get("port", 1883)
         self.__default_quality_of_service = config.get("qos", 1)
+        self.__payload_type = config.get("payloadType", "json").lower()
         self.__min_reconnect_delay = 1
         self.__ca_cert = None
         self.__private_key = None
@@ -55,6 +69,9 @@ class TBClient(threading.Thread):
         self.__stopped = False
         self.__paused = False
         self._last_cert_check_time = 0
+        self.rate_limiter = RateLimiter(config.get("rateLimits", {}))
+        self.publish_latency_monitor = PublishLatencyMonitor()
+        self.persistent_session = PersistentSession(config.get("persistentSession", {}), config_folder_path)
 
         # check if provided creds or provisioning strategy
         if config.get('security'):
@@ -110,6 +127,7 @@ class TBClient(threading.Thread):
         # Adding callbacks
         self.client._client._on_connect = self._on_connect
         self.client._client._on_disconnect = self._on_disconnect
+        self.client._client._on_publish = self._on_publish
         # self.client._client._on_log = self._on_log
         self.start()
 
@@ -129,10 +147,24 @@ class TBClient(threading.Thread):
             self.__password = str(credentials["password"])
         if credentials.get("clientId") is not None:
             self.__client_id = str(credentials["clientId"])
+        elif self.persistent_session.is_enabled():
+            self.__client_id = self.persistent_session.client_id
 
-        self.client = TBGatewayMqttClient(self.__host, self.__port, self.__username, self.__password, self,
-                                          quality_of_service=self.__default_quality_of_service,
-                                          client_id=self.__client_id)
+        if self.rate_limiter.is_enabled():
+            client_class = RateLimitedProtobufTBGatewayMqttClient if self.is_protobuf_payload_type() \
+                else RateLimitedTBGatewayMqttClient
+        else:
+            client_class = ProtobufTBGatewayMqttClient if self.is_protobuf_payload_type() else TBGatewayMqttClient
+        self.client = client_class(self.__host, self.__port, self.__username, self.__password, self,
+                                   quality_of_service=self.__default_quality_of_service,
+                                   client_id=self.__client_id)
+        if self.rate_limiter.is_enabled():
+            self.client.rate_limiter = self.rate_limiter
+        if self.persistent_session.is_enabled():
+            # The client is created by the library with a clean session, MQTT 3.1.1 is used
+            # pylint: disable=protected-access
+            self.client._client._clean_session = False
+            log.info("Persistent MQTT session is used, client id: %s", self.__client_id)
         if self.__tls:
             self.__ca_cert = self.__config_folder_path + credentials.get("caCert") if credentials.get(
                 "caCert") is not None else None
@@ -205,6 +237,15 @@ class TBClient(threading.Thread):
     def is_connected(self):
         return self.__is_connected
 
+    def is_protobuf_payload_type(self):
+        return self.__payload_type == "protobuf"
+
+    def has_send_budget(self):
+        return self.rate_limiter.has_budget()
+
+    def get_send_budget(self):
+        return self.rate_limiter.get_budget()
+
     def _on_connect(self, client, userdata, flags, result_code, *extra_params):
         log.debug('TB client %s connected to ThingsBoard', str(client))
         if result_code == 0:
@@ -212,6 +253,14 @@ class TBClient(threading.Thread):
         # pylint: disable=protected-access
         self.client._on_connect(client, userdata, flags, result_code, *extra_params)
 
+    def _on_publish(self, client, userdata, mid):
+        # Called before the message is removed from the client, so the time it was sent is known
+        message = client._out_messages.get(mid)
+        if message is not None and message.timestamp:
+            self.publish_latency_monitor.on_acknowledged(message.timestamp)
+        # pylint: disable=protected-access
+        self.client._on_publish(client, userdata, mid)
+
     def _on_disconnect(self, client, userdata, result_code):
         # pylint: disable=protected-access
         if self.client._client != client:
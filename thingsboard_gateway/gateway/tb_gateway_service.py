@@ -18,6 +18,7 @@ import logging.handlers
 import multiprocessing.managers
 import os.path
 import subprocess
+from collections import deque
 from os import execv, listdir, path, pathsep, stat, system, environ
 from platform import system as platform_system
 from queue import SimpleQueue
@@ -27,21 +28,37 @@ from string import ascii_lowercase, hexdigits
 from sys import argv, executable, getsizeof
 from threading import RLock, Thread, main_thread, current_thread
 from time import sleep, time
+from zlib import crc32
 
 from simplejson import JSONDecodeError, dumps, load, loads
 from yaml import safe_load
 
+from thingsboard_gateway.gateway.backpressure import BackpressureController
+from thingsboard_gateway.gateway.catch_up import CatchUpController
 from thingsboard_gateway.gateway.constant_enums import DeviceActions, Status
-from thingsboard_gateway.gateway.constants import CONNECTED_DEVICES_FILENAME, CONNECTOR_PARAMETER, \
-    PERSISTENT_GRPC_CONNECTORS_KEY_FILENAME
+from thingsboard_gateway.gateway.constants import CONNECTED_DEVICES_FILENAME, CONNECTED_DEVICES_JOURNAL_FILENAME, \
+    CONNECTOR_PARAMETER, PERSISTENT_GRPC_CONNECTORS_KEY_FILENAME
 from thingsboard_gateway.gateway.device_filter import DeviceFilter
+from thingsboard_gateway.gateway.device_registry import DEVICE_CONNECTOR_INDEX, DEVICE_RENAMED_NAME_INDEX, \
+    DEVICE_TYPE_INDEX, DeviceRegistry
+from thingsboard_gateway.gateway.devices_reconnector import DevicesReconnector
 from thingsboard_gateway.gateway.duplicate_detector import DuplicateDetector
+from thingsboard_gateway.gateway.latency_tracer import LatencyTracer, TRACE_PUBLISHED, TRACE_STORAGE_PUT, \
+    TRACE_STORAGE_READ, stamp
+from thingsboard_gateway.gateway.metrics import DEFAULT_SIZE_SAMPLING_PERIOD
+from thingsboard_gateway.gateway.payload_packer import DeviceDataRecord, DeviceDataSplitter, EventPackBuilder
+from thingsboard_gateway.gateway.persistent_session import get_events_fingerprint
+from thingsboard_gateway.gateway.protobuf_payload import GATEWAY_ATTRIBUTES_TOPIC, GATEWAY_TELEMETRY_TOPIC
+from thingsboard_gateway.gateway.publish_window import PublishWindow
 from thingsboard_gateway.gateway.shell.proxy import AutoProxy
 from thingsboard_gateway.gateway.statistics_service import StatisticsService
 from thingsboard_gateway.gateway.tb_client import TBClient
+from thingsboard_gateway.gateway.uplink_tuner import UplinkAutoTuner
 from thingsboard_gateway.storage.file.file_event_storage import FileEventStorage
+from thingsboard_gateway.storage.lanes.lanes_event_storage import LanesEventStorage
 from thingsboard_gateway.storage.memory.memory_event_storage import MemoryEventStorage
 from thingsboard_gateway.storage.sqlite.sqlite_event_storage import SQLiteEventStorage
+from thingsboard_gateway.storage.tiered.tiered_event_storage import TieredEventStorage
 from thingsboard_gateway.tb_utility.tb_gateway_remote_configurator import RemoteConfigurator
 from thingsboard_gateway.tb_utility.tb_handler import TBLoggerHandler
 from thingsboard_gateway.tb_utility.tb_loader import TBModuleLoader
@@ -148,6 +165,13 @@ class TBGatewayService:
         'get_status',
         'get_storage_name',
         'get_storage_events_count',
+        'get_storage_fill_queues_depth',
+        'get_backpressure_state',
+        'get_storage_statistics',
+        'get_storage_lanes',
+        'get_storage_devices_pending_age',
+        'get_rate_limits_state',
+        'get_latency_state',
         'get_available_connectors',
         'get_connector_status',
         'get_connector_config'
@@ -203,6 +227,9 @@ class TBGatewayService:
         self.__connected_devices = {}
         self.__renamed_devices = {}
         self.__saved_devices = {}
+        self.__device_registry = DeviceRegistry(self._config_dir + CONNECTED_DEVICES_JOURNAL_FILENAME,
+                                                self._config_dir + CONNECTED_DEVICES_FILENAME)
+        self.__sent_connector_details = {}
         self.__events = []
         self.name = ''.join(choice(ascii_lowercase) for _ in range(64))
         self.__rpc_register_queue = SimpleQueue()
@@ -224,15 +251,30 @@ class TBGatewayService:
         log.addHandler(self.remote_handler)
         # self.main_handler.setTarget(self.remote_handler)
         self._default_connectors = DEFAULT_CONNECTORS
-        self.__converted_data_queue = SimpleQueue()
-        self.__save_converted_data_thread = Thread(name="Storage fill thread", daemon=True,
-                                                   target=self.__send_to_storage)
-        self.__save_converted_data_thread.start()
+        self.__max_payload_size_bytes = self.__config["thingsboard"].get("maxPayloadSizeBytes", 400)
+        self.__device_data_splitter = DeviceDataSplitter(self.__max_payload_size_bytes)
+        self.__storage_fill_batch_size = max(int(self.__config['thingsboard'].get('storageFillBatchSize', 1000)), 1)
+        self.__storage_fill_threads_count = max(int(self.__config['thingsboard'].get('storageFillThreads', 1)), 1)
+        self.__converted_data_queues = [SimpleQueue() for _ in range(self.__storage_fill_threads_count)]
+        self.__backpressure = BackpressureController(self.__config['thingsboard'].get('backpressure', {}),
+                                                     self.get_converted_data_queue_depth, self.__is_storage_full)
+        self.__catch_up = CatchUpController(self.__config['thingsboard'].get('catchUp', {}),
+                                            self.get_storage_events_count)
+        self.__latency_tracer = LatencyTracer(self.__config['thingsboard'].get('latencyTracing', {}),
+                                              StatisticsService.METRICS)
+        self.__save_converted_data_threads = []
+        for shard_index in range(self.__storage_fill_threads_count):
+            thread = Thread(name="Storage fill thread %i" % shard_index, daemon=True,
+                            target=self.__send_to_storage, args=(shard_index,))
+            self.__save_converted_data_threads.append(thread)
+            thread.start()
+        log.info("Storage fill stage started with %i thread(s).", self.__storage_fill_threads_count)
         self._implemented_connectors = {}
         self._event_storage_types = {
             "memory": MemoryEventStorage,
             "file": FileEventStorage,
             "sqlite": SQLiteEventStorage,
+            "tiered": TieredEventStorage,
         }
         self.__gateway_rpc_methods = {
             "ping": self.__rpc_ping,
@@ -257,7 +299,7 @@ class TBGatewayService:
         self.__rpc_processing_thread = Thread(target=self.__send_rpc_reply_processing, daemon=True,
                                               name="RPC processing thread")
         self.__rpc_processing_thread.start()
-        self._event_storage = self._event_storage_types[self.__config["storage"]["type"]](self.__config["storage"])
+        self._event_storage = self.__create_event_storage(self.__config["storage"])
         self.connectors_configs = {}
         self.__remote_configurator = None
         self.__request_config_after_connect = False
@@ -286,8 +328,35 @@ class TBGatewayService:
 
         self.__min_pack_send_delay_ms = self.__config['thingsboard'].get('minPackSendDelayMS', 200)
         self.__min_pack_send_delay_ms = self.__min_pack_send_delay_ms / 1000.0
-        self.__min_pack_size_to_send = self.__config['thingsboard'].get('minPackSizeToSend', 50)
-
+        if 'minPackSizeToSend' in self.__config['thingsboard']:
+            log.warning('"minPackSizeToSend" is deprecated and ignored. '
+                        'Use "maxPacksInFlight" and the pack size of the storage instead.')
+        self.__coalesce_publishes = self.__config['thingsboard'].get('coalescePublishes', False)
+        # The data of all the devices in the pack is sent in one message on the gateway topics
+        self.__send_pack_in_one_message = self.__coalesce_publishes or self.tb_client.is_protobuf_payload_type()
+        sent_bytes_counter = StatisticsService.METRICS.counter('allBytesSentToTB')
+        self.__event_pack_builder = EventPackBuilder(self.__max_payload_size_bytes, self.__send_data,
+                                                     coalesce=self.__coalesce_publishes,
+                                                     bytes_counter=sent_bytes_counter,
+                                                     pack_in_one_message=self.__send_pack_in_one_message)
+        self.__live_values_pack_builder = EventPackBuilder(self.__max_payload_size_bytes, self.__send_data,
+                                                           coalesce=self.__coalesce_publishes,
+                                                           bytes_counter=sent_bytes_counter,
+                                                           pack_in_one_message=self.__send_pack_in_one_message)
+        self.__persistent_session = self.tb_client.persistent_session.is_enabled()
+        self.__publish_window = PublishWindow(self.__config['thingsboard'].get('maxPacksInFlight', 1),
+                                              self.__config['thingsboard'].get('packAckTimeoutMs', 10000),
+                                              persistent_session=self.__persistent_session)
+        # Messages of the packs which were in flight before the restart, acknowledged ones are not published again
+        self.__restored_packs_state = deque(self.tb_client.persistent_session.pop_packs_state())
+        self.__pack_message_index = 0
+        self.__acknowledged_message_indexes = ()
+
+        self.__uplink_tuner = UplinkAutoTuner(self.__config['thingsboard'].get('autoTune', {}), self.__publish_window,
+                                              self._event_storage, self.__min_pack_send_delay_ms * 1000)
+        self.__devices_reconnector = DevicesReconnector(self.__config['thingsboard'].get('devicesReconnect', {}),
+                                                        self.__reconnect_device, self.__save_persistent_devices_batch,
+                                                        self.__publish_window.is_full)
         self._send_thread = Thread(target=self.__read_data_from_storage, daemon=True,
                                    name="Send data to Thingsboard Thread")
         self._send_thread.start()
@@ -369,7 +438,9 @@ class TBGatewayService:
             self.__statistics_service = StatisticsService(self.__statistics['statsSendPeriodInSeconds'], self, log,
                                                           config_path=self._config_dir + self.__statistics[
                                                               'configuration'] if self.__statistics.get(
-                                                              'configuration') else None)
+                                                              'configuration') else None,
+                                                          size_sampling_period=self.__statistics.get(
+                                                              'sizeSamplingPeriod', DEFAULT_SIZE_SAMPLING_PERIOD))
         else:
             self.__statistics_service = None
 
@@ -420,13 +491,19 @@ class TBGatewayService:
 
                 if not self.tb_client.is_connected() and self.__subscribed_to_rpc_topics:
                     self.__subscribed_to_rpc_topics = False
+                    self.__devices_reconnector.cancel()
+                    self._event_storage.set_connected(False)
+                    self.__catch_up.set_connected(False)
 
                 if self.tb_client.is_connected() and not self.__subscribed_to_rpc_topics:
-                    for device in self.__saved_devices:
-                        self.add_device(device, {"connector": self.__saved_devices[device]["connector"]},
-                                        device_type=self.__saved_devices[device]["device_type"], reconnect=True)
+                    with self.__lock:
+                        saved_devices = [(device_name, device["connector"], device["device_type"])
+                                         for (device_name, device) in self.__saved_devices.items()]
+                    self.__devices_reconnector.reconnect(saved_devices)
                     self.subscribe_to_required_topics()
                     self.__subscribed_to_rpc_topics = True
+                    self._event_storage.set_connected(True)
+                    self.__catch_up.set_connected(True)
 
                 if self.__scheduled_rpc_calls:
                     for rpc_call_index in range(len(self.__scheduled_rpc_calls)):
@@ -518,7 +595,10 @@ class TBGatewayService:
         if os.path.exists("/tmp/gateway"):
             os.remove("/tmp/gateway")
         self.__close_connectors()
+        self.tb_client.persistent_session.save_packs_state(self.__publish_window.get_state())
         self._event_storage.stop()
+        self.__devices_reconnector.stop()
+        self.__device_registry.close()
         log.info("The gateway has been stopped.")
         self.tb_client.disconnect()
         self.tb_client.stop()
@@ -611,8 +691,8 @@ class TBGatewayService:
             del self.__saved_devices[deleted_device_name]
             log.debug("Device %s - was removed from __saved_devices", deleted_device_name)
         self.__duplicate_detector.delete_device(deleted_device_name)
-        self.__save_persistent_devices()
-        self.__load_persistent_devices()
+        self.__device_registry.delete(deleted_device_name)
+        self.__sent_connector_details.pop(deleted_device_name, None)
 
     def __process_renamed_gateway_devices(self, renamed_device: dict):
         if self.__config.get('handleDeviceRenaming', True):
@@ -625,8 +705,7 @@ class TBGatewayService:
             self.__renamed_devices[device_name_key] = new_device_name
             self.__duplicate_detector.rename_device(old_device_name, new_device_name)
 
-            self.__save_persistent_devices()
-            self.__load_persistent_devices()
+            self.__device_registry.rename(device_name_key, new_device_name)
             log.debug("Current renamed_devices dict: %s", self.__renamed_devices)
         else:
             log.debug("Received renamed device notification %r, but device renaming handle is disabled", renamed_device)
@@ -857,6 +936,7 @@ class TBGatewayService:
 
     def send_to_storage(self, connector_name, data):
         try:
+            trace = self.__latency_tracer.start(connector_name)
             device_valid = True
             if self.__device_filter:
                 device_valid = self.__device_filter.validate_device(connector_name, data)
@@ -865,9 +945,12 @@ class TBGatewayService:
                 log.warning('Device %s forbidden', data['deviceName'])
                 return Status.FORBIDDEN_DEVICE
 
+            if self.__backpressure.acquire() == Status.BACKPRESSURE:
+                return Status.BACKPRESSURE
+
             filtered_data = self.__duplicate_detector.filter_data(connector_name, data)
             if filtered_data:
-                self.__converted_data_queue.put((connector_name, filtered_data), True, 100)
+                self.__put_to_converted_data_queue(connector_name, filtered_data, trace)
                 return Status.SUCCESS
             else:
                 return Status.NO_NEW_DATA
@@ -875,103 +958,144 @@ class TBGatewayService:
             log.exception("Cannot put converted data!", e)
             return Status.FAILURE
 
-    def __send_to_storage(self):
+    def __get_storage_fill_shard(self, data):
+        if self.__storage_fill_threads_count == 1 or not isinstance(data, dict):
+            return 0
+        device_name = data.get('deviceName')
+        if device_name is None:
+            return 0
+        return crc32(str(device_name).encode('utf-8')) % self.__storage_fill_threads_count
+
+    def __put_to_converted_data_queue(self, connector_name, data, trace=None):
+        # Data of a device is always processed by the same storage fill thread to keep its order
+        # The trace follows only the first device data of the message
+        if isinstance(data, list) and self.__storage_fill_threads_count > 1:
+            sharded_data = {}
+            for item in data:
+                sharded_data.setdefault(self.__get_storage_fill_shard(item), []).append(item)
+            for shard_index, shard_data in sharded_data.items():
+                self.__converted_data_queues[shard_index].put((connector_name, shard_data, trace), True, 100)
+                trace = None
+        else:
+            self.__converted_data_queues[self.__get_storage_fill_shard(data)].put((connector_name, data, trace),
+                                                                                  True, 100)
+
+    def __send_to_storage(self, shard_index=0):
+        converted_data_queue = self.__converted_data_queues[shard_index]
         while not self.stopped:
             try:
-                if not self.__converted_data_queue.empty():
-                    connector_name, event = self.__converted_data_queue.get(True, 100)
-                    data_array = event if isinstance(event, list) else [event]
-                    for data in data_array:
-                        if not connector_name == self.name:
-                            if 'telemetry' not in data:
-                                data['telemetry'] = []
-                            if 'attributes' not in data:
-                                data['attributes'] = []
-                            if not TBUtility.validate_converted_data(data):
-                                log.error("Data from %s connector is invalid.", connector_name)
-                                continue
-                            if data.get('deviceType') is None:
-                                device_name = data['deviceName']
-                                if self.__connected_devices.get(device_name) is not None:
-                                    data["deviceType"] = self.__connected_devices[device_name]['device_type']
-                                elif self.__saved_devices.get(device_name) is not None:
-                                    data["deviceType"] = self.__saved_devices[device_name]['device_type']
-                                else:
-                                    data["deviceType"] = "default"
-                            if data["deviceName"] not in self.get_devices() and self.tb_client.is_connected():
-                                self.add_device(data["deviceName"],
-                                                {"connector": self.available_connectors[connector_name]},
-                                                device_type=data["deviceType"])
-                            if not self.__connector_incoming_messages.get(connector_name):
-                                self.__connector_incoming_messages[connector_name] = 0
-                            else:
-                                self.__connector_incoming_messages[connector_name] += 1
-                        else:
-                            data["deviceName"] = "currentThingsBoardGateway"
-                            data['deviceType'] = "gateway"
-
-                        if self.__check_devices_idle:
-                            self.__connected_devices[data['deviceName']]['last_receiving_data'] = time()
-
-                        data = self.__convert_telemetry_to_ts(data)
-
-                        max_data_size = self.__config["thingsboard"].get("maxPayloadSizeBytes", 400)
-                        if self.__get_data_size(data) >= max_data_size:
-                            # Data is too large, so we will attempt to send in pieces
-                            adopted_data = {"deviceName": data['deviceName'],
-                                            "deviceType": data['deviceType'],
-                                            "attributes": {},
-                                            "telemetry": []}
-                            empty_adopted_data_size = self.__get_data_size(adopted_data)
-                            adopted_data_size = empty_adopted_data_size
-
-                            # First, loop through the attributes
-                            for attribute in data['attributes']:
-                                adopted_data['attributes'].update(attribute)
-                                adopted_data_size += self.__get_data_size(attribute)
-                                if adopted_data_size >= max_data_size:
-                                    # We have surpassed the max_data_size, so send what we have and clear attributes
-                                    self.__send_data_pack_to_storage(adopted_data, connector_name)
-                                    adopted_data['attributes'] = {}
-                                    adopted_data_size = empty_adopted_data_size
-
-                            # Now, loop through telemetry. Possibly have some unsent attributes that have been adopted.
-                            telemetry = data['telemetry'] if isinstance(data['telemetry'], list) else [data['telemetry']]
-                            ts_to_index = {}
-                            for ts_kv_list in telemetry:
-                                ts = ts_kv_list['ts']
-                                for kv in ts_kv_list['values']:
-                                    if ts in ts_to_index:
-                                        kv_data = {kv: ts_kv_list['values'][kv]}
-                                        adopted_data['telemetry'][ts_to_index[ts]]['values'].update(kv_data)
-                                    else:
-                                        kv_data = {'ts': ts, 'values': {kv: ts_kv_list['values'][kv]}}
-                                        adopted_data['telemetry'].append(kv_data)
-                                        ts_to_index[ts] = len(adopted_data['telemetry']) - 1
-
-                                    adopted_data_size += self.__get_data_size(kv_data)
-                                    if adopted_data_size >= max_data_size:
-                                        # we have surpassed the max_data_size, so send what we have and clear attributes and telemetry
-                                        self.__send_data_pack_to_storage(adopted_data, connector_name)
-                                        adopted_data['telemetry'] = []
-                                        adopted_data['attributes'] = {}
-                                        adopted_data_size = empty_adopted_data_size
-                                        ts_to_index = {}
-
-                            # It is possible that we get here and have some telemetry or attributes not yet sent, so check for that.
-                            if len(adopted_data['telemetry']) > 0 or len(adopted_data['attributes']) > 0:
-                                self.__send_data_pack_to_storage(adopted_data, connector_name)
-                                # technically unnecessary to clear here, but leaving for consistency.
-                                adopted_data['telemetry'] = []
-                                adopted_data['attributes'] = {}
-                        else:
-                            self.__send_data_pack_to_storage(data, connector_name)
-
+                if self.__backpressure.is_throttled():
+                    self.__backpressure.update()
+                # While the storage is full the data is kept in the queue, so the connectors are throttled
+                if not converted_data_queue.empty() and not (self.__backpressure.is_enabled()
+                                                             and self.__is_storage_full()):
+                    # Everything received since the previous drain cycle is saved to the storage at once
+                    # The events are grouped by the storage lanes, everything is in the lane None without lanes
+                    events = {}
+                    events_sources = {}
+                    events_count = 0
+                    store_objects = self._event_storage.stores_objects()
+                    while not converted_data_queue.empty() and events_count < self.__storage_fill_batch_size:
+                        connector_name, event, trace = converted_data_queue.get(True, 100)
+                        data_array = event if isinstance(event, list) else [event]
+                        for data in data_array:
+                            events_count += self.__prepare_data_for_storage(connector_name, data, events,
+                                                                            events_sources, store_objects, trace)
+                            trace = None
+                    self.__send_data_packs_to_storage(events, events_sources)
                 else:
                     sleep(0.2)
             except Exception as e:
                 log.error(e)
 
+    def __create_event_storage(self, storage_config):
+        storage_class = self._event_storage_types[storage_config["type"]]
+        if storage_config.get("lanes"):
+            return LanesEventStorage(storage_config, storage_class)
+        return storage_class(storage_config)
+
+    def __is_storage_full(self):
+        return self._event_storage.is_full()
+
+    def __prepare_data_for_storage(self, connector_name, data, events, events_sources, store_objects=False,
+                                   trace=None):
+        if not connector_name == self.name:
+            if 'telemetry' not in data:
+                data['telemetry'] = []
+            if 'attributes' not in data:
+                data['attributes'] = []
+            if not TBUtility.validate_converted_data(data):
+                log.error("Data from %s connector is invalid.", connector_name)
+                return 0
+            if data.get('deviceType') is None:
+                device_name = data['deviceName']
+                if self.__connected_devices.get(device_name) is not None:
+                    data["deviceType"] = self.__connected_devices[device_name]['device_type']
+                elif self.__saved_devices.get(device_name) is not None:
+                    data["deviceType"] = self.__saved_devices[device_name]['device_type']
+                else:
+                    data["deviceType"] = "default"
+            if data["deviceName"] not in self.get_devices() and self.tb_client.is_connected():
+                self.add_device(data["deviceName"],
+                                {"connector": self.available_connectors[connector_name]},
+                                device_type=data["deviceType"])
+            with self.__lock:
+                if not self.__connector_incoming_messages.get(connector_name):
+                    self.__connector_incoming_messages[connector_name] = 0
+                else:
+                    self.__connector_incoming_messages[connector_name] += 1
+        else:
+            data["deviceName"] = "currentThingsBoardGateway"
+            data['deviceType'] = "gateway"
+
+        if self.__check_devices_idle:
+            self.__connected_devices[data['deviceName']]['last_receiving_data'] = time()
+
+        data = self.__convert_telemetry_to_ts(data)
+        self.__catch_up.update(data)
+
+        lanes_data = self._event_storage.split_by_lanes(connector_name, data, connector_name == self.name)
+
+        events_count = 0
+        source = (data["deviceName"], connector_name)
+        for (lane, lane_data) in lanes_data:
+            lane_events = events.setdefault(lane, [])
+            lane_events_count = len(lane_events)
+            if store_objects:
+                record = DeviceDataRecord(lane_data)
+                if record.max_message_size() > self.__max_payload_size_bytes:
+                    # Some of the values don't fit a message with the device name, so we will attempt to send in pieces
+                    for adopted_data in self.__device_data_splitter.split(lane_data):
+                        lane_events.append(DeviceDataRecord(adopted_data))
+                else:
+                    lane_events.append(record)
+            else:
+                json_data = dumps(lane_data)
+                if len(json_data) > self.__max_payload_size_bytes:
+                    # Data is too large, so we will attempt to send in pieces
+                    for adopted_data in self.__device_data_splitter.split(lane_data):
+                        lane_events.append(dumps(adopted_data))
+                else:
+                    lane_events.append(json_data)
+            if trace is not None and len(lane_events) > lane_events_count:
+                self.__attach_trace(lane_events, lane_events_count, trace)
+                trace = None
+            events_sources.setdefault(lane, set()).add(source)
+            events_count += len(lane_events) - lane_events_count
+        return events_count
+
+    @staticmethod
+    def __attach_trace(lane_events, event_index, trace):
+        stamp(trace, TRACE_STORAGE_PUT)
+        event = lane_events[event_index]
+        if isinstance(event, DeviceDataRecord):
+            event.trace = trace
+        else:
+            # Only the sampled events are parsed again, the trace is read back with the event from any storage
+            event_data = loads(event)
+            event_data["trace"] = trace
+            lane_events[event_index] = dumps(event_data)
+
     @staticmethod
     def __get_data_size(data: dict):
         return getsizeof(str(data))
@@ -1000,140 +1124,231 @@ class TBGatewayService:
             data["telemetry"] = {"ts": int(time() * 1000), "values": telemetry}
         return data
 
-    def __send_data_pack_to_storage(self, data, connector_name):
-        json_data = dumps(data)
-        save_result = self._event_storage.put(json_data)
-        if not save_result:
-            log.error('Data from the device "%s" cannot be saved, connector name is %s.',
-                      data["deviceName"],
-                      connector_name)
-
-    def check_size(self, devices_data_in_event_pack):
-        if self.__get_data_size(devices_data_in_event_pack) >= self.__config["thingsboard"].get("maxPayloadSizeBytes",
-                                                                                                400):
-            self.__send_data(devices_data_in_event_pack)
-            for device in devices_data_in_event_pack:
-                devices_data_in_event_pack[device]["telemetry"] = []
-                devices_data_in_event_pack[device]["attributes"] = {}
+    def __send_data_packs_to_storage(self, events, events_sources):
+        for (lane, lane_events) in events.items():
+            if not lane_events:
+                continue
+            save_result = self._event_storage.put_lane_batch(lane_events, lane)
+            if not save_result:
+                for (device_name, connector_name) in events_sources[lane]:
+                    log.error('Data from the device "%s" cannot be saved, connector name is %s.',
+                              device_name,
+                              connector_name)
 
     def __read_data_from_storage(self):
-        devices_data_in_event_pack = {}
+        event_pack_builder = self.__event_pack_builder
+        publish_window = self.__publish_window
+        latency_tracer = self.__latency_tracer
         log.debug("Send data Thread has been started successfully.")
         log.debug("Maximal size of the client message queue is: %r", self.tb_client.client._client._max_queued_messages)
 
+        was_connected = False
         while not self.stopped:
             try:
                 if self.tb_client.is_connected():
-                    events = []
+                    if not was_connected:
+                        was_connected = True
+                        if self.__persistent_session:
+                            # Not acknowledged messages are sent again by the client in the resumed session
+                            publish_window.restart_timeouts()
+                            self.tb_client.persistent_session.save_packs_state([])
+                    self.__confirm_acknowledged_event_packs()
+                    self.__uplink_tuner.update(self.tb_client.publish_latency_monitor)
+                    if publish_window.is_failed():
+                        self.__uplink_tuner.on_failure()
+                        log.warning("%i event pack(s) were not acknowledged by ThingsBoard, sending them again.",
+                                    len(publish_window))
+                        self.__resend_event_packs()
+
+                    if publish_window.is_full() or self.__rpc_reply_sent or (
+                            self.__remote_configurator is not None and self.__remote_configurator.in_process):
+                        sleep(.01)
+                        continue
 
-                    if self.__remote_configurator is None or not self.__remote_configurator.in_process:
-                        events = self._event_storage.get_event_pack()
+                    if not self.tb_client.has_send_budget():
+                        # The rate limits are exhausted, the next pack is read when it can be sent
+                        sleep(.01)
+                        continue
 
-                    if events:
-                        for event in events:
-                            try:
-                                current_event = loads(event)
-                            except Exception as e:
-                                log.exception(e)
-                                continue
+                    live_values = self.__catch_up.get_live_values()
+                    if live_values:
+                        self.__send_live_values(live_values)
+                    if not self.__catch_up.is_backfill_allowed():
+                        sleep(.01)
+                        continue
 
-                            if not devices_data_in_event_pack.get(current_event["deviceName"]):
-                                devices_data_in_event_pack[current_event["deviceName"]] = {"telemetry": [],
-                                                                                           "attributes": {}}
-                            if current_event.get("telemetry"):
-                                if isinstance(current_event["telemetry"], list):
-                                    for item in current_event["telemetry"]:
-                                        self.check_size(devices_data_in_event_pack)
-                                        devices_data_in_event_pack[current_event["deviceName"]]["telemetry"].append(
-                                            item)
-                                else:
-                                    self.check_size(devices_data_in_event_pack)
-                                    devices_data_in_event_pack[current_event["deviceName"]]["telemetry"].append(
-                                        current_event["telemetry"])
-                            if current_event.get("attributes"):
-                                if isinstance(current_event["attributes"], list):
-                                    for item in current_event["attributes"]:
-                                        self.check_size(devices_data_in_event_pack)
-                                        devices_data_in_event_pack[current_event["deviceName"]]["attributes"].update(
-                                            item.items())
-                                else:
-                                    self.check_size(devices_data_in_event_pack)
-                                    devices_data_in_event_pack[current_event["deviceName"]]["attributes"].update(
-                                        current_event["attributes"].items())
-                        if devices_data_in_event_pack:
-                            if not self.tb_client.is_connected():
+                    events = self._event_storage.get_event_pack()
+
+                    if events:
+                        pack_added = False
+                        try:
+                            fingerprint = get_events_fingerprint(events) if self.__persistent_session else None
+                            self.__pack_message_index = 0
+                            self.__acknowledged_message_indexes = self.__pop_restored_acknowledged_indexes(fingerprint)
+                            event_pack_builder.clear()
+                            trace_events = latency_tracer.is_enabled()
+                            pack_traces = []
+                            for event in events:
+                                if isinstance(event, DeviceDataRecord):
+                                    event_pack_builder.add_record(event)
+                                    if trace_events and event.trace is not None:
+                                        stamp(event.trace, TRACE_STORAGE_READ)
+                                        pack_traces.append(event.trace)
+                                    continue
+                                try:
+                                    current_event = loads(event)
+                                except Exception as e:
+                                    log.exception(e)
+                                    continue
+                                if trace_events and current_event.get("trace") is not None:
+                                    stamp(current_event["trace"], TRACE_STORAGE_READ)
+                                    pack_traces.append(current_event["trace"])
+
+                                device_name = current_event["deviceName"]
+                                if current_event.get("telemetry"):
+                                    if isinstance(current_event["telemetry"], list):
+                                        for item in current_event["telemetry"]:
+                                            event_pack_builder.add_telemetry(device_name, item)
+                                    else:
+                                        event_pack_builder.add_telemetry(device_name, current_event["telemetry"])
+                                if current_event.get("attributes"):
+                                    if isinstance(current_event["attributes"], list):
+                                        for item in current_event["attributes"]:
+                                            event_pack_builder.add_attributes(device_name, item)
+                                    else:
+                                        event_pack_builder.add_attributes(device_name, current_event["attributes"])
+                            if not self.tb_client.is_connected() and not self.__persistent_session:
                                 continue
                             while self.__rpc_reply_sent:
                                 sleep(.01)
-                            self.__send_data(devices_data_in_event_pack)
+                            event_pack_builder.flush()
+                            for trace in pack_traces:
+                                stamp(trace, TRACE_PUBLISHED)
 
-                        if self.tb_client.is_connected() and (
-                                self.__remote_configurator is None or not self.__remote_configurator.in_process):
-                            success = True
+                            published_messages = []
+                            message_indexes = []
                             while not self._published_events.empty():
-                                if (self.__remote_configurator is not None and self.__remote_configurator.in_process) or \
-                                        not self.tb_client.is_connected() or \
-                                        self._published_events.empty() or \
-                                        self.__rpc_reply_sent:
-                                    success = False
-                                    break
-
-                                events = [self._published_events.get(False, 10) for _ in
-                                          range(min(self.__min_pack_size_to_send, self._published_events.qsize()))]
-                                for event in events:
-                                    try:
-                                        if self.tb_client.is_connected() and (
-                                                self.__remote_configurator is None or not self.__remote_configurator.in_process):
-                                            if self.tb_client.client.quality_of_service == 1:
-                                                success = event.get() == event.TB_ERR_SUCCESS
-                                            else:
-                                                success = True
-                                        else:
-                                            break
-                                    except Exception as e:
-                                        log.exception(e)
-                                        success = False
-                            if success and self.tb_client.is_connected():
-                                self._event_storage.event_pack_processing_done()
-                                del devices_data_in_event_pack
-                                devices_data_in_event_pack = {}
-                        else:
-                            continue
+                                (message_index, published_message) = self._published_events.get(False)
+                                message_indexes.append(message_index)
+                                published_messages.append(published_message)
+                            publish_window.add_pack(published_messages,
+                                                    wait_for_ack=self.tb_client.client.quality_of_service == 1,
+                                                    fingerprint=fingerprint, message_indexes=message_indexes,
+                                                    acknowledged_indexes=self.__acknowledged_message_indexes,
+                                                    traces=pack_traces)
+                            pack_added = True
+                            self.__acknowledged_message_indexes = ()
+                        finally:
+                            if not pack_added:
+                                # The pack is not in the publish window, so it is read again after the rewind
+                                self.__drop_published_events()
+                                self.__resend_event_packs()
+                        self.__confirm_acknowledged_event_packs()
+                        self.__catch_up.on_backfill(len(events))
+                    elif len(publish_window):
+                        sleep(.01)
                     else:
-                        sleep(self.__min_pack_send_delay_ms)
+                        sleep(self.__uplink_tuner.send_delay_ms / 1000)
                 else:
+                    if was_connected:
+                        was_connected = False
+                        if self.__persistent_session:
+                            # The packs are kept for the resumed session, their state is saved in case of restart
+                            self.tb_client.persistent_session.save_packs_state(publish_window.get_state())
+                    if len(publish_window) and not self.__persistent_session:
+                        # Not acknowledged packs will be sent again after reconnect
+                        self.__resend_event_packs()
                     sleep(1)
             except Exception as e:
                 log.exception(e)
                 sleep(1)
 
-    @StatisticsService.CollectAllSentTBBytesStatistics(start_stat_type='allBytesSentToTB')
+    def __send_live_values(self, devices_values):
+        live_values_pack_builder = self.__live_values_pack_builder
+        live_values_pack_builder.clear()
+        for (device_name, values) in devices_values.items():
+            for item in values["telemetry"]:
+                live_values_pack_builder.add_telemetry(device_name, item)
+            if values["attributes"]:
+                live_values_pack_builder.add_attributes(device_name, values["attributes"])
+        live_values_pack_builder.flush()
+        # The same values are delivered with the backlog, so the acknowledgements of the live values are not awaited
+        self.__drop_published_events()
+        log.debug("Latest values of %i device(s) were sent.", len(devices_values))
+
+    def __drop_published_events(self):
+        while not self._published_events.empty():
+            self._published_events.get(False)
+
+    def __confirm_acknowledged_event_packs(self):
+        for _ in range(self.__publish_window.pop_acknowledged()):
+            self._event_storage.event_pack_processing_done()
+        for trace in self.__publish_window.pop_acknowledged_traces():
+            self.__latency_tracer.complete(trace)
+
+    def __resend_event_packs(self):
+        self.__publish_window.clear()
+        self._event_storage.rewind()
+
     def __send_data(self, devices_data_in_event_pack):
         try:
+            send_pack_in_one_message = self.__send_pack_in_one_message
+            gateway_devices_attributes = {}
+            gateway_devices_telemetry = {}
             for device in devices_data_in_event_pack:
                 final_device_name = device if self.__renamed_devices.get(device) is None else self.__renamed_devices[
                     device]
 
                 if devices_data_in_event_pack[device].get("attributes"):
                     if device == self.name or device == "currentThingsBoardGateway":
-                        self._published_events.put(
-                            self.tb_client.client.send_attributes(devices_data_in_event_pack[device]["attributes"]))
+                        self.__publish(self.tb_client.client.send_attributes,
+                                       devices_data_in_event_pack[device]["attributes"])
+                    elif send_pack_in_one_message:
+                        gateway_devices_attributes.setdefault(final_device_name, {}).update(
+                            devices_data_in_event_pack[device]["attributes"])
                     else:
-                        self._published_events.put(self.tb_client.client.gw_send_attributes(final_device_name,
-                                                                                            devices_data_in_event_pack[
-                                                                                                device]["attributes"]))
+                        self.__publish(self.tb_client.client.gw_send_attributes, final_device_name,
+                                       devices_data_in_event_pack[device]["attributes"])
                 if devices_data_in_event_pack[device].get("telemetry"):
                     if device == self.name or device == "currentThingsBoardGateway":
-                        self._published_events.put(
-                            self.tb_client.client.send_telemetry(devices_data_in_event_pack[device]["telemetry"]))
+                        self.__publish(self.tb_client.client.send_telemetry,
+                                       devices_data_in_event_pack[device]["telemetry"])
+                    elif send_pack_in_one_message:
+                        gateway_devices_telemetry.setdefault(final_device_name, []).extend(
+                            devices_data_in_event_pack[device]["telemetry"])
                     else:
-                        self._published_events.put(self.tb_client.client.gw_send_telemetry(final_device_name,
-                                                                                           devices_data_in_event_pack[
-                                                                                               device]["telemetry"]))
+                        self.__publish(self.tb_client.client.gw_send_telemetry, final_device_name,
+                                       devices_data_in_event_pack[device]["telemetry"])
                 devices_data_in_event_pack[device] = {"telemetry": [], "attributes": {}}
+            if gateway_devices_attributes:
+                self.__publish(self.tb_client.client.publish_data, gateway_devices_attributes,
+                               GATEWAY_ATTRIBUTES_TOPIC, 1)
+            if gateway_devices_telemetry:
+                self.__publish(self.tb_client.client.publish_data, gateway_devices_telemetry,
+                               GATEWAY_TELEMETRY_TOPIC, 1)
         except Exception as e:
             log.exception(e)
 
+    def __publish(self, publish_function, *args):
+        # Messages are counted in the pack, the ones acknowledged before the restart are skipped
+        message_index = self.__pack_message_index
+        self.__pack_message_index += 1
+        if message_index in self.__acknowledged_message_indexes:
+            return
+        self._published_events.put((message_index, publish_function(*args)))
+
+    def __pop_restored_acknowledged_indexes(self, fingerprint):
+        # Packs are read from the storage in the order they were in flight, so only the oldest one may match
+        if not self.__restored_packs_state:
+            return ()
+        if fingerprint is not None and self.__restored_packs_state[0]["fingerprint"] == fingerprint:
+            acknowledged_indexes = set(self.__restored_packs_state.popleft()["acknowledged"])
+            log.info("%i message(s) of the event pack were acknowledged before the restart.",
+                     len(acknowledged_indexes))
+            return acknowledged_indexes
+        self.__restored_packs_state.clear()
+        return ()
+
     def _rpc_request_handler(self, request_id, content):
         try:
             device = content.get("device")
@@ -1322,6 +1537,22 @@ class TBGatewayService:
             summary_messages['eventsSent'] += telemetry[
                 str(connector_camel_case + ' EventsSent').replace(' ', '')]
             summary_messages.update(telemetry)
+        for (shard_index, depth) in self.get_storage_fill_queues_depth().items():
+            summary_messages['storageFillQueue%iDepth' % shard_index] = depth
+        summary_messages['convertedDataQueueDepth'] = self.get_converted_data_queue_depth()
+        summary_messages['backpressureThrottled'] = self.__backpressure.is_throttled()
+        summary_messages['backpressureRejectedEvents'] = self.__backpressure.rejected_count
+        summary_messages.update(self.tb_client.rate_limiter.get_statistics())
+        summary_messages.update(self.__uplink_tuner.get_statistics())
+        summary_messages['catchUpActive'] = self.__catch_up.is_active()
+        summary_messages['catchUpCount'] = self.__catch_up.catch_up_count
+        summary_messages['catchUpLiveUpdates'] = self.__catch_up.live_updates_count
+        summary_messages['catchUpBackfilledEvents'] = self.__catch_up.backfilled_count
+        summary_messages['devicesReconnectPending'] = self.__devices_reconnector.get_pending_devices_count()
+        summary_messages['publishedTelemetryMessages'] = self.__event_pack_builder.telemetry_messages_count
+        summary_messages['publishedAttributesMessages'] = self.__event_pack_builder.attributes_messages_count
+        summary_messages['publishFillRatio'] = round(self.__event_pack_builder.get_fill_ratio(), 3)
+        summary_messages.update(self._event_storage.get_statistics())
         return summary_messages
 
     def add_device_async(self, data):
@@ -1334,20 +1565,34 @@ class TBGatewayService:
     def add_device(self, device_name, content, device_type=None, reconnect=False):
         if device_name not in self.__saved_devices or reconnect:
             device_type = device_type if device_type is not None else 'default'
-            self.__connected_devices[device_name] = {**content, "device_type": device_type}
-            self.__saved_devices[device_name] = {**content, "device_type": device_type}
-            self.__save_persistent_devices()
-            device_details = {
-                'connectorType': content['connector'].get_type(),
-                'connectorName': content['connector'].get_name()
-            }
+            with self.__lock:
+                self.__connected_devices[device_name] = {**content, "device_type": device_type}
+                self.__saved_devices[device_name] = {**content, "device_type": device_type}
+                self.__save_persistent_device(device_name)
             self.tb_client.client.gw_connect_device(device_name, device_type)
+            self.__send_connector_details(device_name, content['connector'], skip_unchanged=False)
+
+    def __reconnect_device(self, device_name, connector, device_type):
+        if device_name not in self.__saved_devices or not self.tb_client.is_connected():
+            return False
+        self.tb_client.client.gw_connect_device(device_name, device_type)
+        self.__send_connector_details(device_name, connector)
+        return True
+
+    def __send_connector_details(self, device_name, connector, skip_unchanged=True):
+        device_details = {
+            'connectorType': connector.get_type(),
+            'connectorName': connector.get_name()
+        }
+        if not skip_unchanged or self.__sent_connector_details.get(device_name) != device_details:
             self.tb_client.client.gw_send_attributes(device_name, device_details)
+            self.__sent_connector_details[device_name] = device_details
 
     def update_device(self, device_name, event, content):
-        if event == 'connector' and self.__connected_devices[device_name].get(event) != content:
-            self.__save_persistent_devices()
+        connector_changed = event == 'connector' and self.__connected_devices[device_name].get(event) != content
         self.__connected_devices[device_name][event] = content
+        if connector_changed:
+            self.__save_persistent_device(device_name)
 
     def del_device_async(self, data):
         if data['deviceName'] in self.__saved_devices:
@@ -1360,13 +1605,15 @@ class TBGatewayService:
         self.tb_client.client.gw_disconnect_device(device_name)
         self.__connected_devices.pop(device_name)
         self.__saved_devices.pop(device_name)
-        self.__save_persistent_devices()
+        self.__device_registry.delete(device_name)
 
     def get_devices(self, connector_name: str = None):
-        return self.__connected_devices if connector_name is None else {
-            device_name: self.__connected_devices[device_name]["device_type"] for device_name in
-            self.__connected_devices.keys() if self.__connected_devices[device_name].get("connector") is not None and
-                                               self.__connected_devices[device_name]["connector"].get_name() == connector_name}
+        if connector_name is None:
+            return self.__connected_devices
+        # The registry keeps the devices of the connectors which are removed or not registered yet, they are skipped
+        if connector_name not in self.available_connectors:
+            return {}
+        return self.__device_registry.get_devices(connector_name)
 
     def __process_async_device_actions(self):
         while not self.stopped:
@@ -1401,58 +1648,49 @@ class TBGatewayService:
             log.exception(e)
 
     def __load_persistent_devices(self):
-        devices = None
-        if CONNECTED_DEVICES_FILENAME in listdir(self._config_dir) and \
-                path.getsize(self._config_dir + CONNECTED_DEVICES_FILENAME) > 0:
-            try:
-                devices = load_file(self._config_dir + CONNECTED_DEVICES_FILENAME)
-            except Exception as e:
-                log.exception(e)
-        else:
-            open(self._config_dir + CONNECTED_DEVICES_FILENAME, 'w').close()
+        devices = self.__device_registry.load()
 
-        if devices is not None:
-            log.debug("Loaded devices:\n %s", devices)
-            for device_name in devices:
+        if devices:
+            log.debug("Loaded %i device(s) from the devices journal.", len(devices))
+            for (device_name, device) in list(devices.items()):
                 try:
-                    if not isinstance(devices[device_name], list):
-                        open(self._config_dir + CONNECTED_DEVICES_FILENAME, 'w').close()
-                        log.debug("Old connected_devices file, new file will be created")
-                        return
-                    if self.available_connectors.get(devices[device_name][0]):
+                    if self.available_connectors.get(device[DEVICE_CONNECTOR_INDEX]):
                         device_data_to_save = {
-                            "connector": self.available_connectors[devices[device_name][0]],
-                            "device_type": devices[device_name][1]}
-                        if len(devices[device_name]) > 2 and device_name not in self.__renamed_devices:
-                            new_device_name = devices[device_name][2]
-                            self.__renamed_devices[device_name] = new_device_name
+                            "connector": self.available_connectors[device[DEVICE_CONNECTOR_INDEX]],
+                            "device_type": device[DEVICE_TYPE_INDEX]}
+                        if len(device) > DEVICE_RENAMED_NAME_INDEX and device_name not in self.__renamed_devices:
+                            self.__renamed_devices[device_name] = device[DEVICE_RENAMED_NAME_INDEX]
                         self.__connected_devices[device_name] = device_data_to_save
                         self.__saved_devices[device_name] = device_data_to_save
+                        # Connector details were sent when the device was registered
+                        self.__sent_connector_details[device_name] = {
+                            'connectorType': device_data_to_save["connector"].get_type(),
+                            'connectorName': device_data_to_save["connector"].get_name()
+                        }
                 except Exception as e:
                     log.exception(e)
                     continue
+            # The devices of the connectors which are not configured anymore are not connected again
+            deleted_devices_count = self.__device_registry.retain_connectors(self.available_connectors)
+            if deleted_devices_count:
+                log.info("Removed %i device(s) of the connectors which are not available from the devices journal.",
+                         deleted_devices_count)
         else:
             log.debug("No device found in connected device file.")
-            self.__connected_devices = {} if self.__connected_devices is None else self.__connected_devices
-
-    def __save_persistent_devices(self):
-        with self.__lock:
-            data_to_save = {}
-            for device in self.__connected_devices:
-                if self.__connected_devices[device]["connector"] is not None:
-                    data_to_save[device] = [self.__connected_devices[device]["connector"].get_name(),
-                                            self.__connected_devices[device]["device_type"]]
 
-                    if device in self.__renamed_devices:
-                        data_to_save[device].append(self.__renamed_devices.get(device))
-
-            with open(self._config_dir + CONNECTED_DEVICES_FILENAME, 'w') as config_file:
-                try:
-                    config_file.write(dumps(data_to_save, indent=2, sort_keys=True))
-                except Exception as e:
-                    log.exception(e)
+    def __save_persistent_device(self, device_name):
+        # Only the changed device is appended to the devices journal
+        device = self.__connected_devices.get(device_name)
+        if device is None:
+            self.__device_registry.delete(device_name)
+        elif device.get("connector") is not None:
+            self.__device_registry.put(device_name, device["connector"].get_name(), device["device_type"],
+                                       self.__renamed_devices.get(device_name))
 
-            log.debug("Saved connected devices.")
+    def __save_persistent_devices_batch(self, devices):
+        self.__device_registry.put_batch([(device_name, connector.get_name(), device_type,
+                                           self.__renamed_devices.get(device_name))
+                                          for (device_name, connector, device_type) in devices])
 
     def __check_devices_idle_time(self):
         check_devices_idle_every_sec = self.__devices_idle_checker.get('inactivityCheckPeriodSeconds', 1)
@@ -1493,7 +1731,39 @@ class TBGatewayService:
         return self._event_storage.__class__.__name__
 
     def get_storage_events_count(self):
-        return self._event_storage.len()
+        return self._event_storage.get_pending_events_count()
+
+    def get_storage_statistics(self):
+        return self._event_storage.get_statistics()
+
+    def get_storage_lanes(self):
+        return self._event_storage.get_lanes_state()
+
+    def get_storage_devices_pending_age(self):
+        return self._event_storage.get_devices_oldest_pending_age()
+
+    def get_storage_fill_queues_depth(self):
+        return {shard_index: converted_data_queue.qsize()
+                for (shard_index, converted_data_queue) in enumerate(self.__converted_data_queues)}
+
+    def get_converted_data_queue_depth(self):
+        return sum(converted_data_queue.qsize() for converted_data_queue in self.__converted_data_queues)
+
+    def get_backpressure_state(self):
+        return {"throttled": self.__backpressure.is_throttled(),
+                "throttleCount": self.__backpressure.throttle_count,
+                "rejectedEvents": self.__backpressure.rejected_count}
+
+    def get_poll_period_multiplier(self):
+        return self.__backpressure.get_poll_period_multiplier()
+
+    def get_rate_limits_state(self):
+        return {"enabled": self.tb_client.rate_limiter.is_enabled(),
+                "budget": self.tb_client.get_send_budget(),
+                **self.tb_client.rate_limiter.get_statistics()}
+
+    def get_latency_state(self):
+        return self.__latency_tracer.get_state()
 
     # Connectors -----------------
     def get_available_connectors(self):
@@ -0,0 +1,63 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from threading import Lock
+from time import monotonic
+
+
+class TokenBucket:
+    """
+    Token bucket which is refilled with "rate" tokens per second up to "capacity" tokens.
+    Rate lower or equal to zero means no limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None and capacity > 0 else max(rate, 1)
+        self.__tokens = self.capacity
+        self.__updated_at = monotonic()
+        self.__lock = Lock()
+
+    def is_unlimited(self):
+        return self.rate <= 0
+
+    def get_tokens(self):
+        with self.__lock:
+            self.__refill()
+            return self.__tokens
+
+    def consume(self, tokens=1):
+        # Takes the tokens if there are enough of them, returns False otherwise
+        if self.is_unlimited():
+            return True
+        with self.__lock:
+            self.__refill()
+            if self.__tokens < min(tokens, self.capacity):
+                return False
+            self.__tokens -= tokens
+            return True
+
+    def get_wait_time(self, tokens=1):
+        # Seconds to wait until the tokens can be consumed
+        if self.is_unlimited():
+            return 0
+        with self.__lock:
+            self.__refill()
+            missing_tokens = min(tokens, self.capacity) - self.__tokens
+            return max(missing_tokens, 0) / self.rate
+
+    def __refill(self):
+        now = monotonic()
+        self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated_at) * self.rate)
+        self.__updated_at = now
@@ -0,0 +1,149 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+
+log = getLogger("service")
+
+
+class PublishLatencyMonitor:
+    """
+    Publish-to-PUBACK latency and the count of the acknowledged messages, collected since the previous check.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__acks_count = 0
+        self.__latency_sum = 0
+        self.__max_latency = 0
+        self.__checked_at = monotonic()
+
+    def on_acknowledged(self, published_at):
+        latency = monotonic() - published_at
+        with self.__lock:
+            self.__acks_count += 1
+            self.__latency_sum += latency
+            if latency > self.__max_latency:
+                self.__max_latency = latency
+
+    def collect(self):
+        # Returns the acks count, ack rate per second and average and maximal latency in seconds since the last call
+        with self.__lock:
+            now = monotonic()
+            acks_count = self.__acks_count
+            average_latency = self.__latency_sum / acks_count if acks_count else 0
+            result = (acks_count, acks_count / max(now - self.__checked_at, 1e-9), average_latency, self.__max_latency)
+            self.__acks_count = 0
+            self.__latency_sum = 0
+            self.__max_latency = 0
+            self.__checked_at = now
+            return result
+
+
+class UplinkAutoTuner:
+    """
+    AIMD tuning of the uplink: the in-flight window, the pack size and the send delay.
+    Every period the PUBACK latency is compared with the target. While it is lower and messages are acknowledged,
+    the window and the pack size grow and the send delay shrinks by the steps. When the latency is higher or packs
+    are not acknowledged in time, the window and the pack size are multiplied by the decrease factor and the send
+    delay is divided by it. All values are kept within the configured bounds.
+    """
+
+    def __init__(self, config, publish_window, storage, send_delay_ms):
+        self.__enabled = config.get('enable', False)
+        self.__period = max(config.get('periodMs', 1000), 1) / 1000
+        self.__target_latency = max(config.get('targetLatencyMs', 500), 1) / 1000
+        self.__decrease_factor = min(max(float(config.get('decreaseFactor', .5)), .1), .9)
+        self.__min_packs_in_flight = max(int(config.get('minPacksInFlight', 1)), 1)
+        self.__max_packs_in_flight = max(int(config.get('maxPacksInFlight', 50)), self.__min_packs_in_flight)
+        self.__min_pack_size = max(int(config.get('minPackSize', 10)), 1)
+        self.__max_pack_size = max(int(config.get('maxPackSize', 1000)), self.__min_pack_size)
+        self.__pack_size_step = max(int(config.get('packSizeStep', 50)), 1)
+        self.__min_send_delay = max(config.get('minSendDelayMs', 0), 0)
+        self.__max_send_delay = max(config.get('maxSendDelayMs', 1000), self.__min_send_delay)
+        self.__send_delay_step = max(config.get('sendDelayStepMs', 10), 1)
+        self.__publish_window = publish_window
+        self.__storage = storage
+        self.__checked_at = monotonic()
+        self.__failed = False
+        self.packs_in_flight = publish_window.max_packs_in_flight
+        self.pack_size = storage.get_pack_size()
+        self.send_delay_ms = send_delay_ms
+        self.ack_rate = 0
+        self.average_latency = 0
+        self.decrease_count = 0
+        if self.__enabled:
+            self.packs_in_flight = self.__clamp(self.packs_in_flight, self.__min_packs_in_flight,
+                                                self.__max_packs_in_flight)
+            if self.pack_size is not None:
+                self.pack_size = self.__clamp(self.pack_size, self.__min_pack_size, self.__max_pack_size)
+            self.send_delay_ms = self.__clamp(self.send_delay_ms, self.__min_send_delay, self.__max_send_delay)
+            self.__apply()
+
+    def is_enabled(self):
+        return self.__enabled
+
+    def on_failure(self):
+        # Packs were not acknowledged in time or were not published
+        self.__failed = True
+
+    def update(self, latency_monitor):
+        # Called by the sending loop with the monitor of the current client, the values are changed once per period
+        now = monotonic()
+        if now - self.__checked_at < self.__period:
+            return
+        self.__checked_at = now
+        (acks_count, self.ack_rate, self.average_latency, _) = latency_monitor.collect()
+        if not self.__enabled:
+            return
+        if self.__failed or self.average_latency > self.__target_latency:
+            self.__failed = False
+            self.decrease_count += 1
+            self.packs_in_flight = max(int(self.packs_in_flight * self.__decrease_factor), self.__min_packs_in_flight)
+            if self.pack_size is not None:
+                self.pack_size = max(int(self.pack_size * self.__decrease_factor), self.__min_pack_size)
+            self.send_delay_ms = min(max(self.send_delay_ms / self.__decrease_factor, self.__send_delay_step),
+                                     self.__max_send_delay)
+            log.debug("Uplink is congested, average PUBACK latency is %.3f s: %i pack(s) in flight, pack size %r, "
+                      "send delay %i ms", self.average_latency, self.packs_in_flight, self.pack_size,
+                      self.send_delay_ms)
+        elif acks_count:
+            self.packs_in_flight = min(self.packs_in_flight + 1, self.__max_packs_in_flight)
+            if self.pack_size is not None:
+                self.pack_size = min(self.pack_size + self.__pack_size_step, self.__max_pack_size)
+            self.send_delay_ms = max(self.send_delay_ms - self.__send_delay_step, self.__min_send_delay)
+        else:
+            return
+        self.__apply()
+
+    def __apply(self):
+        self.__publish_window.max_packs_in_flight = self.packs_in_flight
+        if self.pack_size is not None:
+            self.__storage.set_pack_size(self.pack_size)
+
+    @staticmethod
+    def __clamp(value, min_value, max_value):
+        return min(max(value, min_value), max_value)
+
+    def get_statistics(self):
+        return {
+            "uplinkPacksInFlight": self.packs_in_flight,
+            "uplinkPackSize": self.pack_size,
+            "uplinkSendDelayMs": int(self.send_delay_ms),
+            "uplinkAckRate": round(self.ack_rate, 2),
+            "uplinkAckLatencyMs": int(self.average_latency * 1000),
+            "uplinkCongestionCount": self.decrease_count,
+        }
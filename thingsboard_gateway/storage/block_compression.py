@@ -0,0 +1,96 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from struct import Struct
+from zlib import compress as zlib_compress, decompress as zlib_decompress
+
+try:
+    from lzma import compress as lzma_compress, decompress as lzma_decompress
+except ImportError:
+    lzma_compress = None
+    lzma_decompress = None
+
+from thingsboard_gateway.storage.event_storage import log
+
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_LZMA = "lzma"
+
+# The codec is recorded with every block, so blocks written with different settings are read together
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+CODECS = {
+    COMPRESSION_NONE: CODEC_NONE,
+    COMPRESSION_ZLIB: CODEC_ZLIB,
+    COMPRESSION_LZMA: CODEC_LZMA,
+}
+
+# Record in a block is the length of the UTF-8 payload followed by the payload
+RECORD_HEADER = Struct('<I')
+
+
+def get_codec(compression):
+    compression = str(compression).lower()
+    if compression not in CODECS:
+        log.warning("Unknown compression %r, data is stored without compression.", compression)
+        return CODEC_NONE
+    if compression == COMPRESSION_LZMA and lzma_compress is None:
+        log.warning("lzma module is not available, zlib compression is used.")
+        return CODEC_ZLIB
+    return CODECS[compression]
+
+
+def encode_records(messages):
+    data = bytearray()
+    for message in messages:
+        payload = message.encode('utf-8')
+        data += RECORD_HEADER.pack(len(payload))
+        data += payload
+    return data
+
+
+def decode_records(data):
+    records = []
+    offset = 0
+    while offset < len(data):
+        (payload_size,) = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        records.append(str(data[offset:offset + payload_size], 'utf-8'))
+        offset += payload_size
+    return records
+
+
+def compress_block(data, codec):
+    # Returns the codec which was used and the block data, a block which is not shrunk by the codec is kept as is
+    if codec == CODEC_ZLIB:
+        compressed = zlib_compress(data)
+    elif codec == CODEC_LZMA:
+        compressed = lzma_compress(data)
+    else:
+        return CODEC_NONE, bytes(data)
+    if len(compressed) >= len(data):
+        return CODEC_NONE, bytes(data)
+    return codec, compressed
+
+
+def decompress_block(codec, data):
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib_decompress(data)
+    if codec == CODEC_LZMA and lzma_decompress is not None:
+        return lzma_decompress(data)
+    raise ValueError("Unsupported block codec %r" % codec)
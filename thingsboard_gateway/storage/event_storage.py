@@ -24,16 +24,71 @@ class EventStorage(ABC):
     def put(self, event):
         pass
 
+    def put_batch(self, events):
+        # Puts several events at once, returns True if all of them were saved
+        success = True
+        for event in events:
+            success = self.put(event) and success
+        return success
+
+    def split_by_lanes(self, connector_name, data, service_data=False):
+        # Returns the lanes with the data for them, storages without lanes keep all data in the lane None
+        return [(None, data)]
+
+    def put_lane_batch(self, events, lane):
+        # Puts several events to the lane returned by "split_by_lanes"
+        return self.put_batch(events)
+
+    def stores_objects(self):
+        # Indicates that events are put and got as objects, so they don't need to be serialized
+        return False
+
     @abstractmethod
     def get_event_pack(self):
-        # Returns max "10" events from pack
+        # Returns the next pack of events after the packs which were already read and not confirmed
         pass
 
     @abstractmethod
     def event_pack_processing_done(self):
-        # Indicates that events from previous "get_event_pack" may be cleared
+        # Indicates that events from the oldest not confirmed pack may be cleared
+        pass
+
+    def is_full(self):
+        # Indicates that new events can't be saved until the stored ones are sent
+        return False
+
+    def rewind(self):
+        # Read packs which are not confirmed will be returned by "get_event_pack" again, starting from the oldest one
+        pass
+
+    def set_connected(self, connected):
+        # Informs the storage about the state of the connection to ThingsBoard
+        pass
+
+    def get_pack_size(self):
+        # Returns the maximal count of events in a pack, None if the storage doesn't allow to change it
+        return None
+
+    def set_pack_size(self, events_count):
+        # Changes the maximal count of events in the next packs
         pass
 
+    def get_pending_events_count(self):
+        # Returns the count of the stored events which were not read yet, it is the backlog to send
+        return self.len()
+
+    def get_lanes_state(self):
+        # Returns the weight, backlog and count of drained events of every lane
+        return {}
+
+    def get_devices_oldest_pending_age(self):
+        # Returns the age in milliseconds of the oldest not sent event of every device, if the storage tracks it
+        return {}
+
+    def get_statistics(self):
+        # Returns the storage specific statistics to send with the gateway statistics
+        return {}
+
     @abstractmethod
     def stop(self):
         # Stop the storage processing
@@ -0,0 +1,58 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from threading import Lock
+
+
+class _PendingWrite:
+    __slots__ = ('messages', 'done', 'error')
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.done = False
+        self.error = None
+
+
+class EventStorageGroupCommit:
+    """
+    Coalesces concurrent writes: the thread which gets the write lock writes the messages of all threads waiting
+    for it with one write and one fsync, the other threads find their messages already written.
+    """
+
+    def __init__(self, write_batch):
+        self.__write_batch = write_batch
+        self.__pending_lock = Lock()
+        self.__write_lock = Lock()
+        self.__pending_writes = []
+        self.commits_count = 0
+
+    def write_batch(self, messages):
+        pending_write = _PendingWrite(messages)
+        with self.__pending_lock:
+            self.__pending_writes.append(pending_write)
+        with self.__write_lock:
+            if not pending_write.done:
+                with self.__pending_lock:
+                    group, self.__pending_writes = self.__pending_writes, []
+                error = None
+                try:
+                    self.__write_batch([message for write in group for message in write.messages])
+                except Exception as e:
+                    error = e
+                self.commits_count += 1
+                for write in group:
+                    write.error = error
+                    write.done = True
+        if pending_write.error is not None:
+            raise pending_write.error
@@ -12,15 +12,16 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-from base64 import b64decode
 from io import BufferedReader, FileIO
-from os import remove
+from os import remove, replace
 from os.path import exists
 
 from simplejson import JSONDecodeError, dumps, load
 
 from thingsboard_gateway.storage.file.event_storage_files import EventStorageFiles
 from thingsboard_gateway.storage.file.event_storage_reader_pointer import EventStorageReaderPointer
+from thingsboard_gateway.storage.file.event_storage_segment import SEGMENT_FORMAT_BINARY, get_index_file_name, \
+    get_segment_format, open_segment_reader, read_ahead
 from thingsboard_gateway.storage.file.file_event_storage import log
 from thingsboard_gateway.storage.file.file_event_storage_settings import FileEventStorageSettings
 
@@ -31,97 +32,100 @@ class EventStorageReader:
         self.files = files
         self.settings = settings
         self.current_batch = None
-        self.buffered_reader = None
+        self.segment_reader = None
         self.current_pos = self.read_state_file()
         self.new_pos = self.current_pos
 
     def read(self):
-        if self.current_batch is not None and self.current_batch:
-            log.debug("The previous batch was not discarded!")
-            return self.current_batch
+        # Reads the next batch after the last read one, even if the previous batches were not discarded yet
         self.current_batch = []
         records_to_read = self.settings.get_max_read_records_count()
         while records_to_read > 0:
             try:
-                current_line_in_file = self.new_pos.get_line()
-                self.buffered_reader = self.get_or_init_buffered_reader(self.new_pos)
-                if self.buffered_reader is not None:
-                    line = self.buffered_reader.readline()
-                    while line != b'':
-                        try:
-                            self.current_batch.append(b64decode(line).decode("utf-8"))
-                            records_to_read -= 1
-                        except IOError as e:
-                            log.warning("Could not parse line [%s] to uplink message! %s", line, e)
-                        except Exception as e:
-                            log.exception(e)
-                            current_line_in_file += 1
-                            self.new_pos.set_line(current_line_in_file)
-                            self.write_info_to_state_file(self.new_pos)
-                            break
-                        finally:
-                            current_line_in_file += 1
-                            if records_to_read > 0:
-                                line = self.buffered_reader.readline()
-                        self.new_pos.set_line(current_line_in_file)
-                        if records_to_read == 0:
-                            break
-
-                    if (self.settings.get_max_records_per_file() >= current_line_in_file >= 0) or \
-                            (line == b'' and current_line_in_file >= self.settings.get_max_records_per_file() - 1):
-                        previous_file = self.current_pos
-                        next_file = self.get_next_file(self.files, self.new_pos)
-                        # self.write_info_to_state_file(self.new_pos)
-                        if next_file is None:
-                            break
-                        self.delete_read_file(previous_file)
-                        if self.buffered_reader is not None:
-                            self.buffered_reader.close()
-                        # self.buffered_reader = None
-                        self.new_pos = EventStorageReaderPointer(next_file, 0)
-                        self.get_or_init_buffered_reader(self.new_pos)
-                        continue
-                    if line == b'':
-                        break
+                self.segment_reader = self.get_or_init_segment_reader(self.new_pos)
+                if self.segment_reader is None:
+                    break
+                record = self.segment_reader.read_record()
+                if record is not None:
+                    self.current_batch.append(record)
+                    records_to_read -= 1
+                    continue
+                self.new_pos = self.get_segment_reader_pointer()
+
+                # Move to the next file only when the current one is read to the end
+                next_file = self.get_next_file(self.files, self.new_pos)
+                if next_file is None:
+                    break
+                if self.segment_reader.has_more():
+                    # The last records were written after the end of the file was reached
                     continue
+                self.segment_reader.close()
+                self.new_pos = EventStorageReaderPointer(next_file, 0, 0)
             except IOError as e:
                 log.warning("[%s] Failed to read file! Error: %s", self.new_pos.get_file(), e)
+                self.close_segment_reader()
                 break
             except Exception as e:
                 log.exception(e)
+                self.close_segment_reader()
+                break
+        if self.segment_reader is not None and not self.segment_reader.closed:
+            self.new_pos = self.get_segment_reader_pointer()
         return self.current_batch
 
-    def discard_batch(self):
+    def get_segment_reader_pointer(self):
+        return EventStorageReaderPointer(self.new_pos.get_file(), self.segment_reader.line, self.segment_reader.offset)
+
+    def get_read_pointer(self):
+        return EventStorageReaderPointer(self.new_pos.get_file(), self.new_pos.get_line(), self.new_pos.get_offset())
+
+    def discard_batch(self, pointer: EventStorageReaderPointer = None):
+        # Commits the reading position up to the pointer (the last read position by default)
+        # and removes data files which were read completely
+        if pointer is None:
+            pointer = self.get_read_pointer()
         try:
-            if self.current_pos.get_line() >= self.settings.get_max_records_per_file() - 1:
-                if self.buffered_reader is not None and not self.buffered_reader.closed:
-                    self.buffered_reader.close()
-            self.write_info_to_state_file(self.new_pos)
-            self.current_pos = self.new_pos
+            self.write_info_to_state_file(pointer)
+            self.current_pos = pointer
             self.current_batch = None
+            for file in self.files.get_data_files():
+                if file == pointer.get_file():
+                    break
+                self.delete_read_file(EventStorageReaderPointer(file, 0))
         except Exception as e:
             log.exception(e)
 
-    def get_or_init_buffered_reader(self, pointer):
+    def get_or_init_segment_reader(self, pointer):
+        # Resumes from the byte offset of the pointer, legacy state files have the line number only
         try:
-            if self.buffered_reader is None or self.buffered_reader.closed:
-                new_file_to_read_path = self.settings.get_data_folder_path() + pointer.get_file()
-                self.buffered_reader = BufferedReader(FileIO(new_file_to_read_path, 'r'))
-                lines_to_skip = pointer.get_line()
-                if lines_to_skip > 0:
-                    while self.buffered_reader.readline() is not None:
-                        if lines_to_skip > 0:
-                            lines_to_skip -= 1
-                        else:
-                            break
-
-            return self.buffered_reader
-
+            if self.segment_reader is None or self.segment_reader.closed:
+                file_path = self.settings.get_data_folder_path() + pointer.get_file()
+                try:
+                    self.segment_reader = open_segment_reader(file_path, pointer.get_line(), pointer.get_offset(),
+                                                              self.settings.is_mmap_enabled())
+                except (ValueError, OSError) as e:
+                    if not self.settings.is_mmap_enabled():
+                        raise
+                    log.warning("Failed to map file %s, reading it without mmap. Error: %s", file_path, e)
+                    self.segment_reader = open_segment_reader(file_path, pointer.get_line(), pointer.get_offset())
+                self.read_ahead_next_file(pointer)
+            return self.segment_reader
         except IOError as e:
-            log.error("Failed to initialize buffered reader! Error: %s", e)
-            raise RuntimeError("Failed to initialize buffered reader!", e)
-        except Exception as e:
-            log.exception(e)
+            log.error("Failed to initialize segment reader! Error: %s", e)
+            raise RuntimeError("Failed to initialize segment reader!", e)
+
+    def read_ahead_next_file(self, pointer):
+        next_file = self.get_next_file(self.files, pointer)
+        if next_file is not None:
+            try:
+                read_ahead(self.settings.get_data_folder_path() + next_file)
+            except OSError as e:
+                log.debug("Failed to read ahead file %s! Error: %s", next_file, e)
+
+    def close_segment_reader(self):
+        if self.segment_reader is not None and not self.segment_reader.closed:
+            self.new_pos = self.get_segment_reader_pointer()
+            self.segment_reader.close()
 
     def read_state_file(self):
         try:
@@ -136,8 +140,10 @@ class EventStorageReader:
                 log.warning("Failed to fetch info from state file! Error: %s", e)
             reader_file = None
             reader_pos = 0
+            reader_offset = None
             if state_data_node:
                 reader_pos = state_data_node['position']
+                reader_offset = state_data_node.get('offset')
                 for file in sorted(self.files.get_data_files()):
                     if file == state_data_node['file']:
                         reader_file = file
@@ -145,18 +151,24 @@ class EventStorageReader:
             if reader_file is None:
                 reader_file = sorted(self.files.get_data_files())[0]
                 reader_pos = 0
+                reader_offset = 0
             log.info("FileStorage_reader -- Initializing from state file: [%s:%i]",
                      self.settings.get_data_folder_path() + reader_file,
                      reader_pos)
-            return EventStorageReaderPointer(reader_file, reader_pos)
+            return EventStorageReaderPointer(reader_file, reader_pos, reader_offset)
         except Exception as e:
             log.exception(e)
 
     def write_info_to_state_file(self, pointer: EventStorageReaderPointer):
         try:
-            state_file_node = {'file': pointer.get_file(), 'position': pointer.get_line()}
-            with open(self.settings.get_data_folder_path() + self.files.get_state_file(), 'w') as outfile:
+            state_file_node = {'file': pointer.get_file(), 'position': pointer.get_line(),
+                               'offset': pointer.get_offset()}
+            # The state is replaced atomically, so it is never read half-written after a crash
+            state_file_path = self.settings.get_data_folder_path() + self.files.get_state_file()
+            temp_state_file_path = self.settings.get_data_folder_path() + 'tmp_' + self.files.get_state_file()
+            with open(temp_state_file_path, 'w') as outfile:
                 outfile.write(dumps(state_file_node))
+            replace(temp_state_file_path, state_file_path)
         except IOError as e:
             log.warning("Failed to update state file! Error: %s", e)
         except Exception as e:
@@ -167,6 +179,9 @@ class EventStorageReader:
         try:
             if exists(self.settings.get_data_folder_path() + current_file.file) and len(data_files) > 1:
                 remove(self.settings.get_data_folder_path() + current_file.file)
+                index_file_path = self.settings.get_data_folder_path() + get_index_file_name(current_file.file)
+                if get_segment_format(current_file.file) == SEGMENT_FORMAT_BINARY and exists(index_file_path):
+                    remove(index_file_path)
             if current_file.file in data_files:
                 self.files.data_files.remove(current_file.file)
                 log.info("FileStorage_reader -- Cleanup old data file: %s%s!", self.settings.get_data_folder_path(), current_file.file)
@@ -174,8 +189,8 @@ class EventStorageReader:
             log.exception(e)
 
     def destroy(self):
-        if self.buffered_reader is not None:
-            self.buffered_reader.close()
+        if self.segment_reader is not None:
+            self.segment_reader.close()
             raise IOError
 
     @staticmethod
@@ -14,15 +14,17 @@
 
 
 class EventStorageReaderPointer:
-    def __init__(self, file, line):
+    def __init__(self, file, line, offset=None):
         self.file = file
         self.line = line
+        # Byte offset of the line in the file, None if it is unknown
+        self.offset = offset
 
     def __eq__(self, other):
-        return self.file == other.file and self.line == other.line
+        return self.file == other.file and self.line == other.line and self.offset == other.offset
 
     def __hash__(self):
-        return hash((self.file, self.line))
+        return hash((self.file, self.line, self.offset))
 
     def get_file(self):
         return self.file
@@ -30,8 +32,14 @@ class EventStorageReaderPointer:
     def get_line(self):
         return self.line
 
+    def get_offset(self):
+        return self.offset
+
     def set_file(self, file):
         self.file = file
 
     def set_line(self, line):
         self.line = line
+
+    def set_offset(self, offset):
+        self.offset = offset
@@ -0,0 +1,429 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from abc import ABC, abstractmethod
+from base64 import b64decode, b64encode
+from binascii import a2b_base64
+from collections import deque
+from io import BufferedReader, FileIO
+from mmap import ACCESS_READ, mmap
+from os import O_RDONLY, close, fstat, linesep, open as os_open, path, truncate
+from struct import Struct
+
+try:
+    from mmap import MADV_SEQUENTIAL
+except ImportError:
+    MADV_SEQUENTIAL = None
+
+try:
+    from os import POSIX_FADV_WILLNEED, posix_fadvise
+except ImportError:
+    posix_fadvise = None
+
+from thingsboard_gateway.storage.block_compression import RECORD_HEADER, compress_block, decode_records, \
+    decompress_block, encode_records
+from thingsboard_gateway.storage.event_storage import log
+
+SEGMENT_FORMAT_TEXT = "text"
+SEGMENT_FORMAT_BINARY = "binary"
+SEGMENT_FORMAT_COMPRESSED = "compressed"
+
+DATA_FILE_PREFIX = "data_"
+INDEX_FILE_PREFIX = "index_"
+TEXT_SEGMENT_EXTENSION = ".txt"
+BINARY_SEGMENT_EXTENSION = ".seg"
+COMPRESSED_SEGMENT_EXTENSION = ".zseg"
+INDEX_FILE_EXTENSION = ".idx"
+
+# Binary record is the length of the UTF-8 payload followed by the payload (RECORD_HEADER)
+# Index entry is the number of a record in the segment and its byte offset, one entry per INDEX_INTERVAL records
+INDEX_ENTRY = Struct('<QQ')
+INDEX_INTERVAL = 256
+# Compressed block is the codec, the count of records, the size of the block data and the number of the first record,
+# followed by the binary records compressed together
+BLOCK_HEADER = Struct('<BIIQ')
+
+LINE_SEPARATOR = linesep.encode('utf-8')
+
+
+def get_segment_extension(segment_format):
+    if segment_format == SEGMENT_FORMAT_COMPRESSED:
+        return COMPRESSED_SEGMENT_EXTENSION
+    return BINARY_SEGMENT_EXTENSION if segment_format == SEGMENT_FORMAT_BINARY else TEXT_SEGMENT_EXTENSION
+
+
+def get_segment_format(file_name):
+    if file_name.endswith(COMPRESSED_SEGMENT_EXTENSION):
+        return SEGMENT_FORMAT_COMPRESSED
+    return SEGMENT_FORMAT_BINARY if file_name.endswith(BINARY_SEGMENT_EXTENSION) else SEGMENT_FORMAT_TEXT
+
+
+def get_index_file_name(segment_file_name):
+    return INDEX_FILE_PREFIX + path.splitext(segment_file_name)[0][len(DATA_FILE_PREFIX):] + INDEX_FILE_EXTENSION
+
+
+def encode_text_records(messages):
+    return b''.join(b64encode(message.encode('utf-8')) + LINE_SEPARATOR for message in messages)
+
+
+def encode_binary_records(messages, first_record_number, first_record_offset):
+    # Returns the encoded records and the index entries for them
+    data = bytearray()
+    index = bytearray()
+    record_number = first_record_number
+    for message in messages:
+        if record_number % INDEX_INTERVAL == 0:
+            index += INDEX_ENTRY.pack(record_number, first_record_offset + len(data))
+        payload = message.encode('utf-8')
+        data += RECORD_HEADER.pack(len(payload))
+        data += payload
+        record_number += 1
+    return data, index
+
+
+def encode_compressed_block(messages, codec, first_record_number):
+    block_codec, data = compress_block(encode_records(messages), codec)
+    return BLOCK_HEADER.pack(block_codec, len(messages), len(data), first_record_number) + data
+
+
+def count_compressed_segment_records(segment_path):
+    # Returns the count of records and the size of the compressed segment, an incomplete block at the end is truncated
+    segment_size = path.getsize(segment_path)
+    records_count = 0
+    offset = 0
+    with open(segment_path, 'rb') as segment_file:
+        header = segment_file.read(BLOCK_HEADER.size)
+        while len(header) == BLOCK_HEADER.size:
+            _, block_records_count, data_size, _ = BLOCK_HEADER.unpack(header)
+            if offset + BLOCK_HEADER.size + data_size > segment_size:
+                break
+            offset += BLOCK_HEADER.size + data_size
+            records_count += block_records_count
+            segment_file.seek(offset)
+            header = segment_file.read(BLOCK_HEADER.size)
+
+    if offset < segment_size:
+        log.warning("Incomplete block at the end of %s is removed.", segment_path)
+        truncate(segment_path, offset)
+    return records_count, offset
+
+
+def count_binary_segment_records(segment_path, index_path):
+    """
+    Returns the count of records and the size of the binary segment, starting from the last index entry
+    which points inside the segment. An incomplete record at the end of the segment is truncated.
+    """
+    segment_size = path.getsize(segment_path)
+    records_count = 0
+    offset = 0
+    index_size = 0
+    if path.exists(index_path):
+        with open(index_path, 'rb') as index_file:
+            index = index_file.read()
+        for entry_offset in range(len(index) - len(index) % INDEX_ENTRY.size - INDEX_ENTRY.size, -1,
+                                  -INDEX_ENTRY.size):
+            entry_record_number, entry_record_offset = INDEX_ENTRY.unpack_from(index, entry_offset)
+            if entry_record_offset <= segment_size:
+                records_count, offset = entry_record_number, entry_record_offset
+                index_size = entry_offset + INDEX_ENTRY.size
+                break
+        if index_size < len(index):
+            # Entries written after the data which was lost would point to wrong records later
+            truncate(index_path, index_size)
+
+    with open(segment_path, 'rb') as segment_file:
+        segment_file.seek(offset)
+        header = segment_file.read(RECORD_HEADER.size)
+        while len(header) == RECORD_HEADER.size:
+            (payload_size,) = RECORD_HEADER.unpack(header)
+            if offset + RECORD_HEADER.size + payload_size > segment_size:
+                break
+            offset += RECORD_HEADER.size + payload_size
+            records_count += 1
+            segment_file.seek(offset)
+            header = segment_file.read(RECORD_HEADER.size)
+
+    if offset < segment_size:
+        log.warning("Incomplete record at the end of %s is removed.", segment_path)
+        truncate(segment_path, offset)
+    return records_count, offset
+
+
+class SegmentReader(ABC):
+    """
+    Sequential reader of one data file from the given line (record number) and byte offset.
+    The line and the offset point to the first not returned record.
+    """
+
+    def __init__(self, file_path, line=0, offset=None):
+        self.line = 0
+        self.offset = 0
+        self.__next_record = None
+        self._open(file_path)
+        if offset is not None:
+            self._seek(offset)
+            self.line = line
+            self.offset = offset
+        else:
+            self.__skip(line)
+
+    def read_record(self):
+        # Returns the next record or None if there is no complete record after the current position
+        if self.__next_record is None:
+            self.has_more()
+        record, self.__next_record = self.__next_record, None
+        if record is not None:
+            self.line += 1
+            self.offset += record[1]
+            return record[0]
+        return None
+
+    def has_more(self):
+        while self.__next_record is None:
+            record, size, skipped_lines, skipped_size = self._read_next()
+            self.line += skipped_lines
+            self.offset += skipped_size
+            if record is not None:
+                self.__next_record = (record, size)
+            elif not skipped_lines:
+                break
+        return self.__next_record is not None
+
+    @property
+    def closed(self):
+        return self._reader.closed
+
+    def close(self):
+        self._reader.close()
+
+    def _open(self, file_path):
+        self._reader = BufferedReader(FileIO(file_path, 'r'))
+
+    def _seek(self, offset):
+        self._reader.seek(offset)
+
+    @abstractmethod
+    def _read_next(self):
+        # Returns (record, record size, skipped records count, skipped size)
+        pass
+
+    def __skip(self, lines):
+        while self.line < lines and self.read_record() is not None:
+            pass
+
+
+class TextSegmentReader(SegmentReader):
+    """Reader of the legacy data files with base64 encoded records, one per line."""
+
+    def _read_next(self):
+        skipped_lines = 0
+        skipped_size = 0
+        start = self._reader.tell()
+        line = self._reader.readline()
+        while line:
+            if not line.endswith(b'\n'):
+                # The line is being written now
+                self._reader.seek(start)
+                break
+            try:
+                return b64decode(line).decode('utf-8'), len(line), skipped_lines, skipped_size
+            except Exception as e:
+                log.warning("Could not parse line [%s] to uplink message! %s", line, e)
+                skipped_lines += 1
+                skipped_size += len(line)
+                start = self._reader.tell()
+                line = self._reader.readline()
+        return None, 0, skipped_lines, skipped_size
+
+
+class BinarySegmentReader(SegmentReader):
+    """Reader of the data files with length-prefixed records."""
+
+    def _read_next(self):
+        start = self._reader.tell()
+        header = self._reader.read(RECORD_HEADER.size)
+        if len(header) == RECORD_HEADER.size:
+            (payload_size,) = RECORD_HEADER.unpack(header)
+            payload = self._reader.read(payload_size)
+            if len(payload) == payload_size:
+                try:
+                    return payload.decode('utf-8'), RECORD_HEADER.size + payload_size, 0, 0
+                except UnicodeDecodeError as e:
+                    log.warning("Could not parse record [%r] to uplink message! %s", payload[:100], e)
+                    return None, 0, 1, RECORD_HEADER.size + payload_size
+        # The record is being written now
+        self._reader.seek(start)
+        return None, 0, 0, 0
+
+
+class CompressedSegmentReader(SegmentReader):
+    """
+    Reader of the data files with compressed blocks of records. A block is decompressed at once,
+    the offset points to the block until its last record is returned.
+    """
+
+    def _open(self, file_path):
+        super()._open(file_path)
+        self.__block_records = deque()
+        self.__block_size = 0
+
+    def _read_next(self):
+        skipped_lines = 0
+        skipped_size = 0
+        while not self.__block_records:
+            start = self._reader.tell()
+            header = self._reader.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                self._reader.seek(start)
+                return None, 0, skipped_lines, skipped_size
+            codec, records_count, data_size, first_record_number = BLOCK_HEADER.unpack(header)
+            data = self._reader.read(data_size)
+            if len(data) < data_size:
+                # The block is being written now
+                self._reader.seek(start)
+                return None, 0, skipped_lines, skipped_size
+            # Records of the block before the resumed position were returned already
+            records_to_skip = max(self.line + skipped_lines - first_record_number, 0)
+            try:
+                records = decode_records(decompress_block(codec, data))[records_to_skip:]
+            except Exception as e:
+                log.warning("Could not decompress block of %i records at %i! %s", records_count, start, e)
+                skipped_lines += max(records_count - records_to_skip, 0)
+                skipped_size += BLOCK_HEADER.size + data_size
+                continue
+            if not records:
+                skipped_size += BLOCK_HEADER.size + data_size
+                continue
+            self.__block_records.extend(records)
+            self.__block_size = BLOCK_HEADER.size + data_size
+        record = self.__block_records.popleft()
+        return record, 0 if self.__block_records else self.__block_size, skipped_lines, skipped_size
+
+
+class MappedSegmentReader(SegmentReader):
+    """
+    Base of the readers which find the records in place in the memory mapped data file,
+    a record is copied only when it is decoded.
+    """
+
+    def _open(self, file_path):
+        self._file = open(file_path, 'rb')
+        self._map = None
+        self._view = None
+        self._mapped_size = 0
+        self._position = 0
+        self._remap()
+
+    def _seek(self, offset):
+        self._position = offset
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self.__release()
+        self._file.close()
+
+    def _is_mapped(self, size):
+        # Checks that "size" bytes after the position are mapped, the file is mapped again if the writer extended it
+        return self._position + size <= self._mapped_size or \
+            self._remap() and self._position + size <= self._mapped_size
+
+    def _remap(self):
+        # Returns True if the file was extended after the last mapping
+        size = fstat(self._file.fileno()).st_size
+        if size <= self._mapped_size:
+            return False
+        self.__release()
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        if MADV_SEQUENTIAL is not None:
+            self._map.madvise(MADV_SEQUENTIAL)
+        self._view = memoryview(self._map)
+        self._mapped_size = len(self._map)
+        return True
+
+    def __release(self):
+        if self._map is not None:
+            self._view.release()
+            self._map.close()
+            self._map = None
+            self._view = None
+            self._mapped_size = 0
+
+
+class MappedTextSegmentReader(MappedSegmentReader):
+    """Memory mapped reader of the legacy data files with base64 encoded records, one per line."""
+
+    def _read_next(self):
+        skipped_lines = 0
+        skipped_size = 0
+        while True:
+            end = self._map.find(b'\n', self._position) if self._map is not None else -1
+            if end < 0:
+                if self._remap():
+                    continue
+                return None, 0, skipped_lines, skipped_size
+            line_size = end + 1 - self._position
+            with self._view[self._position:end + 1] as line:
+                try:
+                    record = a2b_base64(line).decode('utf-8')
+                except Exception as e:
+                    log.warning("Could not parse line [%s] to uplink message! %s", bytes(line), e)
+                    record = None
+            self._position = end + 1
+            if record is not None:
+                return record, line_size, skipped_lines, skipped_size
+            skipped_lines += 1
+            skipped_size += line_size
+
+
+class MappedBinarySegmentReader(MappedSegmentReader):
+    """Memory mapped reader of the data files with length-prefixed records."""
+
+    def _read_next(self):
+        if not self._is_mapped(RECORD_HEADER.size):
+            return None, 0, 0, 0
+        (payload_size,) = RECORD_HEADER.unpack_from(self._map, self._position)
+        record_size = RECORD_HEADER.size + payload_size
+        if not self._is_mapped(record_size):
+            # The record is being written now
+            return None, 0, 0, 0
+        payload_start = self._position + RECORD_HEADER.size
+        self._position += record_size
+        with self._view[payload_start:payload_start + payload_size] as payload:
+            try:
+                return str(payload, 'utf-8'), record_size, 0, 0
+            except UnicodeDecodeError as e:
+                log.warning("Could not parse record [%r] to uplink message! %s", bytes(payload[:100]), e)
+                return None, 0, 1, record_size
+
+
+def open_segment_reader(file_path, line=0, offset=None, use_mmap=False):
+    if get_segment_format(file_path) == SEGMENT_FORMAT_COMPRESSED:
+        return CompressedSegmentReader(file_path, line, offset)
+    if get_segment_format(file_path) == SEGMENT_FORMAT_BINARY:
+        return MappedBinarySegmentReader(file_path, line, offset) if use_mmap \
+            else BinarySegmentReader(file_path, line, offset)
+    return MappedTextSegmentReader(file_path, line, offset) if use_mmap else TextSegmentReader(file_path, line, offset)
+
+
+def read_ahead(file_path):
+    # Asks the OS to load the next data file to the page cache while the current one is read
+    if posix_fadvise is not None:
+        file = os_open(file_path, O_RDONLY)
+        try:
+            posix_fadvise(file, 0, 0, POSIX_FADV_WILLNEED)
+        finally:
+            close(file)
@@ -12,15 +12,19 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-from base64 import b64encode
 from io import BufferedWriter, FileIO
-from os import O_CREAT, O_EXCL, close as os_close, linesep, open as os_open
+from os import O_CREAT, O_EXCL, close as os_close, fsync, open as os_open
 from os.path import exists
-from time import time
+from time import monotonic, time
 
 from thingsboard_gateway.storage.file.event_storage_files import EventStorageFiles
+from thingsboard_gateway.storage.file.event_storage_segment import DATA_FILE_PREFIX, SEGMENT_FORMAT_BINARY, \
+    SEGMENT_FORMAT_COMPRESSED, count_binary_segment_records, count_compressed_segment_records, \
+    encode_binary_records, encode_compressed_block, encode_text_records, get_index_file_name, \
+    get_segment_extension, get_segment_format
 from thingsboard_gateway.storage.file.file_event_storage import log
-from thingsboard_gateway.storage.file.file_event_storage_settings import FileEventStorageSettings
+from thingsboard_gateway.storage.file.file_event_storage_settings import FSYNC_POLICY_EVERY_N_RECORDS, \
+    FSYNC_POLICY_INTERVAL_MS, FSYNC_POLICY_NONE, FileEventStorageSettings
 
 
 class DataFileCountError(Exception):
@@ -34,47 +38,151 @@ class EventStorageWriter:
         self.buffered_writer = None
         self.current_file = sorted(files.get_data_files())[-1]
         self.current_file_records_count = [0]
-        self.previous_file_records_count = [0]
+        self.current_file_format = get_segment_format(self.current_file)
+        self.current_file_offset = 0
+        self.__records_since_fsync = 0
+        self.__last_fsync_time = monotonic()
+        self.fsync_count = 0
+        # Records of the compressed data file which wait for the block to be filled
+        self.__pending_block = []
+        self.__pending_block_size = 0
+        self.__pending_block_first_record = 0
+        self.__pending_block_time = 0
         self.get_number_of_records_in_file(self.current_file)
 
     def write(self, msg):
-        if len(self.files.data_files) <= self.settings.get_max_files_count():
-            if self.current_file_records_count[0] >= self.settings.get_max_records_per_file() or not exists(
-                    self.settings.get_data_folder_path() + self.current_file):
-                try:
-                    self.current_file = self.create_datafile()
-                    log.debug("FileStorage_writer -- Created new data file: %s", self.current_file)
-                except IOError as e:
-                    log.error("Failed to create a new file! %s", e)
-                self.files.get_data_files().append(self.current_file)
-                self.current_file_records_count[0] = 0
-                try:
-                    if self.buffered_writer is not None and self.buffered_writer.closed is False:
-                        self.buffered_writer.close()
-                except IOError as e:
-                    log.warning("Failed to close buffered writer! %s", e)
-                self.buffered_writer = None
+        self.write_batch([msg])
+
+    def write_batch(self, messages):
+        # Messages are split by the data files they fit in, and every part is written with one buffered write
+        position = 0
+        while position < len(messages):
+            if len(self.files.data_files) > self.settings.get_max_files_count():
+                raise DataFileCountError("The number of data files has been exceeded - change the settings or check the connection. %i new messages will be lost." % (len(messages) - position))
+            self.__switch_to_new_datafile_if_needed()
+            part = messages[position:position + self.settings.get_max_records_per_file() - self.current_file_records_count[0]]
+            position += len(part)
             try:
-                encoded = b64encode(msg.encode("utf-8"))
-                if not exists(self.settings.get_data_folder_path() + self.current_file):
-                    self.current_file = self.create_datafile()
+                if self.current_file_format == SEGMENT_FORMAT_COMPRESSED:
+                    self.__add_to_pending_block(part)
+                    continue
                 self.buffered_writer = self.get_or_init_buffered_writer(self.current_file)
-                self.buffered_writer.write(encoded + linesep.encode('utf-8'))
-                self.current_file_records_count[0] += 1
-                if self.current_file_records_count[0] - self.previous_file_records_count[0] >= self.settings.get_max_records_between_fsync():
-                    self.previous_file_records_count = self.current_file_records_count[:]
-                    self.buffered_writer.flush()
-                try:
-                    if self.buffered_writer is not None and self.buffered_writer.closed is False:
-                        self.buffered_writer.close()
-                except IOError as e:
-                    log.warning("Failed to close buffered writer! %s", e)
+                if self.current_file_format == SEGMENT_FORMAT_BINARY:
+                    data, index = encode_binary_records(part, self.current_file_records_count[0],
+                                                        self.current_file_offset)
+                else:
+                    data, index = encode_text_records(part), None
+                self.buffered_writer.write(data)
+                # The data is flushed to the OS at once, so the reader sees it, and synced to the disk by the policy
+                self.buffered_writer.flush()
+                self.current_file_offset += len(data)
+                if index:
+                    self.__append_to_index(index)
+                self.current_file_records_count[0] += len(part)
+                self.__records_since_fsync += len(part)
+                if self.__is_fsync_required():
+                    self.__fsync()
             except IOError as e:
                 log.warning("Failed to update data file![%s]\n%s", self.current_file, e)
-        else:
-            raise DataFileCountError("The number of data files has been exceeded - change the settings or check the connection. New data will be lost.")
+                self.close()
+
+    def __add_to_pending_block(self, messages):
+        # Records are compressed by blocks of the configured size, the last block waits for more records
+        block_size = self.settings.get_compression_block_size()
+        for message in messages:
+            if not self.__pending_block:
+                self.__pending_block_first_record = self.current_file_records_count[0]
+                self.__pending_block_time = monotonic()
+            self.__pending_block.append(message)
+            self.__pending_block_size += len(message)
+            self.current_file_records_count[0] += 1
+            if self.__pending_block_size >= block_size:
+                self.__write_pending_block()
+        # The records are reported as stored, so they are written as a not filled block if the fsync policy requires
+        if self.__pending_block and self.__is_fsync_required(len(self.__pending_block)):
+            self.__write_pending_block()
+
+    def __write_pending_block(self):
+        data = encode_compressed_block(self.__pending_block, self.settings.get_compression_codec(),
+                                       self.__pending_block_first_record)
+        records_count = len(self.__pending_block)
+        self.__pending_block = []
+        self.__pending_block_size = 0
+        self.buffered_writer = self.get_or_init_buffered_writer(self.current_file)
+        self.buffered_writer.write(data)
+        self.buffered_writer.flush()
+        self.current_file_offset += len(data)
+        self.__records_since_fsync += records_count
+        if self.__is_fsync_required():
+            self.__fsync()
+
+    def flush_pending_block(self, max_delay_ms=0):
+        # Writes the not filled block if its first record waits for max_delay_ms or longer
+        if self.__pending_block and (monotonic() - self.__pending_block_time) * 1000 >= max_delay_ms:
+            try:
+                self.__write_pending_block()
+            except IOError as e:
+                log.warning("Failed to update data file![%s]\n%s", self.current_file, e)
+                self.close()
+
+    def is_full(self):
+        return len(self.files.data_files) > self.settings.get_max_files_count()
+
+    def close(self):
+        pending_records_count = len(self.__pending_block)
+        try:
+            if pending_records_count:
+                self.__write_pending_block()
+        except (IOError, RuntimeError) as e:
+            log.warning("Failed to write %i pending record(s) to [%s]! %s", pending_records_count,
+                        self.current_file, e)
+        try:
+            if self.buffered_writer is not None and self.buffered_writer.closed is False:
+                self.buffered_writer.flush()
+                if self.settings.get_fsync_policy() != FSYNC_POLICY_NONE and self.__records_since_fsync:
+                    self.__fsync()
+                self.buffered_writer.close()
+        except (IOError, ValueError) as e:
+            log.warning("Failed to close buffered writer! %s", e)
+        self.buffered_writer = None
+
+    def __is_fsync_required(self, pending_records_count=0):
+        fsync_policy = self.settings.get_fsync_policy()
+        if fsync_policy == FSYNC_POLICY_EVERY_N_RECORDS:
+            return self.__records_since_fsync + pending_records_count >= self.settings.get_max_records_between_fsync()
+        if fsync_policy == FSYNC_POLICY_INTERVAL_MS:
+            return (monotonic() - self.__last_fsync_time) * 1000 >= self.settings.get_fsync_interval_ms()
+        return False
+
+    def __fsync(self):
+        fsync(self.buffered_writer.fileno())
+        self.__records_since_fsync = 0
+        self.__last_fsync_time = monotonic()
+        self.fsync_count += 1
+
+    def __append_to_index(self, index):
+        try:
+            with open(self.settings.get_data_folder_path() + get_index_file_name(self.current_file), 'ab') as index_file:
+                index_file.write(index)
+        except IOError as e:
+            log.warning("Failed to update index file of [%s]! %s", self.current_file, e)
+
+    def __switch_to_new_datafile_if_needed(self):
+        if self.current_file_records_count[0] >= self.settings.get_max_records_per_file() or \
+                self.current_file_format != self.settings.get_data_file_format() or \
+                self.buffered_writer is None and not exists(self.settings.get_data_folder_path() + self.current_file):
+            self.close()
+            try:
+                self.current_file = self.create_datafile()
+                log.debug("FileStorage_writer -- Created new data file: %s", self.current_file)
+            except IOError as e:
+                log.error("Failed to create a new file! %s", e)
+            self.current_file_records_count[0] = 0
+            self.current_file_format = get_segment_format(self.current_file)
+            self.current_file_offset = 0
 
     def get_or_init_buffered_writer(self, file):
+        # One append handle is kept open for the current data file until the writer switches to the next one
         try:
             if self.buffered_writer is None or self.buffered_writer.closed:
                 self.buffered_writer = BufferedWriter(FileIO(self.settings.get_data_folder_path() + file, 'a'))
@@ -84,13 +192,19 @@ class EventStorageWriter:
             raise RuntimeError("Failed to initialize buffered writer!", e)
 
     def create_datafile(self):
-        prefix = 'data_'
-        datafile_name = str(int(time() * 1000))
-        self.files.data_files.append("%s%s.txt" % (prefix, datafile_name))
-        return self.create_file(prefix, datafile_name)
+        prefix = DATA_FILE_PREFIX
+        extension = get_segment_extension(self.settings.get_data_file_format())
+        datafile_timestamp = int(time() * 1000)
+        # A batch may fill several files within the same millisecond
+        while exists("%s%s%i.txt" % (self.settings.get_data_folder_path(), prefix, datafile_timestamp)) or \
+                exists("%s%s%i%s" % (self.settings.get_data_folder_path(), prefix, datafile_timestamp, extension)):
+            datafile_timestamp += 1
+        datafile_name = str(datafile_timestamp)
+        self.files.data_files.append("%s%s%s" % (prefix, datafile_name, extension))
+        return self.create_file(prefix, datafile_name, extension)
 
-    def create_file(self, prefix, filename):
-        full_file_name = "%s%s.txt" % (prefix, filename)
+    def create_file(self, prefix, filename, extension='.txt'):
+        full_file_name = "%s%s%s" % (prefix, filename, extension)
         file_path = "%s%s" % (self.settings.get_data_folder_path(), full_file_name)
         try:
             file = os_open(file_path, O_CREAT | O_EXCL)
@@ -99,9 +213,32 @@ class EventStorageWriter:
         except IOError as e:
             log.error("Failed to create a new file! Error: %s", e)
 
+    def get_records_count_after(self, pointer):
+        # The count is exact if every data file before the current one is full, as the writer fills them
+        records_count = self.get_number_of_records_in_file(self.current_file)[0]
+        if pointer.get_file() == self.current_file:
+            return max(records_count - pointer.get_line(), 0)
+        data_files = sorted(self.files.get_data_files())
+        if pointer.get_file() not in data_files or self.current_file not in data_files:
+            return records_count
+        max_records_per_file = self.settings.get_max_records_per_file()
+        full_files_count = max(data_files.index(self.current_file) - data_files.index(pointer.get_file()) - 1, 0)
+        return (max(max_records_per_file - pointer.get_line(), 0) + full_files_count * max_records_per_file
+                + records_count)
+
     def get_number_of_records_in_file(self, file):
         if self.current_file_records_count[0] <= 0:
             try:
+                if get_segment_format(file) == SEGMENT_FORMAT_COMPRESSED:
+                    self.current_file_records_count[0], self.current_file_offset = count_compressed_segment_records(
+                        self.settings.get_data_folder_path() + file)
+                    return self.current_file_records_count
+                if get_segment_format(file) == SEGMENT_FORMAT_BINARY:
+                    # Records are counted from the last index entry, so only the tail of the file is scanned
+                    self.current_file_records_count[0], self.current_file_offset = count_binary_segment_records(
+                        self.settings.get_data_folder_path() + file,
+                        self.settings.get_data_folder_path() + get_index_file_name(file))
+                    return self.current_file_records_count
                 with open(self.settings.get_data_folder_path() + file) as data_file:
                     for i, _ in enumerate(data_file):
                         self.current_file_records_count[0] = i + 1
@@ -14,14 +14,19 @@
 
 import os
 import time
+from threading import Lock
 
 from simplejson import dump
 
+from thingsboard_gateway.storage.block_compression import CODEC_NONE
 from thingsboard_gateway.storage.event_storage import EventStorage, log
 from thingsboard_gateway.storage.file.event_storage_files import EventStorageFiles
+from thingsboard_gateway.storage.file.event_storage_group_commit import EventStorageGroupCommit
 from thingsboard_gateway.storage.file.event_storage_reader import EventStorageReader
+from thingsboard_gateway.storage.file.event_storage_segment import DATA_FILE_PREFIX, get_segment_extension
 from thingsboard_gateway.storage.file.event_storage_writer import DataFileCountError, EventStorageWriter
 from thingsboard_gateway.storage.file.file_event_storage_settings import FileEventStorageSettings
+from thingsboard_gateway.storage.read_event_packs import ReadEventPacks
 
 
 class FileEventStorage(EventStorage):
@@ -33,13 +38,17 @@ class FileEventStorage(EventStorage):
         self.state_file = self.event_storage_files.get_state_file()
         self.__writer = EventStorageWriter(self.event_storage_files, self.settings)
         self.__reader = EventStorageReader(self.event_storage_files, self.settings)
+        self.__write_lock = Lock()
+        self.__group_commit = EventStorageGroupCommit(self.__write_batch) \
+            if self.settings.is_group_commit_enabled() else None
+        self.__read_event_packs = ReadEventPacks()
         self.__stopped = False
 
     def put(self, event):
         success = False
         if not self.__stopped:
             try:
-                self.__writer.write(event)
+                self.__write_events([event])
             except DataFileCountError as e:
                 log.error(e)
             except Exception as e:
@@ -50,11 +59,52 @@ class FileEventStorage(EventStorage):
             log.error("Storage is closed!")
         return success
 
+    def put_batch(self, events):
+        success = False
+        if not self.__stopped:
+            try:
+                self.__write_events(events)
+            except DataFileCountError as e:
+                log.error(e)
+            except Exception as e:
+                log.exception(e)
+            else:
+                success = True
+        else:
+            log.error("Storage is closed!")
+        return success
+
+    def __write_events(self, events):
+        if self.__group_commit is not None:
+            self.__group_commit.write_batch(events)
+        else:
+            self.__write_batch(events)
+
+    def __write_batch(self, events):
+        with self.__write_lock:
+            self.__writer.write_batch(events)
+
+    def is_full(self):
+        return self.__writer.is_full()
+
     def get_event_pack(self):
-        return self.__reader.read()
+        event_pack = self.__read_event_packs.get_next()
+        if event_pack is None:
+            if self.settings.get_compression_codec() != CODEC_NONE:
+                with self.__write_lock:
+                    self.__writer.flush_pending_block(self.settings.get_compression_block_max_delay_ms())
+            event_pack = self.__reader.read()
+            if event_pack:
+                self.__read_event_packs.append(event_pack, self.__reader.get_read_pointer())
+        return event_pack
 
     def event_pack_processing_done(self):
-        self.__reader.discard_batch()
+        pointer = self.__read_event_packs.confirm_oldest()
+        if pointer is not None:
+            self.__reader.discard_batch(pointer)
+
+    def rewind(self):
+        self.__read_event_packs.rewind()
 
     def init_data_folder_if_not_exist(self):
         path = self.settings.get_data_folder_path()
@@ -82,24 +132,37 @@ class FileEventStorage(EventStorage):
             if not state_file:
                 state_file = self.create_file('state_', 'file')
                 with open(self.settings.get_data_folder_path() + state_file, 'w') as state_file_obj:
-                    dump({"position": 0, "file": sorted(data_files)[0]}, state_file_obj)
+                    dump({"position": 0, "offset": 0, "file": sorted(data_files)[0]}, state_file_obj)
             event_storage_files = EventStorageFiles(state_file, data_files)
         return event_storage_files
 
     def create_new_datafile(self):
-        return self.create_file('data_', str(round(time.time() * 1000)))
+        return self.create_file(DATA_FILE_PREFIX, str(round(time.time() * 1000)),
+                                get_segment_extension(self.settings.get_data_file_format()))
 
-    def create_file(self, prefix, filename):
-        file_path = self.settings.get_data_folder_path() + prefix + filename + '.txt'
+    def create_file(self, prefix, filename, extension='.txt'):
+        file_path = self.settings.get_data_folder_path() + prefix + filename + extension
         try:
             file = open(file_path, 'w')
             file.close()
-            return prefix + filename + '.txt'
+            return prefix + filename + extension
         except IOError as e:
             log.error("Failed to create a new file! Error: %s", e)
 
+    def get_pending_events_count(self):
+        with self.__write_lock:
+            return self.__writer.get_records_count_after(self.__reader.get_read_pointer())
+
+    def get_pack_size(self):
+        return self.settings.get_max_read_records_count()
+
+    def set_pack_size(self, events_count):
+        self.settings.set_max_read_records_count(events_count)
+
     def stop(self):
         self.__stopped = True
+        with self.__write_lock:
+            self.__writer.close()
 
     def len(self):
         return len(self.__writer.files.data_files)
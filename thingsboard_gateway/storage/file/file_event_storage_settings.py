@@ -13,13 +13,43 @@
 #     limitations under the License.
 
 
+from thingsboard_gateway.storage.block_compression import CODEC_NONE, COMPRESSION_NONE, get_codec
+from thingsboard_gateway.storage.event_storage import log
+from thingsboard_gateway.storage.file.event_storage_segment import SEGMENT_FORMAT_BINARY, SEGMENT_FORMAT_COMPRESSED, \
+    SEGMENT_FORMAT_TEXT
+
+FSYNC_POLICY_NONE = "none"
+FSYNC_POLICY_INTERVAL_MS = "interval_ms"
+FSYNC_POLICY_EVERY_N_RECORDS = "every_n_records"
+
+
 class FileEventStorageSettings:
     def __init__(self, config):
         self.data_folder_path = config.get("data_folder_path", "./")
         self.max_files_count = config.get("max_file_count", 5)
         self.max_records_per_file = config.get("max_records_per_file", 3)
         self.max_records_between_fsync = config.get("max_records_between_fsync", 1)
+        self.fsync_policy = config.get("fsync_policy", FSYNC_POLICY_NONE).lower()
+        if self.fsync_policy not in (FSYNC_POLICY_NONE, FSYNC_POLICY_INTERVAL_MS, FSYNC_POLICY_EVERY_N_RECORDS):
+            log.warning("Unknown fsync policy %r, data files won't be synced to the disk explicitly.", self.fsync_policy)
+            self.fsync_policy = FSYNC_POLICY_NONE
+        self.fsync_interval_ms = config.get("fsync_interval_ms", 1000)
+        self.group_commit = config.get("group_commit", False)
+        self.data_file_format = config.get("data_file_format", SEGMENT_FORMAT_BINARY).lower()
+        if self.data_file_format not in (SEGMENT_FORMAT_BINARY, SEGMENT_FORMAT_TEXT):
+            log.warning("Unknown data file format %r, binary format is used.", self.data_file_format)
+            self.data_file_format = SEGMENT_FORMAT_BINARY
+        self.compression_codec = get_codec(config.get("compression", COMPRESSION_NONE))
+        self.compression_block_size = config.get("compression_block_size", 65536)
+        self.compression_block_max_delay_ms = config.get("compression_block_max_delay_ms", 1000)
+        if self.compression_codec != CODEC_NONE:
+            if self.data_file_format == SEGMENT_FORMAT_TEXT:
+                log.warning("Compression is not supported by the text data file format.")
+                self.compression_codec = CODEC_NONE
+            else:
+                self.data_file_format = SEGMENT_FORMAT_COMPRESSED
         self.max_read_records_count = config.get("max_read_records_count", 1000)
+        self.use_mmap = config.get("use_mmap", True)
 
     def get_data_folder_path(self):
         return self.data_folder_path
@@ -33,5 +63,32 @@ class FileEventStorageSettings:
     def get_max_records_between_fsync(self):
         return self.max_records_between_fsync
 
+    def get_fsync_policy(self):
+        return self.fsync_policy
+
+    def get_fsync_interval_ms(self):
+        return self.fsync_interval_ms
+
+    def is_group_commit_enabled(self):
+        return self.group_commit
+
+    def get_data_file_format(self):
+        return self.data_file_format
+
     def get_max_read_records_count(self):
         return self.max_read_records_count
+
+    def set_max_read_records_count(self, max_read_records_count):
+        self.max_read_records_count = max_read_records_count
+
+    def is_mmap_enabled(self):
+        return self.use_mmap
+
+    def get_compression_codec(self):
+        return self.compression_codec
+
+    def get_compression_block_size(self):
+        return self.compression_block_size
+
+    def get_compression_block_max_delay_ms(self):
+        return self.compression_block_max_delay_ms
@@ -0,0 +1,176 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+from os.path import splitext
+from threading import Lock
+
+from thingsboard_gateway.storage.event_storage import EventStorage, log
+
+DATA_KIND_ATTRIBUTES = "attributes"
+DATA_KIND_TELEMETRY = "telemetry"
+DATA_KIND_GATEWAY = "gateway"
+
+
+class LanesEventStorage(EventStorage):
+    """
+    Keeps events in priority lanes, every lane is a storage of the configured type.
+    Events are routed to the lanes by the connector name or by the kind of the data (attributes, telemetry or
+    the service data of the gateway). Packs are read from the lanes by smooth weighted round-robin, so a lane
+    with a big backlog gets its share of the reads and doesn't delay the other lanes.
+    The default lane keeps the storage location from the configuration, the other lanes keep their data
+    in the lane named subfolder (or the lane named database file).
+    """
+
+    def __init__(self, config, storage_class):
+        self.__lanes = {}
+        self.__weights = {}
+        self.__connector_lanes = {}
+        self.__kind_lanes = {}
+        lanes_config = config["lanes"]
+        self.__default_lane = next((lane_config["name"] for lane_config in lanes_config
+                                    if lane_config.get("default")), lanes_config[-1]["name"])
+        for lane_config in lanes_config:
+            name = lane_config["name"]
+            self.__weights[name] = max(int(lane_config.get("weight", 1)), 1)
+            for connector_name in lane_config.get("connectors", []):
+                self.__connector_lanes[connector_name] = name
+            for data_kind in lane_config.get("kinds", []):
+                self.__kind_lanes[data_kind] = name
+            self.__lanes[name] = storage_class(self.__get_lane_storage_config(config, lane_config))
+        self.__total_weight = sum(self.__weights.values())
+        self.__current_weights = {name: 0 for name in self.__lanes}
+        self.__read_lock = Lock()
+        self.__read_packs_lanes = deque()
+        self.__next_pack_index = 0
+        self.drained_counts = {name: 0 for name in self.__lanes}
+        log.info("Storage lanes: %s, default lane: %s", self.__weights, self.__default_lane)
+
+    def __get_lane_storage_config(self, config, lane_config):
+        lane_storage_config = {**config, **lane_config.get("storage", {})}
+        lane_storage_config.pop("lanes")
+        name = lane_config["name"]
+        if name != self.__default_lane:
+            lane_storage_config["data_folder_path"] = config.get("data_folder_path", "./") + name + "/"
+            (data_file_path, extension) = splitext(config.get("data_file_path", "./data.db"))
+            lane_storage_config["data_file_path"] = "%s_%s%s" % (data_file_path, name, extension)
+        return lane_storage_config
+
+    def split_by_lanes(self, connector_name, data, service_data=False):
+        # Returns the lanes with the data for them, attributes and telemetry are split if they go to different lanes
+        lane = self.__connector_lanes.get(connector_name)
+        if lane is not None:
+            return [(lane, data)]
+        if service_data:
+            return [(self.__kind_lanes.get(DATA_KIND_GATEWAY, self.__default_lane), data)]
+        attributes_lane = self.__kind_lanes.get(DATA_KIND_ATTRIBUTES, self.__default_lane)
+        telemetry_lane = self.__kind_lanes.get(DATA_KIND_TELEMETRY, self.__default_lane)
+        if not data.get("telemetry"):
+            return [(attributes_lane, data)]
+        if attributes_lane == telemetry_lane or not data.get("attributes"):
+            return [(telemetry_lane, data)]
+        return [(attributes_lane, {**data, "telemetry": []}), (telemetry_lane, {**data, "attributes": []})]
+
+    def put(self, event):
+        return self.__lanes[self.__default_lane].put(event)
+
+    def put_batch(self, events):
+        return self.__lanes[self.__default_lane].put_batch(events)
+
+    def put_lane_batch(self, events, lane):
+        return self.__lanes.get(lane, self.__lanes[self.__default_lane]).put_batch(events)
+
+    def stores_objects(self):
+        return self.__lanes[self.__default_lane].stores_objects()
+
+    def get_event_pack(self):
+        with self.__read_lock:
+            if self.__next_pack_index < len(self.__read_packs_lanes):
+                # Rewound packs are returned again by their lanes
+                lane = self.__read_packs_lanes[self.__next_pack_index]
+                self.__next_pack_index += 1
+                return self.__lanes[lane].get_event_pack()
+
+            for name in self.__current_weights:
+                self.__current_weights[name] += self.__weights[name]
+            for name in sorted(self.__current_weights, key=self.__current_weights.get, reverse=True):
+                events = self.__lanes[name].get_event_pack()
+                if events:
+                    # The credit is limited, so a lane which was the only one with data doesn't wait for long later
+                    self.__current_weights[name] = max(self.__current_weights[name] - self.__total_weight,
+                                                       -self.__total_weight)
+                    self.__read_packs_lanes.append(name)
+                    self.__next_pack_index = len(self.__read_packs_lanes)
+                    self.drained_counts[name] += len(events)
+                    return events
+                # A lane without data doesn't collect the credit
+                self.__current_weights[name] = 0
+            return []
+
+    def event_pack_processing_done(self):
+        with self.__read_lock:
+            if self.__read_packs_lanes:
+                lane = self.__read_packs_lanes.popleft()
+                self.__next_pack_index = max(self.__next_pack_index - 1, 0)
+                self.__lanes[lane].event_pack_processing_done()
+
+    def rewind(self):
+        with self.__read_lock:
+            self.__next_pack_index = 0
+            for lane in self.__lanes.values():
+                lane.rewind()
+
+    def set_connected(self, connected):
+        for lane in self.__lanes.values():
+            lane.set_connected(connected)
+
+    def is_full(self):
+        return any(lane.is_full() for lane in self.__lanes.values())
+
+    def get_lanes_state(self):
+        return {name: {"weight": self.__weights[name], "backlog": lane.get_pending_events_count(),
+                       "drainedEvents": self.drained_counts[name]}
+                for (name, lane) in self.__lanes.items()}
+
+    def get_pack_size(self):
+        return self.__lanes[self.__default_lane].get_pack_size()
+
+    def set_pack_size(self, events_count):
+        for lane in self.__lanes.values():
+            lane.set_pack_size(events_count)
+
+    def get_devices_oldest_pending_age(self):
+        ages = {}
+        for lane in self.__lanes.values():
+            for (device, age) in lane.get_devices_oldest_pending_age().items():
+                ages[device] = max(age, ages.get(device, 0))
+        return ages
+
+    def get_statistics(self):
+        statistics = {}
+        for (name, lane) in self.__lanes.items():
+            lane_key = "storage" + name.title().replace(" ", "") + "Lane"
+            statistics[lane_key + "Backlog"] = lane.get_pending_events_count()
+            statistics[lane_key + "DrainedEvents"] = self.drained_counts[name]
+        return statistics
+
+    def stop(self):
+        for lane in self.__lanes.values():
+            lane.stop()
+
+    def get_pending_events_count(self):
+        return sum(lane.get_pending_events_count() for lane in self.__lanes.values())
+
+    def len(self):
+        return sum(lane.len() for lane in self.__lanes.values())
@@ -0,0 +1,168 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+
+DROPPED = object()
+
+
+class EventRingBuffer:
+    """
+    Ring of events kept in a list. A pack of events is drained with one or two slices of the list, so the rest of
+    the events are not moved. An event of a device may be dropped from the middle of the ring, its slot keeps
+    the DROPPED mark until it is drained or the ring is compacted.
+    Sizes and device names of the events are tracked only if they are required.
+    The ring is not thread safe.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, track_sizes=False, track_devices=False):
+        self.__slots = [None] * self.INITIAL_CAPACITY
+        self.__sizes = [0] * self.INITIAL_CAPACITY if track_sizes else None
+        self.__devices = [None] * self.INITIAL_CAPACITY if track_devices else None
+        # Sequence numbers of the events of every device, from the oldest one
+        self.__device_events = {} if track_devices else None
+        self.__head = 0
+        self.__used = 0
+        self.__head_sequence_number = 0
+        self.__count = 0
+        self.__dropped_count = 0
+        self.size_bytes = 0
+
+    def __len__(self):
+        return self.__count
+
+    def extend(self, events, sizes=None, devices=None):
+        events_count = len(events)
+        if self.__used + events_count > len(self.__slots):
+            self.__reserve(events_count)
+        capacity = len(self.__slots)
+        start = (self.__head + self.__used) % capacity
+        first_part_length = min(events_count, capacity - start)
+        self.__write(self.__slots, start, first_part_length, events)
+        if self.__sizes is not None:
+            self.__write(self.__sizes, start, first_part_length, sizes)
+            self.size_bytes += sum(sizes)
+        if self.__devices is not None:
+            self.__write(self.__devices, start, first_part_length, devices)
+            sequence_number = self.__head_sequence_number + self.__used
+            for device in devices:
+                self.__device_events.setdefault(device, deque()).append(sequence_number)
+                sequence_number += 1
+        self.__used += events_count
+        self.__count += events_count
+
+    @staticmethod
+    def __write(target, start, first_part_length, values):
+        target[start:start + first_part_length] = values[:first_part_length]
+        if first_part_length < len(values):
+            target[:len(values) - first_part_length] = values[first_part_length:]
+
+    def drain(self, max_count):
+        # Removes up to max_count oldest events and returns them
+        events = []
+        while len(events) < max_count and self.__used:
+            part_events, part_sizes, part_devices = self.__skip_dropped(
+                *self.__take(min(self.__used, max_count - len(events))))
+            self.__forget(part_events, part_sizes, part_devices)
+            events.extend(part_events)
+        return events
+
+    def drop_oldest(self):
+        while self.__used:
+            part_events, part_sizes, part_devices = self.__skip_dropped(*self.__take(1))
+            if part_events:
+                self.__forget(part_events, part_sizes, part_devices)
+                return True
+        return False
+
+    def drop_oldest_of_device(self, device):
+        sequence_numbers = self.__device_events.get(device)
+        if not sequence_numbers:
+            return False
+        index = (self.__head + sequence_numbers.popleft() - self.__head_sequence_number) % len(self.__slots)
+        if not sequence_numbers:
+            del self.__device_events[device]
+        self.__slots[index] = DROPPED
+        self.__devices[index] = None
+        if self.__sizes is not None:
+            self.size_bytes -= self.__sizes[index]
+            self.__sizes[index] = 0
+        self.__count -= 1
+        self.__dropped_count += 1
+        while self.__used and self.__slots[self.__head] is DROPPED:
+            self.__skip_dropped(*self.__take(1))
+        return True
+
+    def __take(self, count):
+        # Removes the count of the head slots and returns their content
+        capacity = len(self.__slots)
+        start = self.__head
+        end = start + count
+        taken = []
+        for target in (self.__slots, self.__sizes, self.__devices):
+            if target is None:
+                taken.append(None)
+            elif end <= capacity:
+                taken.append(target[start:end])
+                target[start:end] = [None] * count
+            else:
+                taken.append(target[start:] + target[:end - capacity])
+                target[start:] = [None] * (capacity - start)
+                target[:end - capacity] = [None] * (end - capacity)
+        self.__head = end % capacity
+        self.__used -= count
+        self.__head_sequence_number += count
+        return taken
+
+    def __skip_dropped(self, events, sizes, devices):
+        if not self.__dropped_count:
+            return events, sizes, devices
+        live_indexes = [index for (index, event) in enumerate(events) if event is not DROPPED]
+        if len(live_indexes) == len(events):
+            return events, sizes, devices
+        self.__dropped_count -= len(events) - len(live_indexes)
+        return ([events[index] for index in live_indexes],
+                None if sizes is None else [sizes[index] for index in live_indexes],
+                None if devices is None else [devices[index] for index in live_indexes])
+
+    def __forget(self, events, sizes, devices):
+        # Updates the counters for the removed events
+        self.__count -= len(events)
+        if sizes is not None:
+            self.size_bytes -= sum(sizes)
+        if devices is not None:
+            for device in devices:
+                sequence_numbers = self.__device_events[device]
+                sequence_numbers.popleft()
+                if not sequence_numbers:
+                    del self.__device_events[device]
+
+    def __reserve(self, events_count):
+        # Compacts the ring, the capacity is doubled while the ring would be filled more than 3/4
+        live_events, live_sizes, live_devices = self.__skip_dropped(*self.__take(self.__used))
+        capacity = len(self.__slots)
+        while (len(live_events) + events_count) * 4 > capacity * 3:
+            capacity *= 2
+        self.__slots = live_events + [None] * (capacity - len(live_events))
+        if self.__sizes is not None:
+            self.__sizes = live_sizes + [0] * (capacity - len(live_events))
+        if self.__devices is not None:
+            self.__devices = live_devices + [None] * (capacity - len(live_events))
+            self.__device_events = {}
+            for (sequence_number, device) in enumerate(live_devices, self.__head_sequence_number):
+                self.__device_events.setdefault(device, deque()).append(sequence_number)
+        self.__head = 0
+        self.__used = len(live_events)
@@ -0,0 +1,139 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+from time import monotonic
+
+
+class FairEventQueue:
+    """
+    Events kept in a queue per device and drained by deficit round-robin across the devices.
+    Every device with pending events gets up to "quantum" events in its turn, so a pack carries the data of many
+    devices and a device with a big backlog doesn't delay the other devices.
+    The order of all events is kept as well, so the oldest event of the queue may be dropped.
+    The queue has the interface of the EventRingBuffer and is not thread safe.
+    """
+
+    def __init__(self, quantum=1, track_sizes=False):
+        self.__quantum = max(int(quantum), 1)
+        self.__track_sizes = track_sizes
+        # Every device queue keeps (sequence number, put time, event, size) of the pending events
+        self.__device_queues = {}
+        self.__deficits = {}
+        self.__active_devices = deque()
+        # Sequence numbers and devices of the events in the order they were put, drained ones are removed lazily
+        self.__order = deque()
+        self.__next_sequence_number = 0
+        self.__count = 0
+        self.size_bytes = 0
+
+    def __len__(self):
+        return self.__count
+
+    def extend(self, events, sizes=None, devices=None):
+        put_time = monotonic()
+        sequence_number = self.__next_sequence_number
+        for (index, event) in enumerate(events):
+            device = devices[index]
+            device_queue = self.__device_queues.get(device)
+            if device_queue is None:
+                device_queue = self.__device_queues[device] = deque()
+                self.__active_devices.append(device)
+            device_queue.append((sequence_number, put_time, event, sizes[index] if sizes is not None else 0))
+            self.__order.append((sequence_number, device))
+            sequence_number += 1
+        self.__next_sequence_number = sequence_number
+        self.__count += len(events)
+        if sizes is not None:
+            self.size_bytes += sum(sizes)
+
+    def drain(self, max_count):
+        # Removes up to max_count events, the devices are served in turns
+        events = []
+        active_devices = self.__active_devices
+        while len(events) < max_count and active_devices:
+            device = active_devices[0]
+            device_queue = self.__device_queues[device]
+            if len(active_devices) == 1:
+                # A single device with pending events doesn't share its turn
+                for _ in range(min(max_count - len(events), len(device_queue))):
+                    events.append(self.__pop(device_queue)[2])
+                if not device_queue:
+                    self.__forget_device(device)
+                    active_devices.popleft()
+                continue
+            deficit = self.__deficits.get(device, 0) or self.__quantum
+            taken_count = min(deficit, max_count - len(events), len(device_queue))
+            for _ in range(taken_count):
+                events.append(self.__pop(device_queue)[2])
+            deficit -= taken_count
+            if not device_queue:
+                self.__forget_device(device)
+                active_devices.popleft()
+            elif deficit:
+                # The pack is full, the device continues its turn with the next pack
+                self.__deficits[device] = deficit
+            else:
+                self.__deficits.pop(device, None)
+                active_devices.rotate(-1)
+        self.__clean_order()
+        return events
+
+    def drop_oldest(self):
+        self.__clean_order()
+        if not self.__order:
+            return False
+        _, device = self.__order.popleft()
+        self.__drop_device_event(device)
+        return True
+
+    def drop_oldest_of_device(self, device):
+        if device not in self.__device_queues:
+            return False
+        self.__drop_device_event(device)
+        return True
+
+    def get_oldest_pending_ages(self):
+        # Returns the age in seconds of the oldest pending event of every device
+        now = monotonic()
+        return {device: now - device_queue[0][1] for (device, device_queue) in self.__device_queues.items()}
+
+    def __drop_device_event(self, device):
+        device_queue = self.__device_queues[device]
+        self.__pop(device_queue)
+        if not device_queue:
+            self.__forget_device(device)
+            self.__active_devices.remove(device)
+
+    def __pop(self, device_queue):
+        entry = device_queue.popleft()
+        self.__count -= 1
+        if self.__track_sizes:
+            self.size_bytes -= entry[3]
+        return entry
+
+    def __forget_device(self, device):
+        del self.__device_queues[device]
+        self.__deficits.pop(device, None)
+
+    def __clean_order(self):
+        # Removes the drained events from the head of the order
+        order = self.__order
+        device_queues = self.__device_queues
+        while order:
+            sequence_number, device = order[0]
+            device_queue = device_queues.get(device)
+            if device_queue and device_queue[0][0] == sequence_number:
+                break
+            order.popleft()
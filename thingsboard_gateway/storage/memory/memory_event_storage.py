@@ -12,47 +12,188 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-from queue import Empty, Full, Queue
+from itertools import accumulate
+from re import compile as compile_regex
+from threading import Lock
 
 from thingsboard_gateway.storage.event_storage import EventStorage, log
+from thingsboard_gateway.storage.memory.event_ring_buffer import EventRingBuffer
+from thingsboard_gateway.storage.memory.fair_event_queue import FairEventQueue
+from thingsboard_gateway.storage.read_event_packs import ReadEventPacks
+
+OVERFLOW_POLICY_REJECT_NEW = "reject_new"
+OVERFLOW_POLICY_DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICY_DROP_OLDEST_PER_DEVICE = "drop_oldest_per_device"
+
+DRAIN_POLICY_FIFO = "fifo"
+DRAIN_POLICY_FAIR = "fair"
+
+DEVICE_NAME_PATTERN = compile_regex(r'"deviceName":\s*"((?:[^"\\]|\\.)*)"')
 
 
 class MemoryEventStorage(EventStorage):
     def __init__(self, config):
         self.__queue_len = config.get("max_records_count", 10000)
+        self.__max_size = int(config.get("max_size_mb", 0) * 1024 * 1024)
         self.__events_per_time = config.get("read_records_count", 1000)
-        self.__events_queue = Queue(self.__queue_len)
-        self.__event_pack = []
+        self.__store_objects = config.get("store_objects", False)
+        self.__overflow_policy = config.get("overflow_policy", OVERFLOW_POLICY_REJECT_NEW).lower()
+        if self.__overflow_policy not in (OVERFLOW_POLICY_REJECT_NEW, OVERFLOW_POLICY_DROP_OLDEST,
+                                          OVERFLOW_POLICY_DROP_OLDEST_PER_DEVICE):
+            log.warning("Unknown overflow policy %r, new events will be rejected when the storage is full.",
+                        self.__overflow_policy)
+            self.__overflow_policy = OVERFLOW_POLICY_REJECT_NEW
+        self.__drain_policy = config.get("drain_policy", DRAIN_POLICY_FIFO).lower()
+        if self.__drain_policy not in (DRAIN_POLICY_FIFO, DRAIN_POLICY_FAIR):
+            log.warning("Unknown drain policy %r, events will be read in the order they were saved.",
+                        self.__drain_policy)
+            self.__drain_policy = DRAIN_POLICY_FIFO
+        if self.__drain_policy == DRAIN_POLICY_FAIR:
+            self.__events = FairEventQueue(quantum=config.get("fair_quantum", 1), track_sizes=self.__max_size > 0)
+        else:
+            self.__events = EventRingBuffer(
+                track_sizes=self.__max_size > 0,
+                track_devices=self.__overflow_policy == OVERFLOW_POLICY_DROP_OLDEST_PER_DEVICE)
+        self.__track_devices = self.__drain_policy == DRAIN_POLICY_FAIR or \
+            self.__overflow_policy == OVERFLOW_POLICY_DROP_OLDEST_PER_DEVICE
+        self.__lock = Lock()
+        self.__read_event_packs = ReadEventPacks()
         self.__stopped = False
-        log.debug("Memory storage created with following configuration: \nMax size: %i\n Read records per time: %i",
-                  self.__queue_len, self.__events_per_time)
+        self.dropped_count = 0
+        self.rejected_count = 0
+        log.debug("Memory storage created with following configuration: \nMax size: %i\n Max size in bytes: %i\n"
+                  " Read records per time: %i\n Store objects: %r\n Overflow policy: %s\n Drain policy: %s",
+                  self.__queue_len, self.__max_size, self.__events_per_time, self.__store_objects,
+                  self.__overflow_policy, self.__drain_policy)
 
     def put(self, event):
-        success = False
-        if not self.__stopped:
-            try:
-                self.__events_queue.put(event)
-                success = True
-            except Full:
-                log.error("Memory storage is full!")
-        else:
+        return self.put_batch([event])
+
+    def put_batch(self, events):
+        if self.__stopped:
             log.error("Storage is stopped!")
-        return success
+            return False
+        sizes = [self.__get_event_size(event) for event in events] if self.__max_size > 0 else None
+        devices = [self.__get_event_device_name(event) for event in events] if self.__track_devices else None
+        with self.__lock:
+            if self.__fits(len(events), sum(sizes) if sizes is not None else 0):
+                self.__events.extend(events, sizes, devices)
+                return True
+            if self.__overflow_policy == OVERFLOW_POLICY_REJECT_NEW:
+                stored_count = self.__get_fitting_events_count(sizes, len(events))
+                self.__events.extend(events[:stored_count],
+                                     sizes[:stored_count] if sizes is not None else None,
+                                     devices[:stored_count] if devices is not None else None)
+            else:
+                stored_count = self.__put_dropping_oldest(events, sizes, devices)
+        rejected_count = len(events) - stored_count
+        if rejected_count:
+            self.rejected_count += rejected_count
+            log.error("Memory storage is full! %i event(s) were not saved.", rejected_count)
+        return not rejected_count
+
+    def __fits(self, events_count, events_size):
+        return (self.__queue_len <= 0 or len(self.__events) + events_count <= self.__queue_len) and \
+            (self.__max_size <= 0 or self.__events.size_bytes + events_size <= self.__max_size)
+
+    def __get_fitting_events_count(self, sizes, events_count):
+        if self.__queue_len > 0:
+            events_count = min(events_count, max(self.__queue_len - len(self.__events), 0))
+        if sizes is not None:
+            free_size = self.__max_size - self.__events.size_bytes
+            fitting_count = 0
+            for total_size in accumulate(sizes[:events_count]):
+                if total_size > free_size:
+                    break
+                fitting_count += 1
+            events_count = fitting_count
+        return events_count
+
+    def __put_dropping_oldest(self, events, sizes, devices):
+        # The oldest events (of the same device, if there are such) are dropped to free the space for every event
+        stored_count = 0
+        for (index, event) in enumerate(events):
+            size = sizes[index] if sizes is not None else 0
+            device = devices[index] if devices is not None else None
+            if 0 < self.__max_size < size:
+                continue
+            while not self.__fits(1, size):
+                if not (device is not None and self.__events.drop_oldest_of_device(device)
+                        or self.__events.drop_oldest()):
+                    break
+                self.dropped_count += 1
+            else:
+                self.__events.extend([event], [size] if sizes is not None else None,
+                                     [device] if devices is not None else None)
+                stored_count += 1
+        return stored_count
+
+    @staticmethod
+    def __get_event_size(event):
+        return len(event) if isinstance(event, str) else event.size()
+
+    @staticmethod
+    def __get_event_device_name(event):
+        if not isinstance(event, str):
+            return event.device_name
+        match = DEVICE_NAME_PATTERN.search(event)
+        return match.group(1) if match else None
+
+    def stores_objects(self):
+        return self.__store_objects
+
+    def can_put(self, events):
+        # Checks that the events are saved without dropping other events
+        with self.__lock:
+            return self.__fits(len(events),
+                               sum(self.__get_event_size(event) for event in events) if self.__max_size > 0 else 0)
+
+    def is_full(self):
+        # New events don't wait for the space if the oldest ones are dropped
+        if self.__overflow_policy != OVERFLOW_POLICY_REJECT_NEW:
+            return False
+        with self.__lock:
+            return not self.__fits(1, 0) or (0 < self.__max_size <= self.__events.size_bytes)
 
     def get_event_pack(self):
-        try:
-            if not self.__event_pack:
-                self.__event_pack = [self.__events_queue.get(False) for _ in
-                                     range(min(self.__events_per_time, self.__events_queue.qsize()))]
-        except Empty:
-            pass
-        return self.__event_pack
+        event_pack = self.__read_event_packs.get_next()
+        if event_pack is None:
+            with self.__lock:
+                event_pack = self.__events.drain(self.__events_per_time)
+            if event_pack:
+                self.__read_event_packs.append(event_pack)
+        return event_pack
 
     def event_pack_processing_done(self):
-        self.__event_pack = []
+        self.__read_event_packs.confirm_oldest()
+
+    def rewind(self):
+        self.__read_event_packs.rewind()
+
+    def get_pack_size(self):
+        return self.__events_per_time
+
+    def set_pack_size(self, events_count):
+        self.__events_per_time = events_count
+
+    def get_devices_oldest_pending_age(self):
+        if self.__drain_policy != DRAIN_POLICY_FAIR:
+            return {}
+        with self.__lock:
+            ages = self.__events.get_oldest_pending_ages()
+        return {device: int(age * 1000) for (device, age) in ages.items()}
+
+    def get_statistics(self):
+        statistics = {
+            "storageDroppedEvents": self.dropped_count,
+            "storageRejectedEvents": self.rejected_count,
+        }
+        if self.__drain_policy == DRAIN_POLICY_FAIR:
+            statistics["storageOldestPendingAgeMs"] = max(self.get_devices_oldest_pending_age().values(), default=0)
+        return statistics
 
     def stop(self):
         self.__stopped = True
 
     def len(self):
-        return self.__events_queue.qsize()
+        return len(self.__events)
@@ -0,0 +1,51 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+
+
+class ReadEventPacks:
+    """
+    Event packs that were read from a storage but are not confirmed yet, in the order they were read.
+    Every pack keeps the storage position to commit when the pack is confirmed.
+    After rewind the packs are returned again starting from the oldest one, without reading the storage again.
+    """
+
+    def __init__(self):
+        self.__packs = deque()
+        self.__next_pack_index = 0
+
+    def __len__(self):
+        return len(self.__packs)
+
+    def get_next(self):
+        if self.__next_pack_index < len(self.__packs):
+            events, _ = self.__packs[self.__next_pack_index]
+            self.__next_pack_index += 1
+            return events
+        return None
+
+    def append(self, events, position=None):
+        self.__packs.append((events, position))
+        self.__next_pack_index = len(self.__packs)
+
+    def confirm_oldest(self):
+        if not self.__packs:
+            return None
+        _, position = self.__packs.popleft()
+        self.__next_pack_index = max(self.__next_pack_index - 1, 0)
+        return position
+
+    def rewind(self):
+        self.__next_pack_index = 0
@@ -13,12 +13,14 @@
 #     limitations under the License.
 
 from os.path import exists
-from time import time, sleep
+from time import sleep, time
 from logging import getLogger
 from threading import Thread
-from queue import Queue
+from queue import Empty, Queue
 import datetime
 
+from thingsboard_gateway.storage.block_compression import CODEC_NONE, compress_block, decode_records, \
+    decompress_block, encode_records
 from thingsboard_gateway.storage.sqlite.database_connector import DatabaseConnector
 from thingsboard_gateway.storage.sqlite.database_action_type import DatabaseActionType
 from thingsboard_gateway.storage.sqlite.storage_settings import StorageSettings
@@ -34,8 +36,13 @@ class Database(Thread):
         - reads from database
         - delete data older than specified in config
         ------------- ALL OF THIS IN AN ATOMIC WAY ---------
+        Queued writes and deletes are applied by this thread in batched transactions through the writer connection,
+        reads use a separate connection, so they don't wait for the writes.
     """
 
+    PROCESS_TIMEOUT = .2
+    MAX_WRITE_ATTEMPTS = 3
+
     def __init__(self, config, processing_queue: Queue):
         super().__init__()
         self.setDaemon(True)
@@ -47,8 +54,10 @@ class Database(Thread):
 
         # Pass settings to connector
         self.db = DatabaseConnector(self.settings)
+        self.reader_db = DatabaseConnector(self.settings)
 
         self.db.connect()
+        self.reader_db.connect()
 
         # process Queue
         self.processQueue = processing_queue
@@ -58,63 +67,171 @@ class Database(Thread):
         self.__last_msg_check = time()
 
         self.msg_counter = 0
+        self.lost_msg_counter = 0
+        # Requests of the failed transaction, they are applied again before the queued ones
+        self.__failed_requests = []
+        self.__failed_attempts = 0
+        self.init_table()
         self.start()
 
     def init_table(self):
         try:
-            self.db.execute('''CREATE TABLE IF NOT EXISTS messages (timestamp INTEGER, message TEXT); ''')
+            columns = [column[1] for column in self.db.execute('''PRAGMA table_info(messages);''')]
+            if columns and 'id' not in columns:
+                self.__migrate_legacy_table()
+            elif columns and 'codec' not in columns:
+                self.db.execute('''ALTER TABLE messages ADD COLUMN codec INTEGER;''')
+            # AUTOINCREMENT ids are never reused, so the id of the last read message is a reliable read cursor.
+            # A row keeps one message, or a block of compressed messages if the codec is set
+            self.db.execute('''CREATE TABLE IF NOT EXISTS messages
+                               (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL, message TEXT, codec INTEGER); ''')
             self.db.commit()
         except Exception as e:
             self.db.rollback()
             log.exception(e)
 
+    def __migrate_legacy_table(self):
+        log.info("Migrating messages to the table with the id column...")
+        self.db.execute('''BEGIN;''')
+        self.db.execute('''ALTER TABLE messages RENAME TO legacy_messages;''')
+        self.db.execute('''CREATE TABLE messages
+                           (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL, message TEXT, codec INTEGER); ''')
+        self.db.execute('''INSERT INTO messages (timestamp, message)
+                           SELECT timestamp, message FROM legacy_messages ORDER BY rowid ASC;''')
+        self.db.execute('''DROP TABLE legacy_messages;''')
+        self.db.commit()
+
     def run(self):
-        while True:
+        while not self.__stopped:
+            self.process(self.PROCESS_TIMEOUT)
+        # Requests queued before the stop are saved too
+        while not self.processQueue.empty() or self.__failed_requests:
             self.process()
 
-            sleep(.2)
-
-    def process(self):
+    def process(self, timeout=0):
+        requests = []
+        messages = []
         try:
             if time() - self.__last_msg_check >= self.settings.messages_ttl_check_in_hours:
                 self.__last_msg_check = time()
                 self.delete_data_lte(self.settings.messages_ttl_in_days)
+                self.db.commit()
 
-            # Signalization so that we can spam call process()
-            if not self.__stopped and self.processQueue:
-                while self.processQueue.qsize() > 0:
+            requests = self.__failed_requests or self.__get_requests(timeout)
+            self.__failed_requests = []
+            if not requests:
+                return
 
-                    req = self.processQueue.get()
+            delete_row_id = None
+            for req in requests:
+                log.debug("Processing %s" % req.type)
+                if req.type is DatabaseActionType.WRITE_DATA_STORAGE:
+                    messages.append(req.data)
+                elif req.type is DatabaseActionType.WRITE_DATA_STORAGE_BATCH:
+                    messages.extend(req.data)
+                elif req.type is DatabaseActionType.DELETE_DATA:
+                    delete_row_id = req.data if delete_row_id is None else max(delete_row_id, req.data)
 
-                    log.debug("Processing %s" % req.type)
-                    if req.type is DatabaseActionType.WRITE_DATA_STORAGE:
+            # All the requests are applied in one transaction
+            if messages and self.settings.compression_codec != CODEC_NONE:
+                timestamp = time()
+                self.db.executemany('''INSERT INTO messages (timestamp, message, codec) VALUES (?, ?, ?);''',
+                                    [(timestamp, block, codec) for (codec, block) in self.__compress(messages)])
+            elif messages:
+                timestamp = time()
+                self.db.executemany('''INSERT INTO messages (timestamp, message) VALUES (?, ?);''',
+                                    [(timestamp, message) for message in messages])
+            if delete_row_id is not None:
+                self.delete_data(delete_row_id)
+            self.db.commit()
+            self.msg_counter += len(messages)
+            self.__failed_attempts = 0
+        except Exception as e:
+            self.db.rollback()
+            log.exception(e)
+            self.__keep_failed_requests(requests, len(messages))
 
-                        message = req.data
+    def __keep_failed_requests(self, requests, messages_count):
+        self.__failed_attempts += 1
+        if self.__failed_attempts < self.MAX_WRITE_ATTEMPTS:
+            self.__failed_requests = requests
+            sleep(self.PROCESS_TIMEOUT)
+            return
+        if messages_count:
+            log.error("Failed to save %i message(s) to the database after %i attempts, they are lost.",
+                      messages_count, self.__failed_attempts)
+        self.lost_msg_counter += messages_count
+        self.__failed_attempts = 0
 
-                        timestamp = time()
+    def __compress(self, messages):
+        # Yields the codec and the data of the blocks of the configured size
+        block_size = self.settings.compression_block_size
+        start = 0
+        while start < len(messages):
+            end = start
+            size = 0
+            while end < len(messages) and size < block_size:
+                size += len(messages[end])
+                end += 1
+            yield compress_block(encode_records(messages[start:end]), self.settings.compression_codec)
+            start = end
 
-                        self.db.execute('''INSERT INTO messages (timestamp, message) VALUES (?, ?);''',
-                                        [timestamp, message])
+    def __get_requests(self, timeout):
+        # Takes the queued requests up to the batch size, waits for the first one up to the timeout
+        try:
+            req = self.processQueue.get(timeout=timeout) if timeout else self.processQueue.get_nowait()
+        except Empty:
+            return []
+        requests = [req]
+        rows_count = self.__get_rows_count(req)
+        while rows_count < self.settings.write_batch_size:
+            try:
+                req = self.processQueue.get_nowait()
+            except Empty:
+                break
+            requests.append(req)
+            rows_count += self.__get_rows_count(req)
+        return requests
 
-                        self.db.commit()
-            else:
-                log.error("Storage is closed!")
+    @staticmethod
+    def __get_rows_count(req):
+        return len(req.data) if req.type is DatabaseActionType.WRITE_DATA_STORAGE_BATCH else 1
 
+    def read_data(self, row_id=0):
+        # Returns the id of the last read row and the messages, the id is None if there are no rows after row_id
+        try:
+            rows = self.reader_db.execute('''SELECT id, message, codec FROM messages WHERE id > ? ORDER BY id ASC LIMIT ?;''',
+                                          [row_id, self.settings.read_records_count])
+            # Messages of a block are read together, so a block row is confirmed at once
+            last_row_id = None
+            messages = []
+            for (last_row_id, message, codec) in rows:
+                if codec is None:
+                    messages.append(message)
+                else:
+                    try:
+                        messages.extend(decode_records(decompress_block(codec, message)))
+                    except Exception as e:
+                        log.warning("Could not decompress messages block with id %i! %s", last_row_id, e)
+                if len(messages) >= self.settings.read_records_count:
+                    break
+            return last_row_id, messages
         except Exception as e:
-            self.db.rollback()
+            self.reader_db.rollback()
             log.exception(e)
+            return None, []
 
-    def read_data(self):
+    def get_rows_count_after(self, row_id):
         try:
-            data = self.db.execute('''SELECT timestamp, message FROM messages ORDER BY timestamp ASC LIMIT 0, 50;''')
-            return data
+            return self.reader_db.execute('''SELECT COUNT(*) FROM messages WHERE id > ?;''', [row_id]).fetchone()[0]
         except Exception as e:
-            self.db.rollback()
+            self.reader_db.rollback()
             log.exception(e)
+            return 0
 
-    def delete_data(self, ts):
+    def delete_data(self, row_id):
         try:
-            data = self.db.execute('''DELETE FROM messages WHERE timestamp <= ?;''', [ts,])
+            data = self.db.execute('''DELETE FROM messages WHERE id <= ?;''', [row_id,])
             return data
         except Exception as e:
             self.db.rollback()
@@ -123,7 +240,13 @@ class Database(Thread):
     def delete_data_lte(self, days):
         try:
             ts = (datetime.datetime.now() - datetime.timedelta(days=days)).timestamp()
-            data = self.db.execute('''DELETE FROM messages WHERE timestamp <= ? ;''', [ts])
+            # Messages are stored in the order of time, so the scan by id stops at the first message to keep
+            first_kept = self.db.execute('''SELECT id FROM messages WHERE timestamp > ? ORDER BY id ASC LIMIT 1;''',
+                                         [ts]).fetchone()
+            if first_kept is None:
+                data = self.db.execute('''DELETE FROM messages WHERE timestamp <= ? ;''', [ts])
+            else:
+                data = self.db.execute('''DELETE FROM messages WHERE id < ? ;''', [first_kept[0]])
             return data
         except Exception as e:
             self.db.rollback()
@@ -132,5 +255,12 @@ class Database(Thread):
     def setProcessQueue(self, process_queue):
         self.processQueue = process_queue
 
+    def stop(self):
+        self.__stopped = True
+        if self.is_alive():
+            self.join()
+        self.closeDB()
+
     def closeDB(self):
+        self.reader_db.close()
         self.db.close()
@@ -17,4 +17,6 @@ from enum import Enum, auto
 
 class DatabaseActionType(Enum):
     WRITE_DATA_STORAGE = auto()  # Writes do not require a response on the request
+    WRITE_DATA_STORAGE_BATCH = auto()  # Writes several messages in one transaction
+    DELETE_DATA = auto()  # Deletes the messages which were read and confirmed
 
@@ -28,6 +28,7 @@ log = getLogger("storage")
 class DatabaseConnector:
     def __init__(self, settings: StorageSettings):
         self.data_file_path = settings.data_folder_path
+        self.synchronous = settings.synchronous
         self.connection: Optional[Connection] = None
         self.lock = RLock()
 
@@ -37,20 +38,22 @@ class DatabaseConnector:
         """
         try:
             self.connection = connect(self.data_file_path, check_same_thread=False)
+            # In WAL mode the reader doesn't block the writer, and a commit doesn't rewrite the database pages
+            journal_mode = self.connection.execute('PRAGMA journal_mode=WAL;').fetchone()[0]
+            if journal_mode.lower() != 'wal':
+                log.warning("Failed to enable WAL mode for %s, %s journal mode is used.",
+                            self.data_file_path, journal_mode)
+            self.connection.execute('PRAGMA synchronous=%s;' % self.synchronous.upper())
         except Exception as e:
             log.exception(e)
 
     def commit(self):
         """
-        Commit changes
+        Commit changes, errors are raised, so the caller can roll back the transaction
         """
         log.debug("Committing changes to DB")
-        try:
-            with self.lock:
-                self.connection.commit()
-
-        except Exception as e:
-            log.exception(e)
+        with self.lock:
+            self.connection.commit()
 
     def execute(self, *args):
         """
@@ -65,6 +68,13 @@ class DatabaseConnector:
         except Exception as e:
             log.exception(e)
 
+    def executemany(self, *args):
+        """
+        Execute changes for the sequence of parameters, errors are raised, so the caller can roll back the transaction
+        """
+        with self.lock:
+            return self.connection.executemany(*args)
+
     def rollback(self):
         """
         Rollback changes after exception
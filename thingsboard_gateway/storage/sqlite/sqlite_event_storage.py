@@ -12,9 +12,11 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
+from threading import Lock
 from time import time
 
 from thingsboard_gateway.storage.event_storage import EventStorage
+from thingsboard_gateway.storage.read_event_packs import ReadEventPacks
 from thingsboard_gateway.storage.sqlite.database import Database
 from queue import Queue
 from thingsboard_gateway.storage.sqlite.database_request import DatabaseRequest
@@ -38,36 +40,47 @@ class SQLiteEventStorage(EventStorage):
         self.processQueue = Queue(-1)
         self.db = Database(config, self.processQueue)
         self.db.setProcessQueue(self.processQueue)
-        self.db.init_table()
         log.info("Sqlite storage initialized!")
-        self.delete_time_point = None
+        self.read_row_id = 0
+        self.read_event_packs = ReadEventPacks()
         self.last_read = time()
         self.stopped = False
+        self.__put_lock = Lock()
+        self.__put_messages_count = 0
 
     def get_event_pack(self):
         if not self.stopped:
-            data_from_storage = self.read_data()
-            try:                
-                event_pack_timestamps, event_pack_messages = zip(*([(item[0],item[1]) for item in data_from_storage]))
-            except ValueError as e:
+            event_pack_messages = self.read_event_packs.get_next()
+            if event_pack_messages is not None:
+                return event_pack_messages
+            last_row_id, event_pack_messages = self.read_data(self.read_row_id)
+            if last_row_id is None:
                 return []
-            self.delete_time_point = max(event_pack_timestamps)            
+            # Rows are read in the order of ids
+            self.read_row_id = last_row_id
+            if not event_pack_messages:
+                # Only broken rows were read, they are deleted with the next confirmed pack
+                return []
+            self.read_event_packs.append(event_pack_messages, self.read_row_id)
             return event_pack_messages
         else:
             return []
 
     def event_pack_processing_done(self):
         if not self.stopped:
-            self.delete_data(self.delete_time_point)
+            delete_row_id = self.read_event_packs.confirm_oldest()
+            if delete_row_id is not None:
+                self.delete_data(delete_row_id)
+
+    def rewind(self):
+        self.read_event_packs.rewind()
 
-    def read_data(self):
-        self.db.__stopped = True
-        data = self.db.read_data()
-        self.db.__stopped = False
-        return data
+    def read_data(self, row_id=0):
+        return self.db.read_data(row_id)
 
-    def delete_data(self, ts):
-        return self.db.delete_data(ts)
+    def delete_data(self, row_id):
+        # Rows are deleted by the database thread together with the queued writes
+        self.processQueue.put(DatabaseRequest(DatabaseActionType.DELETE_DATA, row_id))
 
     def put(self, message):
         try:
@@ -76,6 +89,22 @@ class SQLiteEventStorage(EventStorage):
                 request = DatabaseRequest(_type, message)
 
                 log.info("Sending data to storage")
+                self.__count_put_messages(1)
+                self.processQueue.put(request)
+                return True
+            else:
+                return False
+        except Exception as e:
+            log.exception(e)
+
+    def put_batch(self, messages):
+        try:
+            if not self.stopped:
+                _type = DatabaseActionType.WRITE_DATA_STORAGE_BATCH
+                request = DatabaseRequest(_type, list(messages))
+
+                log.info("Sending %i messages to storage", len(messages))
+                self.__count_put_messages(len(request.data))
                 self.processQueue.put(request)
                 return True
             else:
@@ -83,10 +112,25 @@ class SQLiteEventStorage(EventStorage):
         except Exception as e:
             log.exception(e)
 
+    def __count_put_messages(self, messages_count):
+        with self.__put_lock:
+            self.__put_messages_count += messages_count
+
+    def get_pending_events_count(self):
+        # Messages queued for the database thread are counted first, so a commit between the counts is not missed.
+        # A block of compressed messages is counted as one event
+        queued_messages_count = max(self.__put_messages_count - self.db.msg_counter - self.db.lost_msg_counter, 0)
+        return queued_messages_count + self.db.get_rows_count_after(self.read_row_id)
+
+    def get_pack_size(self):
+        return self.db.settings.read_records_count
+
+    def set_pack_size(self, events_count):
+        self.db.settings.read_records_count = events_count
+
     def stop(self):
         self.stopped = True
-        self.db.__stopped = True
-        self.db.closeDB()
+        self.db.stop()
 
     def len(self):
         return self.processQueue.qsize()
@@ -12,8 +12,25 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
+from logging import getLogger
+
+from thingsboard_gateway.storage.block_compression import COMPRESSION_NONE, get_codec
+
+log = getLogger("storage")
+
+SYNCHRONOUS_MODES = ("off", "normal", "full")
+
+
 class StorageSettings:
     def __init__(self, config):
         self.data_folder_path = config.get("data_file_path", "./")
         self.messages_ttl_check_in_hours = config.get('messages_ttl_check_in_hours', 1) * 3600
         self.messages_ttl_in_days = config.get('messages_ttl_in_days', 7)
+        self.read_records_count = config.get('read_records_count', 100)
+        self.write_batch_size = config.get('write_batch_size', 10000)
+        self.synchronous = config.get('synchronous', 'normal').lower()
+        if self.synchronous not in SYNCHRONOUS_MODES:
+            log.warning("Unknown synchronous mode %r, \"normal\" is used.", self.synchronous)
+            self.synchronous = "normal"
+        self.compression_codec = get_codec(config.get('compression', COMPRESSION_NONE))
+        self.compression_block_size = config.get('compression_block_size', 65536)
@@ -0,0 +1,189 @@
+#     Copyright 2023. ThingsBoard
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+from collections import deque
+from threading import Lock
+from time import monotonic
+
+from thingsboard_gateway.storage.event_storage import EventStorage, log
+from thingsboard_gateway.storage.file.file_event_storage import FileEventStorage
+from thingsboard_gateway.storage.memory.memory_event_storage import MemoryEventStorage
+from thingsboard_gateway.storage.sqlite.sqlite_event_storage import SQLiteEventStorage
+
+MEMORY_TIER = "memory"
+DISK_TIER = "disk"
+
+
+class TieredEventStorage(EventStorage):
+    """
+    Keeps events in the memory storage while ThingsBoard is connected and the memory storage has free space.
+    When the memory storage is full or the connection is lost, new events are spilled to the disk storage
+    until the disk storage is drained, so the events are always read in the order they were put:
+    the memory events first (they are older than the spilled ones) and then the disk events.
+    """
+
+    DISK_STORAGE_TYPES = {
+        "file": FileEventStorage,
+        "sqlite": SQLiteEventStorage,
+    }
+
+    def __init__(self, config):
+        self.__memory_capacity = config.get("max_records_count", 10000)
+        disk_type = config.get("disk_type", "file")
+        if disk_type not in self.DISK_STORAGE_TYPES:
+            log.warning("Unknown disk storage type %r, file storage is used.", disk_type)
+            disk_type = "file"
+        # Events are serialized for the disk, so the memory tier keeps them serialized too.
+        # Events which don't fit the memory tier are spilled, so they are never dropped by it
+        self.__memory = MemoryEventStorage({**config, "store_objects": False, "overflow_policy": "reject_new"})
+        self.__disk = self.DISK_STORAGE_TYPES[disk_type](config)
+        self.__lock = Lock()
+        self.__connected = False
+        # The disk may keep events from the previous run, so the storage starts with the disk tier
+        self.__spilling = True
+        self.__disk_events_count = 0
+        self.__disk_writes_count = 0
+        self.__disk_writes_count_on_empty_read = None
+        self.__read_packs_tiers = deque()
+        self.__next_pack_index = 0
+        self.__stopped = False
+
+        self.spilled_count = 0
+        self.drained_count = 0
+        self.__last_rates_check = (monotonic(), 0, 0)
+        log.info("Tiered storage created with memory capacity %i and %s disk storage.",
+                 self.__memory_capacity, disk_type)
+
+    def put(self, event):
+        return self.put_batch([event])
+
+    def put_batch(self, events):
+        if self.__stopped:
+            log.error("Storage is stopped!")
+            return False
+        with self.__lock:
+            if not self.__spilling:
+                if self.__connected and self.__memory.can_put(events):
+                    return self.__memory.put_batch(events)
+                log.info("Memory storage is full or ThingsBoard is disconnected, spilling events to the disk.")
+                self.__spilling = True
+            success = self.__disk.put_batch(events)
+            if success:
+                self.__disk_events_count += len(events)
+                self.__disk_writes_count += 1
+                self.spilled_count += len(events)
+            return success
+
+    def get_event_pack(self):
+        if self.__next_pack_index < len(self.__read_packs_tiers):
+            # Rewound packs are returned again by their tiers
+            tier = self.__read_packs_tiers[self.__next_pack_index]
+            self.__next_pack_index += 1
+            return self.__get_tier_storage(tier).get_event_pack()
+
+        if self.__memory.len():
+            return self.__append_read_pack(MEMORY_TIER, self.__memory.get_event_pack())
+        if not self.__spilling:
+            return []
+        events = self.__disk.get_event_pack()
+        if events:
+            self.__disk_events_count = max(self.__disk_events_count - len(events), 0)
+            self.drained_count += len(events)
+            return self.__append_read_pack(DISK_TIER, events)
+        self.__check_disk_drained()
+        return []
+
+    def __append_read_pack(self, tier, events):
+        if events:
+            self.__read_packs_tiers.append(tier)
+            self.__next_pack_index = len(self.__read_packs_tiers)
+        return events
+
+    def __check_disk_drained(self):
+        # The disk is drained when it had no events for two reads in a row without writes between them.
+        # Events which are not visible to the reader yet (a not filled compressed block or queued writes)
+        # are pending, so the disk is read until they are read too
+        if self.__disk.get_pending_events_count():
+            return
+        with self.__lock:
+            if self.__disk_writes_count_on_empty_read != self.__disk_writes_count:
+                self.__disk_writes_count_on_empty_read = self.__disk_writes_count
+                return
+            self.__disk_events_count = 0
+            if self.__connected:
+                log.info("Disk storage is drained, new events are kept in the memory.")
+                self.__spilling = False
+
+    def __get_tier_storage(self, tier):
+        return self.__memory if tier == MEMORY_TIER else self.__disk
+
+    def event_pack_processing_done(self):
+        if self.__read_packs_tiers:
+            tier = self.__read_packs_tiers.popleft()
+            self.__next_pack_index = max(self.__next_pack_index - 1, 0)
+            self.__get_tier_storage(tier).event_pack_processing_done()
+
+    def rewind(self):
+        self.__next_pack_index = 0
+        self.__memory.rewind()
+        self.__disk.rewind()
+
+    def set_connected(self, connected):
+        with self.__lock:
+            self.__connected = connected
+            if not connected and not self.__spilling:
+                log.info("ThingsBoard is disconnected, spilling events to the disk.")
+                self.__spilling = True
+
+    def is_full(self):
+        return self.__disk.is_full()
+
+    def get_pack_size(self):
+        return self.__memory.get_pack_size()
+
+    def set_pack_size(self, events_count):
+        self.__memory.set_pack_size(events_count)
+        self.__disk.set_pack_size(events_count)
+
+    def get_pending_events_count(self):
+        return self.__memory.get_pending_events_count() + self.__disk.get_pending_events_count()
+
+    def get_devices_oldest_pending_age(self):
+        # Only the memory tier tracks the devices of the events
+        return self.__memory.get_devices_oldest_pending_age()
+
+    def get_statistics(self):
+        now = monotonic()
+        (last_check, last_spilled_count, last_drained_count) = self.__last_rates_check
+        self.__last_rates_check = (now, self.spilled_count, self.drained_count)
+        elapsed = max(now - last_check, 1e-9)
+        statistics = {
+            "storageSpilling": self.__spilling,
+            "storageMemoryTierEvents": self.__memory.len(),
+            "storageDiskTierEvents": self.__disk_events_count,
+            "storageSpillRate": round((self.spilled_count - last_spilled_count) / elapsed, 2),
+            "storageDiskDrainRate": round((self.drained_count - last_drained_count) / elapsed, 2),
+        }
+        devices_ages = self.__memory.get_devices_oldest_pending_age()
+        if devices_ages:
+            statistics["storageOldestPendingAgeMs"] = max(devices_ages.values())
+        return statistics
+
+    def stop(self):
+        self.__stopped = True
+        self.__memory.stop()
+        self.__disk.stop()
+
+    def len(self):
+        return self.__memory.len() + self.__disk_events_count
@@ -21,6 +21,7 @@ from packaging import version
 from regex import fullmatch
 from simplejson import dumps, load
 
+from thingsboard_gateway.gateway.metrics import DEFAULT_SIZE_SAMPLING_PERIOD
 from thingsboard_gateway.gateway.tb_client import TBClient
 from thingsboard_gateway.tb_utility.tb_handler import TBLoggerHandler
 
@@ -183,6 +184,8 @@ class RemoteConfigurator:
                 'statistics': {
                     'enable': self.general_configuration['statistics']['enable'],
                     'statsSendPeriodInSeconds': self.general_configuration['statistics']['statsSendPeriodInSeconds'],
+                    'sizeSamplingPeriod': self.general_configuration['statistics'].get('sizeSamplingPeriod',
+                                                                                      DEFAULT_SIZE_SAMPLING_PERIOD),
                     'configuration': self.general_configuration['statistics'].get('configuration'),
                     'commands': commands
                 }
@@ -273,9 +276,8 @@ class RemoteConfigurator:
         5. Updating other params (regardless of whether they have changed):
             a. maxPayloadSizeBytes;
             b. minPackSendDelayMS;
-            c. minPackSizeToSend;
-            d. checkConnectorsConfigurationInSeconds;
-            f. handleDeviceRenaming.
+            c. checkConnectorsConfigurationInSeconds;
+            d. handleDeviceRenaming.
 
         If config from steps 1-4 changed:
         True -> applying new config with related objects creating (old objects will remove).
@@ -287,7 +289,8 @@ class RemoteConfigurator:
         if config['host'] != self.general_configuration['host'] or config['port'] != self.general_configuration[
             'port'] or config['security'] != self.general_configuration['security'] or config.get('provisioning',
                                                                                                   {}) != self.general_configuration.get(
-            'provisioning', {}) or config['qos'] != self.general_configuration['qos']:
+            'provisioning', {}) or config['qos'] != self.general_configuration['qos'] or config.get(
+            'payloadType', 'json') != self.general_configuration.get('payloadType', 'json'):
             LOG.info('---- Connection configuration changed. Processing...')
             success = self._apply_connection_config(config)
             if not success:
@@ -623,7 +626,8 @@ class RemoteConfigurator:
     def _check_statistics_configuration_changes(self, config):
         general_statistics_config = self.general_configuration.get('statistics', self.DEFAULT_STATISTICS)
         if config['enable'] != general_statistics_config['enable'] or config['statsSendPeriodInSeconds'] != \
-                general_statistics_config['statsSendPeriodInSeconds']:
+                general_statistics_config['statsSendPeriodInSeconds'] or config.get('sizeSamplingPeriod', DEFAULT_SIZE_SAMPLING_PERIOD) != \
+                general_statistics_config.get('sizeSamplingPeriod', DEFAULT_SIZE_SAMPLING_PERIOD):
             return True
 
         commands = []